@@ -6,6 +6,7 @@ import pandas as pd
 import logging
 import signal
 import atexit
+import multiprocessing
 from threading import Thread, Event
 from typing import Dict, Any, Optional
 from PyQt5.QtWidgets import QApplication
@@ -18,8 +19,25 @@ from src.gui.main_window import MainWindow
 from src.gui.system_tray import SystemMonitorTray
 from src.monitors.system_monitor import SystemMonitor
 from src.monitors.process_monitor import ProcessMonitor
-from src.database.db import preprocess_data
-from src.anomaly.detect import detect_anomalies
+from src.monitors.rules import rules_from_config
+from src.monitors.forecast import forecaster_from_config
+from src.monitors.process_usage import process_usage_from_config
+from src.monitors.flight_recorder import flight_recorder_from_config
+from src.monitors.alerts import alerts_from_config
+from src.assistant.executor import register_query
+from src.database.db import preprocess_data, FEATURE_COLUMNS
+from src.database.store import MetricsStore, resolve_db_path
+from src.database.backup import backup_manager_from_config
+from src.anomaly.detect import StreamingDetector, model_registry
+from src.anomaly.prefilter import prefilter_from_config
+from src.anomaly.severity import SEVERITY_LEVELS, thresholds_for_host
+from src.anomaly.incidents import IncidentTracker
+from src.anomaly.baselines import baseline_from_config
+from src.anomaly.drift import drift_from_config
+from src.anomaly.correlation import correlation_from_config
+from src.anomaly.ensemble import ensemble_from_config
+from src.anomaly.sketches import sketches_from_config, thresholds_from_config
+from src.anomaly.retrain import RetrainScheduler
 
 # Configure logging
 logging.basicConfig(
@@ -98,13 +116,17 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
     # Add these signals for thread-safe GUI communication
     metrics_updated = pyqtSignal(dict)
     processes_updated = pyqtSignal(list)
+    process_flags_updated = pyqtSignal(list)
     anomalies_updated = pyqtSignal(list)
+    rule_events = pyqtSignal(list)
+    drift_detected = pyqtSignal(dict)
     
     def __init__(self):
         super().__init__()  # Initialize QObject parent
         """Initialize the VitalWatch application."""
         self.config = load_config()
         self.stopping_event = Event()
+        self.cleaned_up = False
         self.threads = []
         self.app: Optional[QApplication] = None
         self.main_window: Optional[MainWindow] = None
@@ -118,6 +140,62 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
         # Ensure directory exists
         os.makedirs(self.alert_dir, exist_ok=True)
         
+        # Metrics store and its incremental backup job
+        self.store = MetricsStore(resolve_db_path(self.config['database']['url'], self.alert_dir))
+        self.backup_manager = backup_manager_from_config(self.config, self.alert_dir)
+        
+        # Per-sample anomaly scoring on an in-memory window, judged against
+        # the usual behaviour for the current hour of the week
+        self.baseline = baseline_from_config(self.config, self.store)
+        # Live model inputs compared with the current model's training data
+        self.drift = drift_from_config(self.config, self.store)
+        # Member forests and statistical detectors voting with the main forest
+        self.ensemble = ensemble_from_config(self.config, model_registry.flat_path)
+        self.detector = StreamingDetector(
+            self.config['anomaly']['window_size'],
+            thresholds=thresholds_for_host(self.config),
+            prefilter=prefilter_from_config(self.config, len(FEATURE_COLUMNS)),
+            baseline=self.baseline,
+            seasonal_k=self.config['anomaly']['baselines'].get('k', 4.0),
+            drift=self.drift,
+            ensemble=self.ensemble
+        )
+        # Per-metric quantile sketches behind the adaptive alert thresholds
+        self.sketches = sketches_from_config(self.config)
+        if self.sketches is not None:
+            self.sketches.load(self.store)
+        self.thresholds = thresholds_from_config(self.config, self.sketches)
+        # Threshold rules checked against every sample
+        self.rules = rules_from_config(self.config)
+        # Disk, memory and swap growth trends with time-to-threshold projections
+        self.forecaster = forecaster_from_config(self.config)
+        if self.forecaster is not None:
+            self.forecaster.load(self.store)
+        # Heaviest processes by CPU time, IO and peak RSS over trailing windows
+        self.process_usage = process_usage_from_config(self.config)
+        if self.process_usage is not None:
+            self.process_usage.load(self.store)
+            register_query('top_processes', self.process_usage.describe)
+        # Windowed cross-metric correlations, reported with incidents as root-cause hints
+        self.correlation = correlation_from_config(self.config)
+        # Last few minutes at full resolution, written out when an incident opens
+        self.flight_recorder = flight_recorder_from_config(self.config, self.alert_dir)
+        
+        self.incidents = IncidentTracker(self.store, self.config['anomaly']['incidents']['merge_gap'])
+        # Email and Slack delivery through a persistent outbox, off the collection thread
+        self.alerts = alerts_from_config(self.config, self.store)
+        self.retrainer = RetrainScheduler(self.config, self.store.path, model_registry)
+        if self.drift is not None:
+            action = self.config['anomaly']['drift'].get('action', 'retrain')
+            if action in ('retrain', 'both'):
+                self.drift.on_drift.append(
+                    lambda report: self.retrainer.request(f"drift on {report['worst']['feature']}")
+                )
+            if action in ('notify', 'both'):
+                self.drift.on_drift.append(self.drift_detected.emit)
+            if self.alerts is not None:
+                self.drift.on_drift.append(self.alerts.drift)
+        
         # Register cleanup handlers
         atexit.register(self.cleanup)
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -130,7 +208,7 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
     
     def data_collection_task(self) -> None:
         system_monitor = SystemMonitor()
-        process_monitor = ProcessMonitor()
+        process_monitor = ProcessMonitor(usage=self.process_usage)
         logger.info("Combined monitoring task started")
         
         while not self.stopping_event.is_set():
@@ -138,8 +216,65 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
                 # Collect system metrics
                 metrics = system_monitor.collect_metrics()
                 
-                # Emit signal for GUI update immediately
+                # Score the sample right away so its anomaly score ships with the snapshot
+                changed_incidents = []
+                try:
+                    metrics['anomaly'] = self.detector.update(metrics)
+                    if self.drift is not None:
+                        metrics['drift'] = self.drift.summary()
+                    prefilter_stats = self.detector.prefilter_stats()
+                    if prefilter_stats is not None:
+                        metrics['prefilter'] = prefilter_stats
+                    if self.correlation is not None:
+                        self.correlation.update(metrics)
+                    anomaly = metrics['anomaly']
+                    if anomaly['severity'] is not None:
+                        level = SEVERITY_LEVELS.index(anomaly['severity'])
+                        comovements = None
+                        if level > 0 and self.correlation is not None:
+                            comovements = self.correlation.comovements()
+                        changed_incidents = self.incidents.observe(
+                            metrics['timestamp'].timestamp(), anomaly['score'],
+                            level, anomaly['contributors'], comovements
+                        )
+                except Exception as e:
+                    logger.error(f"Anomaly scoring failed: {e}")
+                    metrics['anomaly'] = None
+                
+                if self.flight_recorder is not None:
+                    self.flight_recorder.record(metrics)
+                    for incident in changed_incidents:
+                        if incident['status'] == 'open':
+                            self.flight_recorder.dump(incident)
+                
+                if self.sketches is not None:
+                    self.sketches.update(metrics)
+                    metrics['thresholds'] = self.thresholds.all()
+                
+                if self.forecaster is not None:
+                    self.forecaster.update(metrics)
+                    metrics['forecast'] = self.forecaster.forecasts()
+                
+                rule_events = []
+                if self.rules is not None:
+                    try:
+                        rule_events = self.rules.evaluate(metrics)
+                        metrics['rules'] = self.rules.firing_rules()
+                    except Exception as e:
+                        logger.error(f"Rule evaluation failed: {e}")
+                
+                # Emit signal for GUI update immediately; incidents only when they changed
                 self.metrics_updated.emit(metrics)
+                if changed_incidents:
+                    self.anomalies_updated.emit(changed_incidents)
+                if rule_events:
+                    self.rule_events.emit(rule_events)
+                if self.alerts is not None:
+                    self.alerts.incidents(changed_incidents)
+                    self.alerts.rule_events(rule_events)
+                
+                # Persist every sample; WAL inserts are cheap and never wait on readers
+                self.store.insert_metrics(metrics)
                 
                 # Do CSV operations less frequently to avoid blocking
                 if not hasattr(self, '_csv_counter'):
@@ -154,6 +289,11 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
                 if self._csv_counter % 4 == 0:
                     processes = process_monitor.monitor_processes()
                     self.processes_updated.emit(processes)
+                    self.process_flags_updated.emit(process_monitor.flagged_processes())
+                    if self.flight_recorder is not None:
+                        self.flight_recorder.record_processes(time.time(), processes)
+                    if self.correlation is not None:
+                        self.correlation.update_processes(time.time(), processes)
                 
                 if self.stopping_event.wait(timeout=self.config['monitoring']['interval']):
                     break
@@ -193,54 +333,64 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
         except Exception as e:
             logger.error(f"Background CSV operations error: {e}")
     
-    def anomaly_detection_task(self) -> None:
-        iteration_count = 0
-        logger.info("Anomaly detection task started")
-        
-        while not self.stopping_event.is_set():
-            try:
-                iteration_count += 1
-                if iteration_count >= self.threshold_step:
-                    logger.info("Executing anomaly detection cycle")
-                    
-                    # Use QTimer.singleShot for non-blocking execution
-                    from PyQt5.QtCore import QTimer
-                    QTimer.singleShot(0, self._run_anomaly_detection_async)
-                    iteration_count = 0
-                
-                if self.stopping_event.wait(timeout=self.config['monitoring']['interval']):
-                    break
-                    
-            except Exception as e:
-                logger.error(f"Anomaly detection failed: {e}")
-                if self.stopping_event.wait(timeout=self.config['monitoring']['interval']):
-                    break
-
-    def _run_anomaly_detection_async(self):
-        """Run anomaly detection without blocking"""
-        try:
-            import concurrent.futures
-            
-            # Run detection in thread pool to avoid blocking
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(detect_anomalies, self.output_csv, self.threshold_step)
-                anomalies = future.result(timeout=10)  # 10 second timeout
-                
-                # Process results
-                if anomalies is not None and hasattr(anomalies, 'empty') and not anomalies.empty:
-                    self.anomalies_updated.emit(anomalies.to_dict('records'))
-                else:
-                    self.anomalies_updated.emit([])
-                    
-        except Exception as e:
-            logger.error(f"Async anomaly detection error: {e}")
-            self.anomalies_updated.emit([])
+    def backup_task(self) -> None:
+        """Periodically back up the metrics store."""
+        self.backup_manager.run_forever(self.stopping_event)
+    
+    def retraining_task(self) -> None:
+        """Periodically retrain the anomaly model in a worker process."""
+        self.retrainer.run_forever(self.stopping_event)
+    
+    def baseline_task(self) -> None:
+        """Catch the seasonal baseline up on stored history, then persist it periodically."""
+        if self.baseline is not None:
+            self.baseline.run_forever(
+                self.store, self.stopping_event, self.started_at,
+                self.config['anomaly']['baselines'].get('persist_interval', 300)
+            )
+    
+    def sketch_task(self) -> None:
+        """Persist the metric sketches periodically."""
+        if self.sketches is not None:
+            self.sketches.run_forever(
+                self.store, self.stopping_event,
+                self.config['monitoring']['adaptive_thresholds'].get('persist_interval', 300)
+            )
+    
+    def forecast_task(self) -> None:
+        """Persist the capacity trends periodically."""
+        if self.forecaster is not None:
+            self.forecaster.run_forever(
+                self.store, self.stopping_event,
+                self.config['monitoring']['forecast'].get('persist_interval', 300)
+            )
+    
+    def process_usage_task(self) -> None:
+        """Persist the process usage summaries periodically."""
+        if self.process_usage is not None:
+            self.process_usage.run_forever(
+                self.store, self.stopping_event,
+                self.config['monitoring']['process']['usage'].get('persist_interval', 300)
+            )
+    
+    def alert_task(self) -> None:
+        """Deliver queued alerts on every configured channel."""
+        if self.alerts is not None:
+            self.alerts.run_forever(self.stopping_event)
     
     def start_background_tasks(self) -> None:
         """Start all background monitoring tasks."""
+        # Samples from here on reach the baseline live; older ones via catch-up
+        self.started_at = time.time()
         tasks = [
             ("combined_monitoring", self.data_collection_task),
-            ("anomaly_detection", self.anomaly_detection_task)
+            ("database_backup", self.backup_task),
+            ("model_retraining", self.retraining_task),
+            ("seasonal_baseline", self.baseline_task),
+            ("metric_sketches", self.sketch_task),
+            ("capacity_forecast", self.forecast_task),
+            ("process_usage", self.process_usage_task),
+            ("alert_dispatch", self.alert_task)
         ]
         
         for name, target in tasks:
@@ -262,17 +412,24 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
             self.app.setWindowIcon(QIcon(icon_path))
         
         # Setup main window
-        self.main_window = MainWindow()
+        self.main_window = MainWindow(self.incidents)
+        self.main_window.process_usage = self.process_usage
+        self.main_window.ensemble = self.ensemble
         self.main_window.show()
         
         # Connect signals to main window slots with thread-safe connections
         self.metrics_updated.connect(self.main_window.update_metrics, Qt.QueuedConnection)
         self.processes_updated.connect(self.main_window.update_process_table, Qt.QueuedConnection)
+        self.process_flags_updated.connect(self.main_window.update_process_flags, Qt.QueuedConnection)
         if hasattr(self.main_window, 'update_anomaly_table'):
             self.anomalies_updated.connect(self.main_window.update_anomaly_table, Qt.QueuedConnection)
         else:
             logger.error("MainWindow does not have update_anomaly_table method")
         
+        # Rule firings surface as tray notifications, handled on the GUI thread
+        self.rule_events.connect(self.notify_rule_events, Qt.QueuedConnection)
+        self.drift_detected.connect(self.notify_drift, Qt.QueuedConnection)
+        
         # Connect main window close event to our handler
         self.main_window.app_close_requested = self.handle_window_close
         
@@ -297,6 +454,23 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
             # Complete shutdown
             self.stop()
 
+    def notify_rule_events(self, events: list) -> None:
+        """Show a tray notification for each rule that started firing."""
+        for event in events:
+            logger.info(f"Rule {event['name']} {event['state']}: {event['expr']} {event['values']}")
+            if event['state'] == 'firing' and self.tray:
+                self.tray.show_notification(f"VitalWatch: {event['name']}", event['expr'], 5000)
+
+    def notify_drift(self, report: dict) -> None:
+        """Tell the user the model no longer matches recent behaviour."""
+        if self.tray:
+            self.tray.show_notification(
+                "VitalWatch: model drift",
+                f"Recent {report['worst']['feature']} values differ from the model's training data; "
+                "consider retraining.",
+                5000
+            )
+
     def show_from_tray(self) -> None:
         """Show main window from system tray"""
         if self.main_window:
@@ -316,6 +490,12 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
             # Start background tasks
             self.start_background_tasks()
             
+            # Load the anomaly model once the event loop is running so the
+            # window appears first; the registry then watches it for updates
+            QTimer.singleShot(0, lambda: model_registry.start(
+                self.stopping_event, self.config['anomaly']['model_poll_interval']
+            ))
+            
             # Run the Qt event loop
             exit_code = self.app.exec_()
             
@@ -338,11 +518,16 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
     
     def cleanup(self) -> None:
         """Cleanup resources and wait for threads to finish."""
-        if self.stopping_event.is_set():
-            return  # Already cleaning up
-        
+        # stop() sets stopping_event before the event loop returns here, so track cleanup separately
+        if self.cleaned_up:
+            return
+        self.cleaned_up = True
         self.stopping_event.set()
         
+        prefilter_stats = self.detector.prefilter_stats()
+        if prefilter_stats:
+            logger.info(f"Anomaly pre-filter stats: {prefilter_stats}")
+        
         # Wait for all threads to finish
         for thread in self.threads:
             if thread.is_alive():
@@ -350,6 +535,9 @@ class VitalWatchApp(QObject):  # Inherit from QObject to use signals
                 if thread.is_alive():
                     logger.warning(f"Thread {thread.name} did not stop gracefully")
         
+        if self.ensemble is not None:
+            self.ensemble.shutdown()
+        
         logger.info("Cleanup completed")
 
 def main() -> int:
@@ -358,4 +546,6 @@ def main() -> int:
     return app.run()
 
 if __name__ == '__main__':
+    # Needed for the spawned retraining worker in frozen builds
+    multiprocessing.freeze_support()
     sys.exit(main())
@@ -0,0 +1,280 @@
+import io
+import logging
+import threading
+import time
+from datetime import datetime
+from threading import Event
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from src.database.db import FEATURE_COLUMNS
+from src.database.store import MetricsStore
+from src.anomaly.severity import SEVERITY_LEVELS
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+
+# Distinct weeks are tracked as a bitmask over the most recent WEEK_BITS weeks
+WEEK_BITS = 64
+
+# Log-spaced histogram bins from 1e-2 to 1e12: about 13% wide, which covers
+# percentages, frequencies, byte counts and speeds with one layout. Bin 0
+# collects zero and anything below the range.
+LOG_MIN, LOG_MAX = -2.0, 12.0
+BINS = 256
+BINS_PER_DECADE = (BINS - 1) / (LOG_MAX - LOG_MIN)
+BIN_EDGES = np.concatenate([[0.0], 10.0 ** (LOG_MIN + np.arange(BINS) / BINS_PER_DECADE)])
+
+STATE_NAME = 'baselines'
+
+
+def hour_of_week(timestamps: np.ndarray, utc_offset: float) -> np.ndarray:
+    """Local hour of the week, 0 being Monday 00:00-01:00."""
+    hours = (np.asarray(timestamps, dtype=np.float64) + utc_offset) // 3600
+    # The epoch fell on a Thursday, 72 hours into its week
+    return ((hours + 72) % HOURS_PER_WEEK).astype(np.int64)
+
+
+def week_index(timestamps: np.ndarray, utc_offset: float) -> np.ndarray:
+    """Local week number since the epoch's week, weeks starting on Monday."""
+    hours = (np.asarray(timestamps, dtype=np.float64) + utc_offset) // 3600
+    return ((hours + 72) // HOURS_PER_WEEK).astype(np.int64)
+
+
+def histogram_bins(X: np.ndarray) -> np.ndarray:
+    """Histogram bin of every value, computed directly from its logarithm."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        position = (np.log10(X) - LOG_MIN) * BINS_PER_DECADE + 1
+    return np.clip(np.nan_to_num(position, nan=0.0, neginf=0.0), 0, BINS - 1).astype(np.int64)
+
+
+class SeasonalBaseline:
+    """
+    Per hour-of-week statistics for every feature.
+
+    Each of the 168 buckets keeps a running count, mean and sum of squared
+    deviations (merged with Chan's parallel formula, so a chunk of history
+    and a single live sample use the same update) and a fixed log-spaced
+    histogram for quantiles. Looking up the bucket for a sample is pure
+    arithmetic on its timestamp, so scoring and updating cost O(1) per
+    sample whatever the history length.
+
+    A bucket is trusted once it holds ``min_samples`` samples from at least
+    ``min_weeks`` distinct weeks, so a long anomaly in the first week cannot
+    become the usual behaviour of its hour. Each bucket marks the weeks it
+    has seen in a bitmask over the last WEEK_BITS weeks.
+    """
+
+    def __init__(self, n_features: int = len(FEATURE_COLUMNS), min_samples: int = 120, min_weeks: int = 3):
+        self.n_features = n_features
+        self.min_samples = min_samples
+        self.min_weeks = min(min_weeks, WEEK_BITS)
+        self.count = np.zeros(HOURS_PER_WEEK, dtype=np.int64)
+        self.week_mask = np.zeros(HOURS_PER_WEEK, dtype=np.uint64)
+        self.newest_week = np.full(HOURS_PER_WEEK, -1, dtype=np.int64)
+        self.mean = np.zeros((HOURS_PER_WEEK, n_features))
+        self.m2 = np.zeros((HOURS_PER_WEEK, n_features))
+        self.histogram = np.zeros((HOURS_PER_WEEK, n_features, BINS), dtype=np.int32)
+        self.watermark = 0.0
+        # Watermark at load time: history after it still has to be caught up
+        self.resume_from = 0.0
+        self.utc_offset = datetime.now().astimezone().utcoffset().total_seconds()
+        self._lock = threading.Lock()
+
+    def _mark_week(self, bucket: int, week: int) -> None:
+        """Record that ``bucket`` has data from ``week``; caller holds the lock."""
+        newest = int(self.newest_week[bucket])
+        if week > newest:
+            if newest < 0 or week - newest >= WEEK_BITS:
+                self.week_mask[bucket] = 0
+            else:
+                for stale in range(newest + 1, week + 1):
+                    self.week_mask[bucket] &= ~np.uint64(1 << (stale % WEEK_BITS))
+            self.newest_week[bucket] = newest = week
+        if week > newest - WEEK_BITS:
+            self.week_mask[bucket] |= np.uint64(1 << (week % WEEK_BITS))
+
+    def weeks(self, bucket: int) -> int:
+        """Distinct weeks of data in a bucket, within the last WEEK_BITS weeks."""
+        return bin(int(self.week_mask[bucket])).count('1')
+
+    def update(self, timestamps: np.ndarray, X: np.ndarray) -> None:
+        """
+        Fold a batch of samples into their buckets.
+
+        Args:
+            timestamps: Epoch seconds, one per row
+            X: Raw feature rows in FEATURE_COLUMNS order
+        """
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=np.float64))
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        if len(X) == 0:
+            return
+        buckets = hour_of_week(timestamps, self.utc_offset)
+        weeks = week_index(timestamps, self.utc_offset)
+
+        if len(X) == 1:
+            # Live samples: plain Welford update of a single bucket
+            bucket, x = buckets[0], X[0]
+            with self._lock:
+                self.count[bucket] += 1
+                delta = x - self.mean[bucket]
+                self.mean[bucket] += delta / self.count[bucket]
+                self.m2[bucket] += delta * (x - self.mean[bucket])
+                self.histogram[bucket, np.arange(self.n_features), histogram_bins(x)] += 1
+                self._mark_week(int(bucket), int(weeks[0]))
+                self.watermark = max(self.watermark, float(timestamps[0]))
+            return
+
+        # Per-bucket count, mean and M2 of the batch
+        n_batch = np.bincount(buckets, minlength=HOURS_PER_WEEK)
+        seen = np.flatnonzero(n_batch)
+        n_b = n_batch[seen].astype(np.float64)[:, None]
+        sums = np.zeros((HOURS_PER_WEEK, self.n_features))
+        np.add.at(sums, buckets, X)
+        mean_b = sums[seen] / n_b
+        m2_batch = np.zeros((HOURS_PER_WEEK, self.n_features))
+        np.add.at(m2_batch, buckets, (X - (sums / np.maximum(n_batch, 1)[:, None])[buckets]) ** 2)
+
+        with self._lock:
+            n_a = self.count[seen].astype(np.float64)[:, None]
+            total = n_a + n_b
+            delta = mean_b - self.mean[seen]
+            self.mean[seen] += delta * n_b / total
+            self.m2[seen] += m2_batch[seen] + delta ** 2 * n_a * n_b / total
+            self.count[seen] += n_batch[seen]
+            np.add.at(self.histogram, (buckets[:, None], np.arange(self.n_features), histogram_bins(X)), 1)
+            for bucket, week in np.unique(np.column_stack([buckets, weeks]), axis=0):
+                self._mark_week(int(bucket), int(week))
+            self.watermark = max(self.watermark, float(timestamps.max()))
+
+    def zscores(self, timestamp: float, x: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Deviation of one sample from its hour-of-week bucket, per feature.
+
+        Returns:
+            Z-scores, or None while the bucket has fewer than ``min_samples``
+            or covers fewer than ``min_weeks`` weeks
+        """
+        bucket = int(hour_of_week(timestamp, self.utc_offset))
+        count = self.count[bucket]
+        if count < self.min_samples or self.weeks(bucket) < self.min_weeks:
+            return None
+        std = np.sqrt(self.m2[bucket] / count)
+        # Constant features compare against a tiny floor rather than zero
+        return (np.asarray(x, dtype=np.float64) - self.mean[bucket]) / np.maximum(std, 1e-9)
+
+    def quantile(self, timestamp: float, q: float) -> Optional[np.ndarray]:
+        """
+        Approximate ``q`` quantile of every feature in the bucket for ``timestamp``.
+
+        Returns:
+            Upper edge of the histogram bin holding the quantile, per
+            feature, or None while the bucket is empty
+        """
+        bucket = int(hour_of_week(timestamp, self.utc_offset))
+        if self.count[bucket] == 0:
+            return None
+        cumulative = np.cumsum(self.histogram[bucket], axis=1)
+        index = (cumulative < q * cumulative[:, -1:]).sum(axis=1)
+        return BIN_EDGES[np.minimum(index + 1, BINS)]
+
+    def catch_up(self, store: MetricsStore, end: Optional[float] = None,
+                 chunk_size: int = 10000, stop_event: Optional[Event] = None) -> int:
+        """
+        Fold in stored metrics newer than the watermark the baseline was loaded with.
+
+        Rows the live detector graded above normal are left out, as they are live.
+
+        Args:
+            store: Metrics store to read from
+            end: Exclusive upper bound, e.g. the time live updates started
+            chunk_size: Rows per query
+            stop_event: Optional event that aborts between chunks
+
+        Returns:
+            Number of rows added
+        """
+        added = 0
+        start = self.resume_from + 1e-6 if self.resume_from else None
+        columns = FEATURE_COLUMNS + ['severity']
+        for rows in store.iter_chunks(start=start, end=end, columns=columns, chunk_size=chunk_size):
+            if stop_event is not None and stop_event.is_set():
+                break
+            # Rows stored before severity existed are NULL and count as normal
+            normal = [row[:-1] for row in rows if row[-1] in (None, SEVERITY_LEVELS[0])]
+            if not normal:
+                continue
+            values = np.array(normal, dtype=np.float64)
+            self.update(values[:, 0], np.nan_to_num(values[:, 1:]))
+            added += len(values)
+        return added
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        with self._lock:
+            np.savez_compressed(
+                buffer, count=self.count, mean=self.mean, m2=self.m2,
+                histogram=self.histogram, watermark=self.watermark, bins=BINS,
+                week_mask=self.week_mask, newest_week=self.newest_week
+            )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, min_samples: int = 120, min_weeks: int = 3) -> 'SeasonalBaseline':
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            if int(arrays['bins']) != BINS:
+                raise ValueError("Baseline was saved with a different histogram layout")
+            baseline = cls(arrays['mean'].shape[1], min_samples, min_weeks)
+            baseline.count = arrays['count']
+            baseline.mean = arrays['mean']
+            baseline.m2 = arrays['m2']
+            baseline.histogram = arrays['histogram']
+            # Baselines saved before weeks were tracked earn their weeks from here on
+            if 'week_mask' in arrays.files:
+                baseline.week_mask = arrays['week_mask']
+                baseline.newest_week = arrays['newest_week']
+            baseline.watermark = float(arrays['watermark'])
+            baseline.resume_from = baseline.watermark
+        return baseline
+
+    def save(self, store: MetricsStore) -> None:
+        store.save_state(STATE_NAME, self.to_bytes())
+
+    @classmethod
+    def load(cls, store: MetricsStore, min_samples: int = 120, min_weeks: int = 3) -> 'SeasonalBaseline':
+        """Load the persisted baseline, or start an empty one."""
+        data = store.load_state(STATE_NAME)
+        if data is not None:
+            try:
+                return cls.from_bytes(data, min_samples, min_weeks)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Discarding unreadable baseline: {e}")
+        return cls(min_samples=min_samples, min_weeks=min_weeks)
+
+    def run_forever(self, store: MetricsStore, stop_event: Event, live_since: float,
+                    persist_interval: float = 300) -> None:
+        """
+        Catch up on history recorded before ``live_since``, then persist
+        every ``persist_interval`` seconds until ``stop_event`` is set.
+        """
+        started = time.monotonic()
+        added = self.catch_up(store, end=live_since, stop_event=stop_event)
+        if stop_event.is_set():
+            # Saving now would move the watermark past history never folded in
+            return
+        logger.info(f"Seasonal baseline caught up on {added} samples in {time.monotonic() - started:.1f}s")
+        while not stop_event.wait(timeout=persist_interval):
+            self.save(store)
+        self.save(store)
+
+
+def baseline_from_config(config: Dict[str, Any], store: MetricsStore) -> Optional[SeasonalBaseline]:
+    """Load the baseline described by the `anomaly.baselines` config section, or None if disabled."""
+    baseline_config = config.get('anomaly', {}).get('baselines') or {}
+    if not baseline_config.get('enabled', False):
+        return None
+    return SeasonalBaseline.load(store, baseline_config.get('min_samples', 120),
+                                 baseline_config.get('min_weeks', 3))
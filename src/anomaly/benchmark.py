@@ -0,0 +1,401 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import yaml
+
+from src.database.db import FEATURE_COLUMNS
+from src.anomaly.detect import get_resource_path
+from src.anomaly.ensemble import EnsembleScorer, ensemble_from_config, ensemble_members, train_members
+from src.anomaly.features import pipeline_from_config
+from src.anomaly.prefilter import PrefilterBank, build_detectors
+from src.anomaly.registry import ModelArtifact
+from src.anomaly.severity import classify, thresholds_for_host
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_KINDS = ('spike', 'leak', 'level_shift', 'saturation')
+
+# Duration range of each injected anomaly, in samples
+ANOMALY_DURATIONS = {
+    'spike': (3, 10),
+    'leak': (300, 1800),
+    'level_shift': (120, 600),
+    'saturation': (60, 300)
+}
+
+# Samples per injected anomaly in a trace, so every trace size has the same share of anomalous samples
+EVENT_SPACING = 5000
+
+# Period of the synthetic CPU cycle; training traces cover at least one
+CYCLE_SECONDS = 86400
+
+MEMORY_TOTAL = 16 * 1024 ** 3
+CPU_COUNT = 8
+
+# (timestamps, raw rows) -> anomaly flag per row, keeping state between calls
+Step = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def _smooth_noise(rng: np.random.Generator, n: int, scale: float, span: int = 30) -> np.ndarray:
+    """Autocorrelated noise: white noise through an exponential kernel, rescaled to ``scale``."""
+    kernel = np.exp(-np.arange(span) / (span / 3))
+    noise = np.convolve(rng.normal(0, 1, n + span), kernel, mode='valid')[:n]
+    return noise * scale / max(noise.std(), 1e-9)
+
+
+def synthetic_trace(n: int, seed: int = 0, interval: float = 1.0, anomalies: bool = True,
+                    start: float = 1.7e9) -> Dict[str, Any]:
+    """
+    Generate a host metrics trace with labelled injected anomalies.
+
+    The normal trace has a daily CPU cycle with correlated frequency and
+    load, slowly wandering memory use and log-normal network traffic. One
+    anomaly per whole ``EVENT_SPACING`` samples, and at least one of each
+    kind, is injected at a random point of its own slot, cycling through
+    the kinds below. Traces too short for one kind per ``EVENT_SPACING``
+    shrink every duration in proportion, so the share of anomalous samples
+    stays the same at every size:
+
+    - ``spike``: CPU near 100% for a few samples
+    - ``leak``: memory growing steadily, then released
+    - ``level_shift``: network traffic several times its usual level
+    - ``saturation``: CPU, load and memory pinned near their limits
+
+    Args:
+        n: Samples in the trace
+        seed: Random seed
+        interval: Seconds between samples
+        anomalies: False for a clean trace, e.g. to train on
+        start: Epoch time of the first sample
+
+    Returns:
+        Dictionary with ``timestamps``, raw FEATURE_COLUMNS rows ``X``, the
+        boolean ``labels`` per sample and the ``events`` as
+        ``(kind, start, stop)`` sample ranges
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = start + np.arange(n) * interval
+    phase = 2 * np.pi * (timestamps % CYCLE_SECONDS) / CYCLE_SECONDS
+
+    cpu = np.clip(25 - 15 * np.cos(phase) + _smooth_noise(rng, n, 5) + rng.normal(0, 2, n), 0, 100)
+    memory_percent = np.clip(45 + 5 * np.sin(phase / 7) + _smooth_noise(rng, n, 2, span=300), 5, 95)
+    upload = rng.lognormal(np.log(5e4), 0.5, n)
+    download = rng.lognormal(np.log(3e5), 0.6, n)
+    load = np.maximum(cpu / 100 * CPU_COUNT * 0.6 + rng.normal(0, 0.2, n), 0)
+
+    labels = np.zeros(n, dtype=bool)
+    events: List[Tuple[str, int, int]] = []
+    if anomalies and n >= 4 * len(ANOMALY_KINDS):
+        n_events = max(len(ANOMALY_KINDS), n // EVENT_SPACING)
+        slot = n // n_events
+        scale = min(1.0, slot / EVENT_SPACING)
+        for e in range(n_events):
+            kind = ANOMALY_KINDS[e % len(ANOMALY_KINDS)]
+            low, high = ANOMALY_DURATIONS[kind]
+            duration = int(min(max(rng.integers(low, high + 1) * scale, 2), max(slot // 2, 2)))
+            first = e * slot + int(rng.integers(0, max(slot - duration, 1)))
+            span = slice(first, first + duration)
+            if kind == 'spike':
+                cpu[span] = rng.uniform(92, 100, duration)
+                load[span] += CPU_COUNT * 0.5
+            elif kind == 'leak':
+                memory_percent[span] += np.linspace(0, rng.uniform(25, 40), duration)
+            elif kind == 'level_shift':
+                download[span] *= rng.uniform(6, 10)
+                upload[span] *= rng.uniform(4, 8)
+            else:
+                cpu[span] = rng.uniform(98, 100, duration)
+                load[span] = CPU_COUNT * rng.uniform(1.5, 2.5, duration)
+                memory_percent[span] = np.maximum(memory_percent[span], rng.uniform(93, 98, duration))
+            labels[span] = True
+            events.append((kind, first, first + duration))
+
+    memory_percent = np.clip(memory_percent, 0, 100)
+    X = np.column_stack([
+        cpu,
+        2400 + 6 * cpu + rng.normal(0, 50, n),
+        np.full(n, CPU_COUNT, dtype=np.float64),
+        load,
+        memory_percent / 100 * MEMORY_TOTAL,
+        memory_percent,
+        upload,
+        download
+    ])
+    return {'timestamps': timestamps, 'X': X, 'labels': labels, 'events': events}
+
+
+def train_candidate(config: Dict[str, Any], train_size: int, seed: int = 0,
+                    contamination: Optional[float] = None) -> ModelArtifact:
+    """
+    Train the configured model (pipeline, forest and ensemble members) on a clean synthetic trace.
+
+    The trace starts at the same point of the CPU cycle as the benchmark
+    traces; anything shorter than one cycle leaves part of the normal
+    range unseen, and the accuracy figures then mostly measure that.
+
+    Returns:
+        The scikit-learn artifact; flatten it for the numpy engine
+    """
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import MinMaxScaler
+
+    contamination = contamination if contamination is not None else config['anomaly']['retrain']['contamination']
+    if train_size < CYCLE_SECONDS:
+        logger.warning(f"Training on {train_size} samples covers only part of the "
+                       f"{CYCLE_SECONDS} s cycle; precision will be understated")
+    trace = synthetic_trace(train_size, seed=seed + 1, anomalies=False)
+    pipeline = pipeline_from_config(config)
+    if pipeline is not None:
+        full = pipeline.transform(trace['timestamps'], trace['X'])
+        pipeline.fit_constant(np.ptp(full, axis=0))
+        X = full[:, pipeline.keep_index()]
+        feature_names = pipeline.output_names
+    else:
+        X = trace['X']
+        feature_names = FEATURE_COLUMNS
+
+    scaler = MinMaxScaler().fit(X)
+    X_scaled = scaler.transform(X)
+    model = IsolationForest(contamination=contamination, random_state=seed).fit(X_scaled)
+    members = train_members(X_scaled, feature_names, ensemble_members(config), contamination, seed)
+    return ModelArtifact(scaler, model, 'benchmark', 'benchmark', 0.0,
+                         feature_names=feature_names, pipeline=pipeline, members=members)
+
+
+def forest_detector(artifact: ModelArtifact, thresholds: Dict[str, float]) -> Callable[[], Step]:
+    """Feature stream plus forest, flagging rows above the ``normal`` severity."""
+    def make() -> Step:
+        stream = artifact.feature_stream()
+
+        def step(timestamps: np.ndarray, X: np.ndarray) -> np.ndarray:
+            inputs = stream.transform(timestamps, X) if stream is not None else X
+            return classify(artifact.decision_function(inputs), thresholds) > 0
+        return step
+    return make
+
+
+def statistical_detector(prefilter_config: Dict[str, Any]) -> Callable[[], Step]:
+    """The pre-filter's EWMA, z-score and MAD detectors, flagging rows any of them fires on."""
+    def make() -> Step:
+        bank = PrefilterBank(build_detectors(prefilter_config, len(FEATURE_COLUMNS)),
+                             warmup=prefilter_config.get('warmup', 60))
+
+        def step(timestamps: np.ndarray, X: np.ndarray) -> np.ndarray:
+            return np.array([bool(bank.update(x)['fired']) for x in X], dtype=bool)
+        return step
+    return make
+
+
+def ensemble_detector(artifact: ModelArtifact, ensemble: EnsembleScorer,
+                      thresholds: Dict[str, float]) -> Callable[[], Step]:
+    """Every forest in the artifact plus the statistical detectors, combined by voting."""
+    def make() -> Step:
+        stream = artifact.feature_stream()
+        statistics = ensemble.statistics(len(FEATURE_COLUMNS))
+
+        def step(timestamps: np.ndarray, X: np.ndarray) -> np.ndarray:
+            inputs = stream.transform(timestamps, X) if stream is not None else X
+            scores = ensemble.score(artifact, inputs, raw=X, statistics=statistics)['score']
+            return classify(scores, thresholds) > 0
+        return step
+    return make
+
+
+def accuracy(labels: np.ndarray, flags: np.ndarray, events: Sequence[Tuple[str, int, int]]) -> Dict[str, Any]:
+    """
+    Sample-level precision, recall and F1, plus the share of each kind of event flagged at least once.
+
+    Precision, recall and F1 are None on a trace without anomalies (a clean
+    or very short one), where only ``flagged_share`` is meaningful.
+    """
+    detected: Dict[str, List[bool]] = {kind: [] for kind in ANOMALY_KINDS}
+    for kind, start, stop in events:
+        detected[kind].append(bool(flags[start:stop].any()))
+    precision = recall = f1 = None
+    if labels.any():
+        true_positives = int(np.sum(flags & labels))
+        precision = true_positives / max(int(flags.sum()), 1)
+        recall = true_positives / int(labels.sum())
+        f1 = round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0
+        precision, recall = round(precision, 4), round(recall, 4)
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'labelled_share': round(float(labels.mean()), 4),
+        'flagged_share': round(float(flags.mean()), 4),
+        'event_recall': {kind: round(float(np.mean(hits)), 4) if hits else None
+                         for kind, hits in detected.items()}
+    }
+
+
+def _run(make: Callable[[], Step], trace: Dict[str, Any], chunk_size: int) -> np.ndarray:
+    step = make()
+    flags = np.zeros(len(trace['labels']), dtype=bool)
+    for start in range(0, len(flags), chunk_size):
+        stop = start + chunk_size
+        flags[start:stop] = step(trace['timestamps'][start:stop], trace['X'][start:stop])
+    return flags
+
+
+def measure(name: str, make: Callable[[], Step], trace: Dict[str, Any], chunk_size: int = 20000,
+            latency_samples: int = 1000, measure_memory: bool = True) -> Dict[str, Any]:
+    """
+    Benchmark one detector on one trace.
+
+    Throughput scores the whole trace in ``chunk_size`` batches; latency
+    feeds the first ``latency_samples`` rows one at a time, as the live
+    detector does. Peak memory is the Python heap high-water mark of a
+    separate batch run under tracemalloc, which would skew the timings;
+    worker processes are not included.
+    """
+    n = len(trace['labels'])
+    started = time.perf_counter()
+    flags = _run(make, trace, chunk_size)
+    seconds = time.perf_counter() - started
+
+    step = make()
+    latencies = []
+    for i in range(min(n, latency_samples)):
+        tick = time.perf_counter()
+        step(trace['timestamps'][i:i + 1], trace['X'][i:i + 1])
+        latencies.append(time.perf_counter() - tick)
+    latencies = np.array(latencies) * 1e6
+
+    peak_memory_mb = None
+    if measure_memory:
+        tracemalloc.start()
+        _run(make, trace, chunk_size)
+        peak_memory_mb = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+        tracemalloc.stop()
+
+    result = {'detector': name, 'samples': n, 'seconds': round(seconds, 3),
+              'samples_per_second': round(n / seconds, 1),
+              'p50_latency_us': round(float(np.percentile(latencies, 50)), 1),
+              'p99_latency_us': round(float(np.percentile(latencies, 99)), 1),
+              'peak_memory_mb': peak_memory_mb}
+    result.update(accuracy(trace['labels'], flags, trace['events']))
+    return result
+
+
+def run_benchmark(config: Dict[str, Any], sizes: Sequence[int] = (1000, 100000, 1000000),
+                  detectors: Optional[Sequence[str]] = None, seed: int = 0, train_size: int = CYCLE_SECONDS,
+                  chunk_size: int = 20000, latency_samples: int = 1000,
+                  measure_memory: bool = True, contamination: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Train the configured model on a clean synthetic trace and benchmark every detector.
+
+    Detectors are ``isolation_forest`` (scikit-learn), ``flat_forest`` (the
+    numpy engine), ``statistical`` (the pre-filter detectors) and
+    ``ensemble``. ``contamination`` overrides the configured retraining
+    contamination, which sets the share of clean samples the forests flag.
+
+    Returns:
+        JSON-friendly report with the host, the settings and one result per
+        detector and trace size
+    """
+    from src.anomaly.fast_forest import flatten_artifact, save_flat_artifact
+
+    thresholds = thresholds_for_host(config)
+    artifact = train_candidate(config, train_size, seed, contamination)
+    flat = flatten_artifact(artifact)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # Pool workers load the model from a flattened file
+        flat_path = os.path.join(scratch, 'benchmark.npz')
+        save_flat_artifact(flat_path, flat)
+        ensemble_config = dict(config)
+        ensemble_config['anomaly'] = dict(config['anomaly'], ensemble=dict(
+            (config['anomaly'].get('ensemble') or {}), enabled=True))
+        ensemble = ensemble_from_config(ensemble_config, flat_path)
+
+        candidates = {
+            'isolation_forest': forest_detector(artifact, thresholds),
+            'flat_forest': forest_detector(flat, thresholds),
+            'statistical': statistical_detector(config['anomaly'].get('prefilter') or {}),
+            'ensemble': ensemble_detector(flat, ensemble, thresholds)
+        }
+        unknown = sorted(set(detectors or ()) - set(candidates))
+        if unknown:
+            raise ValueError(f"Unknown detectors {unknown}, expected some of {sorted(candidates)}")
+
+        results = []
+        try:
+            for n in sizes:
+                trace = synthetic_trace(n, seed=seed)
+                for name, make in candidates.items():
+                    if detectors and name not in detectors:
+                        continue
+                    logger.info(f"Benchmarking {name} on {n} samples")
+                    results.append(measure(name, make, trace, chunk_size, latency_samples, measure_memory))
+        finally:
+            ensemble.shutdown()
+
+    return {
+        'timestamp': time.time(),
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count()
+        },
+        'settings': {
+            'sizes': list(sizes), 'seed': seed, 'train_size': train_size, 'chunk_size': chunk_size,
+            'contamination': contamination if contamination is not None
+            else config['anomaly']['retrain']['contamination'],
+            'latency_samples': latency_samples, 'thresholds': thresholds,
+            'features': flat.feature_names, 'ensemble_models': flat.member_names
+        },
+        'results': results
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark anomaly detectors on synthetic traces")
+    parser.add_argument('--sizes', default='1000,100000,1000000', help="Comma-separated trace lengths")
+    parser.add_argument('--detectors', help="Comma-separated subset of isolation_forest, flat_forest, "
+                                            "statistical and ensemble")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--train-size', type=int, default=CYCLE_SECONDS,
+                        help="Clean training samples; at least one daily cycle")
+    parser.add_argument('--contamination', type=float, help="Override anomaly.retrain.contamination")
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    parser.add_argument('--latency-samples', type=int, default=1000)
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('--config', default=get_resource_path('config/config.yaml'))
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file)
+
+    report = run_benchmark(
+        config,
+        sizes=[int(size) for size in args.sizes.split(',')],
+        detectors=args.detectors.split(',') if args.detectors else None,
+        seed=args.seed, train_size=args.train_size, chunk_size=args.chunk_size,
+        latency_samples=args.latency_samples, measure_memory=not args.no_memory,
+        contamination=args.contamination
+    )
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    def cell(value: Any) -> Any:
+        return '-' if value is None else value
+
+    print(f"{'detector':<17} {'samples':>8} {'precision':>9} {'recall':>7} {'flagged':>8} {'samples/s':>11} "
+          f"{'p99 us':>9} {'peak MB':>8}")
+    for row in report['results']:
+        print(f"{row['detector']:<17} {row['samples']:>8} {cell(row['precision']):>9} {cell(row['recall']):>7} "
+              f"{row['flagged_share']:>8} {row['samples_per_second']:>11} {row['p99_latency_us']:>9} "
+              f"{cell(row['peak_memory_mb']):>8}")
+    print(f"Full results written to {args.output}")
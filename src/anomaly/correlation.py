@@ -0,0 +1,272 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Correlated column name to the snapshot section and key it comes from, and
+# whether the value is a cumulative counter that is correlated as a rate
+CORRELATION_METRICS = {
+    'cpu_percent': ('cpu', 'cpu_percent', False),
+    'cpu_load_avg_1min': ('cpu', 'cpu_load_avg_1min', False),
+    'context_switch_rate': ('cpu', 'cpu_context_switches', True),
+    'interrupt_rate': ('cpu', 'cpu_interrupts', True),
+    'memory_used': ('memory', 'used', False),
+    'swap_used': ('memory', 'swap_used', False),
+    'disk_read_rate': ('disk', 'read_bytes', True),
+    'disk_write_rate': ('disk', 'write_bytes', True),
+    'network_upload_speed': ('network', 'upload_speed', False),
+    'network_download_speed': ('network', 'download_speed', False)
+}
+
+
+def scatter_correlation(scatter: np.ndarray) -> np.ndarray:
+    """Pearson correlation from a scatter (or covariance) matrix, NaN for columns that did not vary."""
+    variance = np.diag(scatter)
+    varied = variance > 1e-12
+    std = np.sqrt(np.clip(variance, 0.0, None))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = np.where(np.outer(varied, varied), scatter / np.outer(std, std), np.nan)
+    return np.clip(correlation, -1.0, 1.0)
+
+
+class WindowedCovariance:
+    """
+    Covariance matrix of the last ``window`` rows, updated in O(k^2).
+
+    Rows are kept in a ring; each update adds the new row's sum and outer
+    product and subtracts those of the row it overwrites. Values are stored
+    relative to a reference point near the window mean so the running sums
+    do not lose precision on large values such as bytes of memory, and
+    every ``window`` updates the reference moves to the current mean and
+    the sums are recomputed from the ring, which also clears accumulated
+    rounding error at an amortised O(k^2) per row.
+    """
+
+    def __init__(self, n_columns: int, window: int):
+        self.window = window
+        self.ring = np.zeros((window, n_columns))
+        self.shift = np.zeros(n_columns)
+        self.sums = np.zeros(n_columns)
+        self.products = np.zeros((n_columns, n_columns))
+        self.count = 0
+        self.position = 0
+        self._since_refresh = 0
+
+    def update(self, row: np.ndarray) -> None:
+        if self.count == 0:
+            self.shift = row.astype(np.float64).copy()
+        value = row - self.shift
+        if self.count == self.window:
+            old = self.ring[self.position]
+            self.sums -= old
+            self.products -= np.outer(old, old)
+        else:
+            self.count += 1
+        self.ring[self.position] = value
+        self.sums += value
+        self.products += np.outer(value, value)
+        self.position = (self.position + 1) % self.window
+        self._since_refresh += 1
+        if self._since_refresh >= self.window:
+            self.refresh()
+
+    def refresh(self) -> None:
+        """Move the reference point to the window mean and recompute the sums exactly."""
+        self._since_refresh = 0
+        if self.count == 0:
+            return
+        rows = self.ring[:self.count]
+        mean = rows.mean(axis=0)
+        rows -= mean
+        self.shift += mean
+        self.sums = rows.sum(axis=0)
+        self.products = rows.T @ rows
+
+    def fill_column(self, column: int, value: float) -> None:
+        """Restart one column's history as if it had held ``value`` throughout."""
+        self.ring[:self.count, column] = value - self.shift[column]
+        self.refresh()
+
+    def moments(self) -> Tuple[int, np.ndarray, np.ndarray]:
+        """Row count, column means and the scatter matrix (sum of centred outer products)."""
+        n = max(self.count, 1)
+        return self.count, self.shift + self.sums / n, self.products - np.outer(self.sums, self.sums) / n
+
+    def correlation(self) -> np.ndarray:
+        """Pearson correlation matrix, NaN for columns that did not vary."""
+        return scatter_correlation(self.moments()[2])
+
+
+class CorrelationEngine:
+    """
+    Which metrics are moving together right now, for root-cause hints.
+
+    Every snapshot feeds two WindowedCovariance instances over the same
+    columns: CORRELATION_METRICS (counters as per-second rates) and,
+    optionally, the CPU and IO rate of the ``processes`` heaviest
+    processes, which hold their value from the latest process scan. A pair
+    is a co-movement when it is strongly correlated over the short window
+    and clearly more so than over the rest of the long window, so
+    relationships that always hold (CPU and load average) are not reported
+    as news. The short window is part of the long one; its moments are
+    taken out of the long window's with the parallel-variance formula, so
+    a burst in the short window does not leak into the comparison.
+
+    Process columns follow processes by name: a process that enters the
+    top list takes over the slot of the one absent longest, and its columns
+    restart, taking part in co-movements after ``min_samples`` samples.
+    """
+
+    def __init__(self, short_window: int = 60, long_window: int = 1440, processes: int = 5,
+                 min_correlation: float = 0.8, min_change: float = 0.3, min_samples: int = 30):
+        self.processes = processes
+        self.min_correlation = min_correlation
+        self.min_change = min_change
+        self.min_samples = min_samples
+        self.columns = list(CORRELATION_METRICS)
+        for slot in range(processes):
+            self.columns += [f"process {slot} cpu", f"process {slot} io"]
+        self.short = WindowedCovariance(len(self.columns), short_window)
+        self.long = WindowedCovariance(len(self.columns), long_window)
+        self.row = np.zeros(len(self.columns))
+        self.samples = 0
+        self.started = np.zeros(len(self.columns), dtype=np.int64)
+        self.slot_names: List[Optional[str]] = [None] * processes
+        self.slot_seen = np.full(processes, -1, dtype=np.int64)
+        self._scans = 0
+        self._last_counters: Dict[str, float] = {}
+        self._last_time: Optional[float] = None
+        self._last_io: Dict[str, Tuple[float, float]] = {}
+
+    def update(self, metrics: Dict[str, Any]) -> None:
+        """Add one SystemMonitor snapshot."""
+        timestamp = metrics['timestamp'].timestamp()
+        elapsed = timestamp - self._last_time if self._last_time is not None else None
+        for column, (name, (section, key, counter)) in enumerate(CORRELATION_METRICS.items()):
+            value = (metrics.get(section) or {}).get(key)
+            if not isinstance(value, (int, float)):
+                continue  # hold the previous value
+            if counter:
+                previous = self._last_counters.get(name)
+                self._last_counters[name] = value
+                if previous is None or not elapsed or value < previous:
+                    continue
+                value = (value - previous) / elapsed
+            self.row[column] = value
+        self._last_time = timestamp
+        self.short.update(self.row)
+        self.long.update(self.row)
+        self.samples += 1
+
+    def update_processes(self, timestamp: float, processes: Sequence[Dict[str, Any]]) -> None:
+        """Add one process scan, e.g. the top processes from ProcessMonitor.monitor_processes."""
+        if not self.processes:
+            return
+        self._scans += 1
+        cpu: Dict[str, float] = {}
+        io: Dict[str, float] = {}
+        for process in processes:
+            name = process['name']
+            cpu[name] = cpu.get(name, 0.0) + (process.get('cpu_percent') or 0.0)
+            if process.get('io_bytes') is not None:
+                io[name] = io.get(name, 0.0) + process['io_bytes']
+        heaviest = sorted(cpu, key=cpu.get, reverse=True)[:self.processes]
+
+        # Mark every incumbent first, so newcomers only take slots of processes not in this scan
+        newcomers = []
+        for name in heaviest:
+            if name in self.slot_names:
+                self.slot_seen[self.slot_names.index(name)] = self._scans
+            else:
+                newcomers.append(name)
+        for name in newcomers:
+            slot = int(np.argmin(self.slot_seen))
+            self.slot_names[slot] = name
+            self.slot_seen[slot] = self._scans
+            self._restart_slot(slot, cpu[name])
+
+        base = len(CORRELATION_METRICS)
+        for slot, name in enumerate(self.slot_names):
+            if name is None:
+                continue
+            self.row[base + 2 * slot] = cpu.get(name, 0.0)
+            # Per-name IO totals only cover processes in this scan, so a drop is read as no IO
+            total = io.get(name)
+            previous = self._last_io.get(name)
+            if total is not None:
+                if previous is not None and timestamp > previous[0]:
+                    self.row[base + 2 * slot + 1] = max(total - previous[1], 0.0) / (timestamp - previous[0])
+                self._last_io[name] = (timestamp, total)
+        self._last_io = {name: value for name, value in self._last_io.items() if name in self.slot_names}
+
+    def _restart_slot(self, slot: int, cpu: float) -> None:
+        base = len(CORRELATION_METRICS)
+        for column, value in ((base + 2 * slot, cpu), (base + 2 * slot + 1, 0.0)):
+            self.row[column] = value
+            self.short.fill_column(column, value)
+            self.long.fill_column(column, value)
+            self.started[column] = self.samples
+
+    def column_name(self, column: int) -> str:
+        base = len(CORRELATION_METRICS)
+        if column < base:
+            return self.columns[column]
+        slot, kind = divmod(column - base, 2)
+        return f"{self.slot_names[slot]} {'io' if kind else 'cpu'}"
+
+    def _earlier_correlation(self) -> np.ndarray:
+        """Correlation over the long window minus the short window it contains."""
+        n_long, mean_long, scatter_long = self.long.moments()
+        n_short, mean_short, scatter_short = self.short.moments()
+        n_earlier = n_long - n_short
+        if n_earlier < 2:
+            return np.full_like(scatter_long, np.nan)
+        mean_earlier = (n_long * mean_long - n_short * mean_short) / n_earlier
+        gap = mean_short - mean_earlier
+        scatter = scatter_long - scatter_short - np.outer(gap, gap) * n_short * n_earlier / n_long
+        return scatter_correlation(scatter)
+
+    def comovements(self, top: int = 5) -> List[Tuple[str, str, float]]:
+        """
+        Strongest unusual co-movements over the short window.
+
+        Returns:
+            Up to ``top`` ``(metric, metric, correlation)`` triples, strongest first
+        """
+        if self.short.count < self.min_samples:
+            return []
+        short = self.short.correlation()
+        long = self._earlier_correlation()
+        ready = (self.samples - self.started) >= self.min_samples
+        if self.processes:
+            base = len(CORRELATION_METRICS)
+            for slot, name in enumerate(self.slot_names):
+                if name is None:
+                    ready[base + 2 * slot:base + 2 * slot + 2] = False
+        pairs = []
+        for i, j in zip(*np.triu_indices(len(self.columns), k=1)):
+            r = short[i, j]
+            if not (ready[i] and ready[j]) or np.isnan(r) or abs(r) < self.min_correlation:
+                continue
+            usual = long[i, j] if not np.isnan(long[i, j]) else 0.0
+            if abs(r) - abs(usual) < self.min_change:
+                continue
+            pairs.append((self.column_name(i), self.column_name(j), round(float(r), 2)))
+        return sorted(pairs, key=lambda pair: abs(pair[2]), reverse=True)[:top]
+
+
+def correlation_from_config(config: Dict[str, Any]) -> Optional[CorrelationEngine]:
+    """Build a CorrelationEngine from the `anomaly.correlation` config section, or None if disabled."""
+    correlation_config = config['anomaly'].get('correlation') or {}
+    if not correlation_config.get('enabled', False):
+        return None
+    return CorrelationEngine(
+        short_window=correlation_config.get('short_window', 60),
+        long_window=correlation_config.get('long_window', 1440),
+        processes=correlation_config.get('processes', 5),
+        min_correlation=correlation_config.get('min_correlation', 0.8),
+        min_change=correlation_config.get('min_change', 0.3),
+        min_samples=correlation_config.get('min_samples', 30)
+    )
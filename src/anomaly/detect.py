@@ -1,7 +1,17 @@
 import pandas as pd
-import joblib
+import numpy as np
 import sys
 import os
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+from src.database.db import FEATURE_COLUMNS, extract_row
+from src.anomaly.registry import ModelArtifact, ModelRegistry
+from src.anomaly.prefilter import PrefilterBank
+from src.anomaly.baselines import SeasonalBaseline
+from src.anomaly.drift import DriftMonitor
+from src.anomaly.ensemble import EnsembleScorer
+from src.anomaly.severity import DEFAULT_THRESHOLDS, SEVERITY_LEVELS, classify, normalize
 
 def get_resource_path(relative_path):
     """Get the absolute path to bundled files when using PyInstaller."""
@@ -11,55 +21,361 @@ def get_resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-# Load the pre-trained Isolation Forest model and scaler
-model = joblib.load(get_resource_path("src/models/isolation_forest_model.pkl"))
-scaler = joblib.load(get_resource_path("src/models/scaler.pkl"))  # Load the same MinMaxScaler
+# The pre-trained Isolation Forest model and its MinMaxScaler are loaded lazily
+# by the registry, preferring the versioned bundle over the legacy pickles, and
+# scored with the numpy engine cached in anomaly_model.npz
+model_registry = ModelRegistry(
+    get_resource_path("src/models/anomaly_model.joblib"),
+    legacy_paths=(
+        get_resource_path("src/models/isolation_forest_model.pkl"),
+        get_resource_path("src/models/scaler.pkl")
+    ),
+    flat_path=get_resource_path("src/models/anomaly_model.npz")
+)
 
-def detect_anomalies(data_file: str, THRESHOLD_STEP: int) -> pd.DataFrame:
+def score_batch(X: np.ndarray, thresholds: Optional[Dict[str, float]] = None,
+                artifact: Optional[ModelArtifact] = None,
+                ensemble: Optional[EnsembleScorer] = None,
+                raw: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
     """
-    Detect anomalies using the pre-trained Isolation Forest model.
+    Score model input rows and grade them in one vectorized pass.
+    
+    Args:
+        X: Model input rows, i.e. ``artifact.features()`` of raw FEATURE_COLUMNS rows
+        thresholds: Severity cutoffs, defaults to DEFAULT_THRESHOLDS
+        artifact: Model to use, defaults to the registry's current model
+        ensemble: Score with every model in the artifact plus the
+            statistical detectors and combine them by voting
+        raw: Raw rows behind ``X``, for the ensemble's statistical detectors
+        
+    Returns:
+        Arrays ``score`` (decision function, negative is anomalous),
+        ``anomaly_level`` (0..1) and ``severity`` (level index); with an
+        ensemble also the per-model ``member_scores`` and ``member_names``
     """
-    # Define feature name mapping (excluding timestamp)
-    feature_names = [
-        'cpu_percent',
-        'cpu_freq', 
-        'cpu_count_logical',
-        'cpu_load_avg_1min',
-        'memory_used',
-        'memory_percent',
-        'network_upload_speed',
-        'network_download_speed'
-    ]
-    
-    # Load data
-    df = pd.read_csv(data_file, header=None)
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    artifact = artifact or model_registry.wait()
+    if artifact is None:
+        raise RuntimeError("Anomaly model is not available")
+    
+    members = None
+    if ensemble is not None:
+        members = ensemble.score(artifact, X, raw=raw)
+        scores = members['score']
+    else:
+        scores = artifact.decision_function(X)
+    scored = {
+        'score': scores,
+        'anomaly_level': normalize(scores, thresholds),
+        'severity': classify(scores, thresholds)
+    }
+    if members is not None:
+        scored['member_scores'] = members['scores']
+        scored['member_names'] = members['names']
+    return scored
+
+def detect_anomalies(data_file: str, THRESHOLD_STEP: int,
+                     thresholds: Optional[Dict[str, float]] = None,
+                     only_anomalies: bool = False,
+                     ensemble: Optional[EnsembleScorer] = None) -> pd.DataFrame:
+    """
+    Score every sample in a metrics CSV with the pre-trained Isolation Forest model.
     
-    # Remove timestamp column
-    df = df.iloc[:, 1:]
+    Args:
+        data_file: CSV written by preprocess_data
+        THRESHOLD_STEP: Kept for compatibility, unused
+        thresholds: Severity cutoffs, defaults to DEFAULT_THRESHOLDS
+        only_anomalies: Return only rows above the ``normal`` level
+        ensemble: Score with the model ensemble, in its worker pool for
+            large files; each model's score is added as ``score_<name>``
+        
+    Returns:
+        DataFrame with timestamp, features, ``score``, ``anomaly_level``,
+        ``severity`` and, for flagged rows, ranked ``contributors`` per row,
+        or None when there is nothing to return
+    """
+    # Load data, skipping the header row preprocess_data writes to new files
+    df = pd.read_csv(data_file, header=None)
+    df = df[df.iloc[:, 0] != 'timestamp']
 
     if len(df) == 0:
         print("No valid data found")
         return None
     
-    # Scale the data
-    X_scaled = scaler.transform(df)
-    
-    # Predict anomalies
-    y_pred = model.predict(X_scaled)
+    artifact = model_registry.wait()
+    if artifact is None:
+        print("Anomaly model is not available")
+        return None
     
     # Create DataFrame with proper column names
-    df_with_names = pd.DataFrame(df.values, columns=feature_names)
+    result = pd.DataFrame(df.iloc[:, 1:].values.astype(np.float64), columns=FEATURE_COLUMNS)
+    result.insert(0, 'timestamp', df.iloc[:, 0].values)
+    
+    # Derive the model's features (only time differences matter, so naive
+    # local timestamps will do), then scale, score and grade all rows at once
+    timestamps = pd.to_datetime(result['timestamp']).to_numpy('datetime64[ns]').astype(np.int64) / 1e9
+    raw = result[FEATURE_COLUMNS].values
+    inputs = artifact.features(timestamps, raw)
+    scored = score_batch(inputs, thresholds, artifact, ensemble=ensemble, raw=raw)
+    result['score'] = scored['score'].round(4)
+    for name, column in zip(scored.get('member_names', ()), scored.get('member_scores', np.empty((0, 0))).T):
+        result[f"score_{name}"] = column.round(4)
+    result['anomaly_level'] = scored['anomaly_level'].round(3)
+    result['severity'] = np.array(SEVERITY_LEVELS)[scored['severity']]
+    
+    anomalous = scored['severity'] > 0
     
-    # Filter anomalies
-    anomalies = df_with_names[y_pred == -1]
+    # Explain only the flagged rows, in one batch
+    contributors = np.full(len(result), None, dtype=object)
+    if anomalous.any():
+        # Assigned one by one: numpy would turn the nested lists into a 3-D array
+        for i, top in zip(np.flatnonzero(anomalous), artifact.top_contributors(inputs[anomalous])):
+            contributors[i] = top
+    result['contributors'] = contributors
     
-    if len(anomalies) > THRESHOLD_STEP * 0:
+    if anomalous.any():
         print("Anomaly detected")
-        return anomalies
     else:
         print("No anomaly detected")
-        return None
+    
+    if only_anomalies:
+        result = result[anomalous]
+        return result if len(result) else None
+    return result
+
+class StreamingDetector:
+    """
+    Score each sample as it is collected instead of re-reading the CSV.
+    
+    The latest ``window_size`` samples, their scores and severity levels
+    live in fixed-size numpy ring buffers, so memory use is constant and
+    every sample is scored exactly once. With a ``prefilter`` the forest
+    only scores samples one of the cheap detectors flags (plus a periodic
+    check); the rest are recorded as normal without a score. With a
+    ``baseline`` every sample graded normal also updates its hour-of-week
+    bucket, and a forest anomaly whose features all stay within
+    ``seasonal_k`` standard deviations of that bucket (a nightly job, say)
+    is downgraded to normal.
+    
+    Models trained with a feature pipeline score its output: every sample
+    passes through the artifact's incremental feature stream, which is
+    rebuilt and replayed over the raw window whenever the model is swapped.
+    With a ``drift`` monitor those model inputs are also compared with the
+    training distribution saved in the artifact. With an ``ensemble`` the
+    score is the vote of every forest in the artifact and the statistical
+    detectors, whose ratios come from the pre-filter when there is one; a
+    single sample is always scored in-process.
+    
+    ``timings``, an object with a ``stage(name)`` context manager such as
+    replay's StageTimings, measures each stage of every update.
+    """
+    
+    def __init__(self, window_size: int = 600, registry: Optional[ModelRegistry] = None,
+                 thresholds: Optional[Dict[str, float]] = None,
+                 prefilter: Optional[PrefilterBank] = None,
+                 baseline: Optional[SeasonalBaseline] = None, seasonal_k: float = 4.0,
+                 drift: Optional[DriftMonitor] = None,
+                 ensemble: Optional[EnsembleScorer] = None, timings=None):
+        self.window_size = window_size
+        self.registry = registry or model_registry
+        self.thresholds = thresholds or DEFAULT_THRESHOLDS
+        self.prefilter = prefilter
+        self.baseline = baseline
+        self.seasonal_k = seasonal_k
+        self.drift = drift
+        self.ensemble = ensemble
+        self.timings = timings
+        # Statistical votes need detector ratios even without a pre-filter
+        self._statistics = ensemble.statistics(len(FEATURE_COLUMNS)) \
+            if ensemble is not None and ensemble.statistical and prefilter is None else None
+        self.timestamps = np.zeros(window_size, dtype=np.float64)
+        self.features = np.zeros((window_size, len(FEATURE_COLUMNS)), dtype=np.float64)
+        self.scores = np.full(window_size, np.nan, dtype=np.float64)
+        self.levels = np.zeros(window_size, dtype=np.int8)
+        self.position = 0
+        self.size = 0
+        self._stream_artifact: Optional[ModelArtifact] = None
+        self._stream = None
+    
+    def _model_inputs(self, artifact: ModelArtifact, timestamp: float, x: np.ndarray) -> np.ndarray:
+        """Feature row for the model, keeping the artifact's feature stream in step."""
+        if artifact is not self._stream_artifact:
+            # New model: warm its stream up on the samples already in the window
+            self._stream_artifact = artifact
+            self._stream = artifact.feature_stream()
+            if self._stream is not None and self.size:
+                indices = self._ordered_indices()
+                self._stream.transform(self.timestamps[indices], self.features[indices])
+        if self._stream is None:
+            return x
+        return self._stream.transform(timestamp, x)
+    
+    def _stage(self, name: str):
+        return self.timings.stage(name) if self.timings is not None else nullcontext()
+    
+    def update(self, metrics: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Score one SystemMonitor snapshot and add it to the window.
+        
+        Args:
+            metrics: Snapshot returned by SystemMonitor.collect_metrics()
+            
+        Returns:
+            Dictionary with the decision-function ``score`` (negative means
+            anomalous, None while the model is still loading or when the
+            pre-filter skipped the forest), the 0..1 ``anomaly_level``, the
+            ``severity`` name, the ``is_anomaly`` flag, the ``model_version``
+            that produced it, the pre-filter detectors that ``fired``, the
+            largest hour-of-week ``baseline_z`` and whether the sample was
+            downgraded as ``seasonal``, each ensemble model's score as
+            ``members`` (None without an ensemble or a forest run) and, for
+            anomalies, the ranked feature ``contributors``
+        """
+        row = extract_row(metrics)
+        x = np.array([row[name] or 0 for name in FEATURE_COLUMNS], dtype=np.float64)
+        return self.update_row(row['timestamp'].timestamp(), x)
+    
+    def update_row(self, timestamp: float, features: np.ndarray) -> Dict[str, Any]:
+        """
+        Score one raw FEATURE_COLUMNS row, e.g. replayed from the store.
+        
+        Args:
+            timestamp: Sample time in epoch seconds
+            features: Raw row in FEATURE_COLUMNS order
+            
+        Returns:
+            The same dictionary as ``update``
+        """
+        x = np.asarray(features, dtype=np.float64).reshape(1, -1)
+        
+        baseline_z = None
+        if self.baseline is not None:
+            with self._stage('baseline'):
+                zscores = self.baseline.zscores(timestamp, x[0])
+                if zscores is not None:
+                    baseline_z = float(np.abs(zscores).max())
+        
+        with self._stage('prefilter'):
+            gate = self.prefilter.update(x[0]) if self.prefilter is not None else None
+            run_forest = gate is None or gate['run_forest']
+            if gate is not None:
+                ratios = gate['ratios']
+            else:
+                ratios = self._statistics.update(x[0])['ratios'] if self._statistics is not None else None
+        
+        # Take the artifact once so a hot swap never mixes two models
+        artifact = self.registry.get()
+        with self._stage('features'):
+            inputs = self._model_inputs(artifact, timestamp, x) if artifact is not None else None
+        if self.drift is not None and artifact is not None:
+            with self._stage('drift'):
+                self.drift.update(timestamp, inputs[0], artifact)
+        members = None
+        if artifact is not None and run_forest:
+            with self._stage('score'):
+                if self.ensemble is not None:
+                    voted = self.ensemble.score(artifact, inputs, ratios=ratios)
+                    score = float(voted['score'][0])
+                    members = {name: None if np.isnan(value) else round(float(value), 4)
+                               for name, value in zip(voted['names'], voted['scores'][0])}
+                else:
+                    score = float(artifact.decision_function(inputs)[0])
+        else:
+            score = np.nan
         
+        level = int(classify(score, self.thresholds))
+        # Usual for this hour of the week: not an anomaly, however rare globally
+        seasonal = level > 0 and baseline_z is not None and baseline_z < self.seasonal_k
+        if seasonal:
+            level = 0
+        # Anomalies stay out of the baseline, or a long one would become its hour's usual behaviour
+        if self.baseline is not None and level == 0:
+            with self._stage('baseline_update'):
+                self.baseline.update(timestamp, x)
+        
+        i = self.position
+        self.timestamps[i] = timestamp
+        self.features[i] = x[0]
+        self.scores[i] = score
+        self.levels[i] = level
+        self.position = (i + 1) % self.window_size
+        self.size = min(self.size + 1, self.window_size)
+        
+        fired = gate['fired'] if gate is not None else None
+        if artifact is None:
+            return {'score': None, 'anomaly_level': None, 'severity': None,
+                    'is_anomaly': False, 'model_version': None, 'fired': fired,
+                    'baseline_z': baseline_z, 'seasonal': False, 'members': None,
+                    'contributors': None}
+        if not run_forest:
+            return {'score': None, 'anomaly_level': 0.0, 'severity': SEVERITY_LEVELS[0],
+                    'is_anomaly': False, 'model_version': artifact.version, 'fired': fired,
+                    'baseline_z': baseline_z, 'seasonal': False, 'members': None,
+                    'contributors': None}
+        is_anomaly = bool(self.levels[i] > 0)
+        with self._stage('explain'):
+            contributors = artifact.top_contributors(inputs)[0] if is_anomaly else None
+        return {
+            'score': score,
+            # A seasonal downgrade is normal, so its level agrees with the severity
+            'anomaly_level': 0.0 if seasonal else float(normalize(score, self.thresholds)),
+            'severity': SEVERITY_LEVELS[self.levels[i]],
+            'is_anomaly': is_anomaly,
+            'model_version': artifact.version,
+            'fired': fired,
+            'baseline_z': baseline_z,
+            'seasonal': seasonal,
+            'members': members,
+            'contributors': contributors
+        }
+    
+    def prefilter_stats(self) -> Optional[Dict[str, Any]]:
+        """Pre-filter hit rates and skipped forest share, or None without a pre-filter."""
+        return self.prefilter.stats() if self.prefilter is not None else None
+    
+    def _ordered_indices(self) -> np.ndarray:
+        """Ring indices from oldest to newest."""
+        start = self.position - self.size
+        return np.arange(start, self.position) % self.window_size
+    
+    def recent_anomalies(self) -> List[Dict[str, Any]]:
+        """
+        Return the anomalous samples still in the window, oldest first.
+        
+        Each entry carries the ranked ``contributors`` of its score, as
+        ``(feature, share)`` pairs.
+        """
+        ordered = self._ordered_indices()
+        anomalous = self.levels[ordered] > 0
+        indices = ordered[anomalous]
+        
+        artifact = self.registry.get()
+        if artifact is not None and len(indices):
+            # Derived features depend on the preceding samples, so rebuild them for the window
+            inputs = artifact.features(self.timestamps[ordered], self.features[ordered])
+            contributors = artifact.top_contributors(inputs[anomalous])
+        else:
+            contributors = [None] * len(indices)
+        
+        anomalies = []
+        for i, top in zip(indices, contributors):
+            anomaly = {
+                'timestamp': pd.Timestamp.fromtimestamp(self.timestamps[i]).strftime('%Y-%m-%d %H:%M:%S'),
+                'score': round(float(self.scores[i]), 4),
+                'severity': SEVERITY_LEVELS[self.levels[i]],
+                'contributors': top
+            }
+            anomaly.update(zip(FEATURE_COLUMNS, self.features[i].tolist()))
+            anomalies.append(anomaly)
+        return anomalies
+    
+    def latest_score(self) -> Optional[float]:
+        """Score of the most recent sample, or None if it was not scored."""
+        if self.size == 0:
+            return None
+        score = self.scores[(self.position - 1) % self.window_size]
+        return None if np.isnan(score) else float(score)
+
 if __name__ == "__main__":
     # Example usage
     anomalies = detect_anomalies(get_resource_path("src/data/train_data.csv"), 100)
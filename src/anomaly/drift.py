@@ -0,0 +1,231 @@
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.database.store import MetricsStore
+from src.anomaly.registry import ModelArtifact
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = 'drift'
+
+# Floor on bin proportions so an empty bin does not make PSI infinite
+MIN_PROPORTION = 1e-4
+
+
+def reference_profile(X: np.ndarray, bins: int = 10) -> Dict[str, Any]:
+    """
+    Binned distribution of every training feature, saved with the artifact.
+
+    Bin edges are the training quantiles, so each bin starts with roughly
+    the same share of the data and live shifts show up wherever they happen.
+
+    Args:
+        X: Model input rows the forest was trained on
+        bins: Bins per feature
+
+    Returns:
+        JSON-friendly dictionary with per-feature ``edges`` and reference
+        ``proportions``
+    """
+    X = np.asarray(X, dtype=np.float64)
+    edges = np.quantile(X, np.linspace(0, 1, bins + 1)[1:-1], axis=0).T
+    indices = (X[:, :, None] > edges[None, :, :]).sum(axis=2)
+    counts = np.stack([np.bincount(indices[:, f], minlength=bins) for f in range(X.shape[1])])
+    return {
+        'bins': bins,
+        'edges': edges.tolist(),
+        'proportions': (counts / max(len(X), 1)).tolist(),
+        'samples': len(X)
+    }
+
+
+def psi(reference: np.ndarray, live: np.ndarray) -> np.ndarray:
+    """Population stability index per row of two (features, bins) proportion arrays."""
+    reference = np.maximum(reference, MIN_PROPORTION)
+    live = np.maximum(live, MIN_PROPORTION)
+    return ((live - reference) * np.log(live / reference)).sum(axis=1)
+
+
+def binned_ks(reference: np.ndarray, live: np.ndarray) -> np.ndarray:
+    """Kolmogorov-Smirnov distance per row, evaluated at the bin edges."""
+    return np.abs(np.cumsum(live, axis=1) - np.cumsum(reference, axis=1)).max(axis=1)
+
+
+class DriftMonitor:
+    """
+    Compares live model inputs with the training distribution of the current model.
+
+    Every sample adds one count per feature to a histogram over the
+    artifact's reference bins, in time buckets that together cover the last
+    ``window`` seconds; that is one comparison and one increment per
+    feature. Every ``check_interval`` seconds the buckets are summed and
+    PSI and KS are computed per feature. The share of values outside the
+    scaler's training range is tracked as well, which also covers models
+    saved before profiles existed.
+
+    When a check finds drift on enough samples, the ``on_drift`` callbacks
+    (request a retrain, notify the user) run at most once per ``cooldown``;
+    the last trigger time is persisted so restarts do not bypass it.
+    Swapping in a new model starts a fresh window against its own profile.
+    """
+
+    def __init__(self, window: float = 6 * 3600, bucket_seconds: float = 600,
+                 check_interval: float = 300, min_samples: int = 1800,
+                 psi_threshold: float = 0.25, out_of_range_threshold: float = 0.2,
+                 cooldown: float = 86400, store: Optional[MetricsStore] = None):
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = max(int(np.ceil(window / bucket_seconds)), 1)
+        self.check_interval = check_interval
+        self.min_samples = min_samples
+        self.psi_threshold = psi_threshold
+        self.out_of_range_threshold = out_of_range_threshold
+        self.cooldown = cooldown
+        self.store = store
+        self.on_drift: List[Callable[[Dict[str, Any]], None]] = []
+        self.latest: Optional[Dict[str, Any]] = None
+        self.last_trigger = self._load_last_trigger()
+        self._artifact: Optional[ModelArtifact] = None
+        self._last_check = 0.0
+
+    def _load_last_trigger(self) -> float:
+        if self.store is None:
+            return 0.0
+        data = self.store.load_state(STATE_NAME)
+        try:
+            return float(json.loads(data.decode())['last_trigger']) if data else 0.0
+        except (ValueError, KeyError, TypeError):
+            return 0.0
+
+    def _reset(self, artifact: ModelArtifact) -> None:
+        """Start an empty window against a (new) model's reference profile."""
+        self._artifact = artifact
+        n_features = len(artifact.feature_names)
+        profile = artifact.metadata.get('profile')
+        if profile and len(profile['edges']) == n_features:
+            self.edges = np.array(profile['edges'], dtype=np.float64)
+            self.reference = np.array(profile['proportions'], dtype=np.float64)
+            bins = self.reference.shape[1]
+        else:
+            self.edges = self.reference = None
+            bins = 1
+        self.counts = np.zeros((self.n_buckets, n_features, bins), dtype=np.int64)
+        self.outside = np.zeros((self.n_buckets, n_features), dtype=np.int64)
+        self.totals = np.zeros(self.n_buckets, dtype=np.int64)
+        self.bucket_ids = np.full(self.n_buckets, -1, dtype=np.int64)
+        self._features = np.arange(n_features)
+        self.latest = None
+
+    def update(self, timestamp: float, x: np.ndarray, artifact: ModelArtifact) -> Optional[Dict[str, Any]]:
+        """
+        Count one sample's model inputs.
+
+        Args:
+            timestamp: Sample time in epoch seconds
+            x: Model input row, as scored by ``artifact``
+            artifact: Model that scored the sample
+
+        Returns:
+            The drift report when this sample triggered a check, else None
+        """
+        if artifact is not self._artifact:
+            self._reset(artifact)
+        x = np.asarray(x, dtype=np.float64).ravel()
+
+        bucket = int(timestamp // self.bucket_seconds)
+        slot = bucket % self.n_buckets
+        if self.bucket_ids[slot] != bucket:
+            self.counts[slot] = 0
+            self.outside[slot] = 0
+            self.totals[slot] = 0
+            self.bucket_ids[slot] = bucket
+
+        if self.edges is not None:
+            self.counts[slot, self._features, (x[:, None] > self.edges).sum(axis=1)] += 1
+        scaled = artifact.transform(x[None, :])[0]
+        self.outside[slot] += (scaled < 0) | (scaled > 1)
+        self.totals[slot] += 1
+
+        if timestamp - self._last_check < self.check_interval:
+            return None
+        self._last_check = timestamp
+        return self.check(timestamp)
+
+    def check(self, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Score drift over the current window and trigger ``on_drift`` if needed.
+
+        Returns:
+            Report with per-feature ``psi``, ``ks`` and ``out_of_range``
+            scores, the ``worst`` feature and whether it ``drifted``, or
+            None before the first sample
+        """
+        if self._artifact is None:
+            return None
+        now = time.time() if now is None else now
+        current = int(now // self.bucket_seconds)
+        live = self.bucket_ids > current - self.n_buckets
+        samples = int(self.totals[live].sum())
+        names = self._artifact.feature_names
+
+        outside = self.outside[live].sum(axis=0) / max(samples, 1)
+        report: Dict[str, Any] = {
+            'timestamp': now,
+            'model_version': self._artifact.version,
+            'samples': samples,
+            'out_of_range': dict(zip(names, outside.round(4).tolist())),
+            'psi': None,
+            'ks': None
+        }
+        if self.reference is not None and samples:
+            proportions = self.counts[live].sum(axis=0) / samples
+            scores = psi(self.reference, proportions)
+            report['psi'] = dict(zip(names, scores.round(4).tolist()))
+            report['ks'] = dict(zip(names, binned_ks(self.reference, proportions).round(4).tolist()))
+            worst = int(np.argmax(scores))
+            drifted = scores[worst] > self.psi_threshold
+            report['worst'] = {'feature': names[worst], 'psi': round(float(scores[worst]), 4)}
+        else:
+            worst = int(np.argmax(outside))
+            drifted = outside[worst] > self.out_of_range_threshold
+            report['worst'] = {'feature': names[worst], 'out_of_range': round(float(outside[worst]), 4)}
+        report['drifted'] = bool(drifted and samples >= self.min_samples)
+        self.latest = report
+
+        if report['drifted'] and now - self.last_trigger >= self.cooldown:
+            self.last_trigger = now
+            if self.store is not None:
+                self.store.save_state(STATE_NAME, json.dumps({'last_trigger': now}).encode())
+            logger.warning(f"Feature drift detected for model {report['model_version']}: {report['worst']}")
+            for callback in self.on_drift:
+                try:
+                    callback(report)
+                except Exception as e:
+                    logger.error(f"Drift callback failed: {e}")
+        return report
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """Worst feature, sample count and drift flag of the latest check, for the GUI."""
+        if self.latest is None:
+            return None
+        return {key: self.latest[key] for key in ('model_version', 'samples', 'worst', 'drifted')}
+
+
+def drift_from_config(config: Dict[str, Any], store: Optional[MetricsStore] = None) -> Optional[DriftMonitor]:
+    """Build a DriftMonitor from the `anomaly.drift` config section, or None if disabled."""
+    drift_config = config.get('anomaly', {}).get('drift') or {}
+    if not drift_config.get('enabled', False):
+        return None
+    return DriftMonitor(
+        window=drift_config.get('window_hours', 6) * 3600,
+        bucket_seconds=drift_config.get('bucket_minutes', 10) * 60,
+        check_interval=drift_config.get('check_interval', 300),
+        min_samples=drift_config.get('min_samples', 1800),
+        psi_threshold=drift_config.get('psi_threshold', 0.25),
+        out_of_range_threshold=drift_config.get('out_of_range_threshold', 0.2),
+        cooldown=drift_config.get('cooldown_hours', 24) * 3600,
+        store=store
+    )
@@ -0,0 +1,336 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.anomaly.prefilter import PrefilterBank, build_detectors
+from src.anomaly.registry import EnsembleMember, ModelArtifact
+
+logger = logging.getLogger(__name__)
+
+# Deviation ratio beyond which a statistical detector's vote stops growing
+MAX_RATIO = 10.0
+
+# Flattened artifacts loaded by each pool worker, keyed by path and source mtime
+_worker_artifacts: Dict[Tuple[str, float], ModelArtifact] = {}
+
+
+def train_members(X_scaled: np.ndarray, feature_names: Sequence[str], specs: Dict[str, Sequence[str]],
+                  contamination: float = 0.2, random_state: Optional[int] = 42) -> List[EnsembleMember]:
+    """
+    Fit one IsolationForest per `anomaly.ensemble.members` entry.
+
+    Args:
+        X_scaled: Scaled model input rows the main forest was trained on
+        feature_names: Names of the columns of ``X_scaled``
+        specs: Member name to the features it sees; features the current
+            pipeline does not produce are skipped
+        contamination: Expected share of anomalies in the training data
+        random_state: Seed for the forests
+
+    Returns:
+        The trained members, in config order
+    """
+    from sklearn.ensemble import IsolationForest
+
+    index = {name: i for i, name in enumerate(feature_names)}
+    members = []
+    for name, features in (specs or {}).items():
+        available = [feature for feature in features if feature in index]
+        missing = sorted(set(features) - set(available))
+        if missing:
+            logger.warning(f"Ensemble member {name} skips unknown features {missing}")
+        if not available:
+            logger.warning(f"Ensemble member {name} has no features left, not training it")
+            continue
+        model = IsolationForest(contamination=contamination, random_state=random_state)
+        model.fit(X_scaled[:, [index[feature] for feature in available]])
+        members.append(EnsembleMember(name, available, model))
+    return members
+
+
+def ratio_scores(ratios: np.ndarray, scale: float) -> np.ndarray:
+    """
+    Map statistical detector ratios onto the forest's decision-function scale.
+
+    A ratio of 1 (the detector's firing limit) maps to 0, the anomaly
+    boundary; in-band samples score up to ``scale`` and larger deviations
+    go negative at the same rate. NaN (still warming up) stays NaN.
+    """
+    return scale * (1.0 - np.minimum(ratios, MAX_RATIO))
+
+
+class Voting:
+    """
+    Combines per-model scores into one decision-function score.
+
+    ``quorum`` returns, per row, the score at which the models holding
+    ``quorum`` of the total weight agree: the combined score is below a
+    severity cutoff exactly when that much weight scores below it, so one
+    model alone cannot raise (or suppress) an alert. ``mean`` is the
+    weighted average. Models without a score for a row (NaN) abstain.
+    """
+
+    METHODS = ('quorum', 'mean')
+
+    def __init__(self, method: str = 'quorum', quorum: float = 0.5,
+                 weights: Optional[Dict[str, float]] = None):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown voting method {method}, expected one of {self.METHODS}")
+        self.method = method
+        self.quorum = quorum
+        self.weights = dict(weights or {})
+
+    def combine(self, names: Sequence[str], scores: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            names: Model name of every column of ``scores``
+            scores: Array of shape ``(n, len(names))``
+
+        Returns:
+            Combined score per row, NaN where every model abstained
+        """
+        scores = np.atleast_2d(np.asarray(scores, dtype=np.float64))
+        weights = np.array([self.weights.get(name, 1.0) for name in names], dtype=np.float64)
+        voting = ~np.isnan(scores)
+        row_weights = np.where(voting, weights, 0.0)
+        totals = row_weights.sum(axis=1)
+
+        if self.method == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(voting, scores, 0.0) @ weights / totals
+
+        # Weighted order statistic: abstaining models sort last with no weight
+        order = np.argsort(np.where(voting, scores, np.inf), axis=1)
+        cumulative = np.cumsum(np.take_along_axis(row_weights, order, axis=1), axis=1)
+        reached = cumulative >= (self.quorum * totals)[:, None] - 1e-12
+        position = np.argmax(reached, axis=1)
+        combined = np.take_along_axis(scores, np.take_along_axis(order, position[:, None], axis=1), axis=1)[:, 0]
+        return np.where(totals > 0, combined, np.nan)
+
+
+def _score_slice(flat_path: str, mtime: float, inputs: str, outputs: str, shape: Tuple[int, int],
+                 n_models: int, member: int, start: int, stop: int) -> None:
+    """
+    Pool task: score rows ``start:stop`` of the shared input block with one model.
+
+    The scaled inputs and the ``(n, n_models)`` output block live in shared
+    memory, so only their names cross the process boundary.
+    """
+    key = (flat_path, mtime)
+    artifact = _worker_artifacts.get(key)
+    if artifact is None:
+        from src.anomaly.fast_forest import load_flat_artifact
+        artifact = load_flat_artifact(flat_path, mtime)
+        if artifact is None:
+            raise RuntimeError(f"Flattened model {flat_path} does not match mtime {mtime}")
+        _worker_artifacts.clear()
+        _worker_artifacts[key] = artifact
+
+    input_block = shared_memory.SharedMemory(name=inputs)
+    output_block = shared_memory.SharedMemory(name=outputs)
+    try:
+        X = np.ndarray(shape, dtype=np.float64, buffer=input_block.buf)
+        out = np.ndarray((shape[0], n_models), dtype=np.float64, buffer=output_block.buf)
+        out[start:stop, member] = artifact.score_member(member, X[start:stop])
+        del X, out
+    finally:
+        input_block.close()
+        output_block.close()
+
+
+def _lower_priority() -> None:
+    """Worker initializer: keep the GUI and collector ahead of batch scoring."""
+    if hasattr(os, 'nice'):
+        os.nice(5)
+
+
+class ScoringPool:
+    """
+    Persistent worker processes that score an ensemble over large batches.
+
+    Each batch is scaled once in the parent and copied into a shared-memory
+    block; every (model, row slice) pair is a task whose worker attaches to
+    the block, scores its slice with the flattened model it keeps loaded,
+    and writes the result into a shared output block. Workers are started
+    with ``spawn`` on first use and reused until ``shutdown``. Batches below
+    ``min_parallel_rows``, and models without a flattened copy, are scored
+    in-process, where the pool overhead would not pay off. One pool is
+    shared by the live detector and manual detection runs.
+    """
+
+    def __init__(self, flat_path: Optional[str], workers: int = 0, min_parallel_rows: int = 5000):
+        self.flat_path = flat_path
+        self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+        self.min_parallel_rows = min_parallel_rows
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_lower_priority
+                )
+            return self._executor
+
+    def score(self, artifact: ModelArtifact, X_scaled: np.ndarray) -> np.ndarray:
+        """
+        Decision function of every model in ``artifact.member_names`` order.
+
+        Args:
+            artifact: Model whose flattened copy the workers load
+            X_scaled: Scaled model input rows
+
+        Returns:
+            Array of shape ``(n, len(artifact.member_names))``
+        """
+        X_scaled = np.ascontiguousarray(X_scaled, dtype=np.float64)
+        n_models = len(artifact.member_names)
+        if len(X_scaled) < self.min_parallel_rows or not (self.flat_path and os.path.exists(self.flat_path)):
+            return np.column_stack([artifact.score_member(i, X_scaled) for i in range(n_models)])
+
+        try:
+            return self._score_shared(artifact, X_scaled, n_models)
+        except (BrokenProcessPool, RuntimeError) as e:
+            # A dead worker, or a flattened copy that no longer matches the model
+            logger.error(f"Scoring pool failed, scoring in-process: {e}")
+            if isinstance(e, BrokenProcessPool):
+                self.shutdown()
+            return np.column_stack([artifact.score_member(i, X_scaled) for i in range(n_models)])
+
+    def _score_shared(self, artifact: ModelArtifact, X_scaled: np.ndarray, n_models: int) -> np.ndarray:
+        n = len(X_scaled)
+        # Enough slices to keep every worker busy across all models
+        n_slices = max(int(np.ceil(self.workers / n_models)), 1)
+        bounds = np.linspace(0, n, n_slices + 1, dtype=np.int64)
+
+        inputs = shared_memory.SharedMemory(create=True, size=max(X_scaled.nbytes, 1))
+        outputs = shared_memory.SharedMemory(create=True, size=max(n * n_models * 8, 1))
+        try:
+            np.ndarray(X_scaled.shape, dtype=np.float64, buffer=inputs.buf)[:] = X_scaled
+            pool = self._pool()
+            futures = [
+                pool.submit(_score_slice, self.flat_path, artifact.mtime, inputs.name, outputs.name,
+                            X_scaled.shape, n_models, member, int(start), int(stop))
+                for member in range(n_models)
+                for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+            ]
+            for future in futures:
+                future.result()
+            return np.ndarray((n, n_models), dtype=np.float64, buffer=outputs.buf).copy()
+        finally:
+            inputs.close()
+            inputs.unlink()
+            outputs.close()
+            outputs.unlink()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+class EnsembleScorer:
+    """
+    Scores model inputs with every forest in the artifact plus the
+    statistical detectors, and combines them by voting.
+
+    The statistical detectors (`anomaly.prefilter` detector settings) vote
+    through ``ratio_scores`` of their deviation ratios, under the name of
+    each detector. Live samples pass the pre-filter's ratios in; batches
+    replay fresh detectors over the raw rows. Batch forest scoring goes
+    through the ScoringPool.
+    """
+
+    def __init__(self, voting: Voting, pool: ScoringPool, prefilter_config: Optional[Dict[str, Any]] = None,
+                 statistical: bool = True, statistical_scale: float = 0.1):
+        self.voting = voting
+        self.pool = pool
+        self.prefilter_config = prefilter_config or {}
+        self.statistical = statistical
+        self.statistical_scale = statistical_scale
+
+    def statistics(self, n_features: int) -> PrefilterBank:
+        """Fresh statistical detectors, for callers without a pre-filter to borrow ratios from."""
+        return PrefilterBank(build_detectors(self.prefilter_config, n_features),
+                             warmup=self.prefilter_config.get('warmup', 60))
+
+    def _statistical_scores(self, raw: np.ndarray,
+                            bank: Optional[PrefilterBank] = None) -> Tuple[List[str], np.ndarray]:
+        """Replay detectors over raw rows in time order; warmup rows abstain."""
+        bank = bank or self.statistics(raw.shape[1])
+        names = [detector.name for detector in bank.detectors]
+        ratios = np.full((len(raw), len(names)), np.nan)
+        for i, x in enumerate(raw):
+            row = bank.update(x)['ratios']
+            if row is not None:
+                ratios[i] = [row[name] for name in names]
+        return names, ratio_scores(ratios, self.statistical_scale)
+
+    def score(self, artifact: ModelArtifact, X: np.ndarray, raw: Optional[np.ndarray] = None,
+              ratios: Optional[Dict[str, float]] = None,
+              statistics: Optional[PrefilterBank] = None) -> Dict[str, Any]:
+        """
+        Combined score for model input rows.
+
+        Args:
+            artifact: Model to score with
+            X: Model input rows
+            raw: Raw FEATURE_COLUMNS rows behind ``X``, for the statistical votes of a batch
+            ratios: Pre-filter ratios of a single live sample, used instead of ``raw``
+            statistics: Detectors from ``statistics()`` to carry across the
+                chunks of a long batch; fresh ones are used otherwise
+
+        Returns:
+            Dictionary with the combined ``score`` per row, the model
+            ``names`` and their individual ``scores`` of shape ``(n, len(names))``
+        """
+        names = list(artifact.member_names)
+        scores = self.pool.score(artifact, artifact.transform(X))
+        if self.statistical and ratios is not None:
+            names += list(ratios)
+            stat = ratio_scores(np.array([list(ratios.values())], dtype=np.float64), self.statistical_scale)
+            scores = np.concatenate([scores, np.repeat(stat, len(scores), axis=0)], axis=1)
+        elif self.statistical and raw is not None:
+            stat_names, stat = self._statistical_scores(np.atleast_2d(raw), statistics)
+            names += stat_names
+            scores = np.concatenate([scores, stat], axis=1)
+        return {'score': self.voting.combine(names, scores), 'names': names, 'scores': scores}
+
+    def shutdown(self) -> None:
+        self.pool.shutdown()
+
+
+def ensemble_members(config: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Member forests to train from the `anomaly.ensemble` config section, empty if disabled."""
+    ensemble_config = config.get('anomaly', {}).get('ensemble') or {}
+    if not ensemble_config.get('enabled', False):
+        return {}
+    return dict(ensemble_config.get('members') or {})
+
+
+def ensemble_from_config(config: Dict[str, Any], flat_path: Optional[str] = None) -> Optional[EnsembleScorer]:
+    """Build an EnsembleScorer from the `anomaly.ensemble` config section, or None if disabled."""
+    anomaly_config = config.get('anomaly', {})
+    ensemble_config = anomaly_config.get('ensemble') or {}
+    if not ensemble_config.get('enabled', False):
+        return None
+    voting = ensemble_config.get('voting') or {}
+    return EnsembleScorer(
+        Voting(voting.get('method', 'quorum'), voting.get('quorum', 0.5), voting.get('weights')),
+        ScoringPool(flat_path, ensemble_config.get('workers', 0),
+                    ensemble_config.get('min_parallel_rows', 5000)),
+        prefilter_config=anomaly_config.get('prefilter'),
+        statistical=ensemble_config.get('statistical', True),
+        statistical_scale=ensemble_config.get('statistical_scale', 0.1)
+    )
@@ -0,0 +1,375 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.anomaly.features import FeaturePipeline
+from src.anomaly.registry import EnsembleMember, ModelArtifact
+
+logger = logging.getLogger(__name__)
+
+EULER_GAMMA = 0.5772156649015329
+
+# Bumped whenever the flattened layout changes, so stale caches are rebuilt
+FLAT_FORMAT = 2
+
+
+def get_resource_path(relative_path):
+    """Get the absolute path to bundled files when using PyInstaller."""
+    if getattr(sys, 'frozen', False):  # Running as a PyInstaller bundle
+        base_path = sys._MEIPASS
+    else:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+
+def average_path_length(n: np.ndarray) -> np.ndarray:
+    """Expected path length of an unsuccessful BST search over ``n`` points."""
+    n = np.asarray(n, dtype=np.float64)
+    result = np.zeros_like(n)
+    result[n == 2] = 1.0
+    large = n > 2
+    result[large] = 2.0 * (np.log(n[large] - 1.0) + EULER_GAMMA) - 2.0 * (n[large] - 1.0) / n[large]
+    return result
+
+
+class FlatScaler:
+    """MinMaxScaler reduced to its two parameter vectors."""
+
+    def __init__(self, scale: np.ndarray, offset: np.ndarray):
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.offset = np.asarray(offset, dtype=np.float64)
+
+    @classmethod
+    def from_sklearn(cls, scaler) -> 'FlatScaler':
+        return cls(scaler.scale_, scaler.min_)
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(X, dtype=np.float64) * self.scale + self.offset
+
+
+class FlatForest:
+    """
+    IsolationForest inference on contiguous numpy arrays.
+
+    The nodes of every tree are concatenated into flat ``feature``,
+    ``threshold``, ``left`` and ``right`` arrays. Leaves point to themselves.
+    ``value`` holds every node's expected path length (depth plus the
+    average-path-length correction for the training samples that reached
+    it), which at the leaves is the path length used for scoring. A batch is
+    scored by advancing one (sample, tree) cursor per level for all trees at
+    once, so the work is ``max_depth`` vectorized steps with no Python loop
+    over trees or samples.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray,
+                 right: np.ndarray, value: np.ndarray, roots: np.ndarray,
+                 max_depth: int, max_samples: int, offset: float):
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.right = np.ascontiguousarray(right, dtype=np.intp)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.max_samples = int(max_samples)
+        self.offset_ = float(offset)
+        self.denominator = len(self.roots) * float(average_path_length([self.max_samples])[0])
+
+    @classmethod
+    def from_sklearn(cls, model) -> 'FlatForest':
+        """Flatten a fitted ``sklearn.ensemble.IsolationForest``."""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        max_depth = 0
+        base = 0
+
+        for estimator, tree_features in zip(model.estimators_, model.estimators_features_):
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left == -1
+
+            # Node depths, root at 0; children always follow their parent
+            depth = np.zeros(n_nodes, dtype=np.int64)
+            for node in range(n_nodes):
+                if not is_leaf[node]:
+                    depth[tree.children_left[node]] = depth[node] + 1
+                    depth[tree.children_right[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+
+            own = np.arange(n_nodes) + base
+            tree_features = np.asarray(tree_features)
+            features.append(np.where(is_leaf, 0, tree_features[np.maximum(tree.feature, 0)]))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            lefts.append(np.where(is_leaf, own, tree.children_left + base))
+            rights.append(np.where(is_leaf, own, tree.children_right + base))
+            values.append(depth + average_path_length(tree.n_node_samples))
+            roots.append(base)
+            base += n_nodes
+
+        return cls(
+            np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts),
+            np.concatenate(rights), np.concatenate(values), np.array(roots),
+            max_depth, model.max_samples_, model.offset_
+        )
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node index reached by every sample in every tree."""
+        # Trees split on float32 copies of the input, so round the same way
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def attribute(self, X: np.ndarray) -> np.ndarray:
+        """
+        Per-feature share of the isolation of every sample.
+
+        Each split on a sample's path is credited to its feature with the
+        drop in expected path length from the node to the child the sample
+        follows. Splits that cut a sample off from most of the training data
+        drop it the most; splits that keep it with the crowd credit almost
+        nothing. Gains from all trees are summed with one ``bincount`` per
+        level.
+
+        Returns:
+            Array of shape ``(n_samples, n_features)`` whose rows sum to 1
+        """
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        n_samples, n_features = X.shape
+        rows = np.arange(n_samples)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_samples, len(self.roots))).copy()
+        contributions = np.zeros(n_samples * n_features)
+
+        for _ in range(self.max_depth):
+            internal = self.left[nodes] != nodes
+            features = self.feature[nodes]
+            go_left = X[rows, features] <= self.threshold[nodes]
+            children = np.where(go_left, self.left[nodes], self.right[nodes])
+            gain = np.maximum(self.value[nodes] - self.value[children], 0.0)
+            contributions += np.bincount((rows * n_features + features)[internal],
+                                         weights=gain[internal], minlength=n_samples * n_features)
+            nodes = children
+
+        contributions = contributions.reshape(n_samples, n_features)
+        totals = contributions.sum(axis=1, keepdims=True)
+        return np.divide(contributions, totals, out=np.zeros_like(contributions), where=totals > 0)
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        """Same values as ``IsolationForest.score_samples``."""
+        depths = self.value[self.leaves(X)].sum(axis=1)
+        if self.denominator == 0:
+            return -np.ones(depths.shape[0])
+        return -(2.0 ** (-depths / self.denominator))
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """Same values as ``IsolationForest.decision_function``."""
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+def flatten_artifact(artifact: ModelArtifact) -> ModelArtifact:
+    """Return a copy of an sklearn-backed artifact that runs on numpy only."""
+    return ModelArtifact(
+        FlatScaler.from_sklearn(artifact.scaler), FlatForest.from_sklearn(artifact.model),
+        artifact.version, artifact.path, artifact.mtime,
+        feature_names=artifact.feature_names, metadata=artifact.metadata,
+        pipeline=artifact.pipeline,
+        members=[EnsembleMember(member.name, member.features,
+                                member.model if isinstance(member.model, FlatForest)
+                                else FlatForest.from_sklearn(member.model))
+                 for member in artifact.members]
+    )
+
+
+def save_flat_artifact(path: str, artifact: ModelArtifact) -> None:
+    """
+    Write a flattened artifact as an ``.npz`` file.
+
+    The source mtime is stored with it so the registry can tell when the
+    cached copy is stale.
+    """
+    if not isinstance(artifact.model, FlatForest):
+        artifact = flatten_artifact(artifact)
+    forest, scaler = artifact.model, artifact.scaler
+
+    members = {}
+    for i, member in enumerate(artifact.members):
+        tree = member.model
+        members.update({
+            f"member{i}_{key}": value for key, value in (
+                ('feature', tree.feature), ('threshold', tree.threshold), ('left', tree.left),
+                ('right', tree.right), ('value', tree.value), ('roots', tree.roots),
+                ('max_depth', tree.max_depth), ('max_samples', tree.max_samples),
+                ('offset', tree.offset_)
+            )
+        })
+
+    temp_path = f"{path}.tmp-{os.getpid()}.npz"
+    np.savez(
+        temp_path,
+        format=FLAT_FORMAT,
+        feature=forest.feature, threshold=forest.threshold, left=forest.left,
+        right=forest.right, value=forest.value, roots=forest.roots,
+        max_depth=forest.max_depth, max_samples=forest.max_samples, offset=forest.offset_,
+        scaler_scale=scaler.scale, scaler_offset=scaler.offset,
+        version=artifact.version, source_mtime=artifact.mtime,
+        feature_names=np.array(artifact.feature_names),
+        metadata=json.dumps(artifact.metadata, default=lambda value: np.asarray(value).tolist()),
+        pipeline=json.dumps(artifact.pipeline.to_dict() if artifact.pipeline is not None else None),
+        members=json.dumps([{'name': member.name, 'features': member.features}
+                            for member in artifact.members]),
+        **members
+    )
+    os.replace(temp_path, path)
+    logger.info(f"Saved flattened model {artifact.version} to {path}")
+
+
+def _load_pipeline(data) -> Optional[FeaturePipeline]:
+    """Feature pipeline stored with a flattened artifact, None for raw-feature models."""
+    if 'pipeline' not in data:
+        return None
+    spec = json.loads(str(data['pipeline']))
+    return FeaturePipeline.from_dict(spec) if spec else None
+
+
+def _load_members(data) -> List[EnsembleMember]:
+    """Ensemble members stored with a flattened artifact."""
+    if 'members' not in data:
+        return []
+    members = []
+    for i, spec in enumerate(json.loads(str(data['members']))):
+        prefix = f"member{i}_"
+        forest = FlatForest(
+            data[prefix + 'feature'], data[prefix + 'threshold'], data[prefix + 'left'],
+            data[prefix + 'right'], data[prefix + 'value'], data[prefix + 'roots'],
+            int(data[prefix + 'max_depth']), int(data[prefix + 'max_samples']),
+            float(data[prefix + 'offset'])
+        )
+        members.append(EnsembleMember(spec['name'], spec['features'], forest))
+    return members
+
+
+def load_flat_artifact(path: str, source_mtime: Optional[float] = None) -> Optional[ModelArtifact]:
+    """
+    Load a flattened artifact without importing scikit-learn.
+
+    Returns:
+        The artifact, or None if the file is missing, in an older layout or
+        older than ``source_mtime``
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        if 'format' not in data or int(data['format']) != FLAT_FORMAT:
+            return None
+        mtime = float(data['source_mtime'])
+        if source_mtime is not None and mtime != source_mtime:
+            return None
+        forest = FlatForest(
+            data['feature'], data['threshold'], data['left'], data['right'], data['value'],
+            data['roots'], int(data['max_depth']), int(data['max_samples']), float(data['offset'])
+        )
+        scaler = FlatScaler(data['scaler_scale'], data['scaler_offset'])
+        return ModelArtifact(
+            scaler, forest, str(data['version']), path, mtime,
+            feature_names=[str(name) for name in data['feature_names']],
+            metadata=json.loads(str(data['metadata'])) if 'metadata' in data else None,
+            pipeline=_load_pipeline(data),
+            members=_load_members(data)
+        )
+
+
+def _time_cold(statement: str) -> float:
+    """Seconds a fresh interpreter needs to run ``statement``, imports included."""
+    # Import the app modules first so both formats are timed on the same base
+    code = (
+        "import time, src.anomaly.fast_forest; t = time.perf_counter(); "
+        f"{statement}; print(time.perf_counter() - t)"
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+        cwd=get_resource_path('.')
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def benchmark(model_path: str, scaler_path: str, flat_path: str,
+              batch_sizes=(1, 10, 100, 1000), repeats: int = 20) -> Dict[str, Any]:
+    """
+    Compare the flat engine with sklearn on latency, accuracy and load time.
+
+    Returns:
+        Report with per-sample latencies per batch size, the maximum score
+        difference and cold load times for both formats
+    """
+    import joblib
+
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+    artifact = ModelArtifact(scaler, model, 'benchmark', model_path, os.path.getmtime(model_path))
+    flat = flatten_artifact(artifact)
+    save_flat_artifact(flat_path, flat)
+
+    rng = np.random.default_rng(0)
+    low, high = scaler.data_min_, scaler.data_max_
+    report: Dict[str, Any] = {'batches': {}}
+
+    X = rng.uniform(low, high, size=(max(batch_sizes), len(low)))
+    X_scaled = scaler.transform(X)
+    report['max_abs_score_diff'] = float(np.max(np.abs(
+        model.score_samples(X_scaled) - flat.model.score_samples(flat.transform(X))
+    )))
+
+    for batch in batch_sizes:
+        X_batch = X[:batch]
+        timings = {}
+        for name, fn in (('sklearn', lambda: model.decision_function(scaler.transform(X_batch))),
+                         ('flat', lambda: flat.decision_function(X_batch))):
+            fn()
+            started = time.perf_counter()
+            for _ in range(repeats):
+                fn()
+            timings[name] = (time.perf_counter() - started) / repeats / batch * 1e6
+        report['batches'][batch] = {
+            'sklearn_us_per_sample': round(timings['sklearn'], 2),
+            'flat_us_per_sample': round(timings['flat'], 2),
+            'speedup': round(timings['sklearn'] / timings['flat'], 1)
+        }
+
+    report['cold_load_seconds'] = {
+        'sklearn': round(_time_cold(
+            f"import joblib; joblib.load({model_path!r}); joblib.load({scaler_path!r})"
+        ), 3),
+        'flat': round(_time_cold(
+            f"from src.anomaly.fast_forest import load_flat_artifact; load_flat_artifact({flat_path!r})"
+        ), 3)
+    }
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export and benchmark the numpy IsolationForest engine")
+    parser.add_argument('--model', default=get_resource_path('src/models/isolation_forest_model.pkl'))
+    parser.add_argument('--scaler', default=get_resource_path('src/models/scaler.pkl'))
+    parser.add_argument('--output', default=get_resource_path('src/models/anomaly_model.npz'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = benchmark(args.model, args.scaler, args.output)
+    print(f"Max |score difference| vs sklearn: {result['max_abs_score_diff']:.2e}")
+    for batch, row in result['batches'].items():
+        print(f"batch {batch:>5}: sklearn {row['sklearn_us_per_sample']:>9} us/sample, "
+              f"flat {row['flat_us_per_sample']:>7} us/sample ({row['speedup']}x)")
+    print(f"Cold load: sklearn {result['cold_load_seconds']['sklearn']}s, "
+          f"flat {result['cold_load_seconds']['flat']}s")
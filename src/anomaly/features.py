@@ -0,0 +1,221 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.database.db import FEATURE_COLUMNS
+
+# Denominators closer to zero than this give a ratio of zero
+MIN_DENOMINATOR = 1e-9
+
+
+class FeaturePipeline:
+    """
+    Derived model features computed from raw FEATURE_COLUMNS rows.
+
+    The pipeline keeps the raw columns that are not dropped and appends
+    per-sample deltas and rates, rolling means and standard deviations over
+    the last ``window`` samples, and cross-metric ratios. Samples further
+    apart than ``max_gap`` seconds (an app restart, say) start a new segment
+    so no derived value spans the gap. Training fits which outputs were
+    constant over the whole history and drops them.
+
+    The pipeline travels inside the model artifact, so training and
+    detection always compute exactly the same features; a change to the
+    `anomaly.features` config only takes effect with the next trained model.
+    """
+
+    def __init__(self, input_names: Sequence[str] = FEATURE_COLUMNS, drop: Sequence[str] = (),
+                 drop_constant: bool = True, delta: Sequence[str] = (), rate: Sequence[str] = (),
+                 window: int = 30, mean: Sequence[str] = (), std: Sequence[str] = (),
+                 ratios: Sequence[Sequence[str]] = (), max_gap: float = 30,
+                 constant: Optional[Sequence[str]] = None):
+        self.input_names = list(input_names)
+        self.drop = list(drop)
+        self.drop_constant = drop_constant
+        self.delta = list(delta)
+        self.rate = list(rate)
+        self.window = max(int(window), 1)
+        self.mean = list(mean)
+        self.std = list(std)
+        self.ratios = [tuple(pair) for pair in ratios]
+        self.max_gap = max_gap
+        self.constant = list(constant or [])
+
+        referenced = self.drop + self.delta + self.rate + self.mean + self.std \
+            + [name for pair in self.ratios for name in pair]
+        unknown = sorted(set(referenced) - set(self.input_names))
+        if unknown:
+            raise ValueError(f"Feature pipeline references unknown columns: {unknown}")
+        if any(len(pair) != 2 for pair in self.ratios):
+            raise ValueError("Each feature ratio needs exactly two columns")
+
+        index = {name: i for i, name in enumerate(self.input_names)}
+        self._raw = [index[name] for name in self.input_names if name not in self.drop]
+        self._delta = [index[name] for name in self.delta]
+        self._rate = [index[name] for name in self.rate]
+        self._rolling = [index[name] for name in dict.fromkeys(self.mean + self.std)]
+        rolling_names = list(dict.fromkeys(self.mean + self.std))
+        self._mean = [rolling_names.index(name) for name in self.mean]
+        self._std = [rolling_names.index(name) for name in self.std]
+        self._ratios = [(index[a], index[b]) for a, b in self.ratios]
+
+    @property
+    def computed_names(self) -> List[str]:
+        """Every column the pipeline computes, before constant ones are dropped."""
+        return (
+            [name for name in self.input_names if name not in self.drop]
+            + [f"{name}_delta" for name in self.delta]
+            + [f"{name}_rate" for name in self.rate]
+            + [f"{name}_mean{self.window}" for name in self.mean]
+            + [f"{name}_std{self.window}" for name in self.std]
+            + [f"{a}_per_{b}" for a, b in self.ratios]
+        )
+
+    @property
+    def output_names(self) -> List[str]:
+        """Model feature names, in column order."""
+        return [name for name in self.computed_names if name not in self.constant]
+
+    def keep_index(self) -> np.ndarray:
+        """Positions of ``output_names`` within ``computed_names``."""
+        constant = set(self.constant)
+        return np.array([i for i, name in enumerate(self.computed_names) if name not in constant],
+                        dtype=np.int64)
+
+    def fit_constant(self, data_range: np.ndarray) -> List[str]:
+        """
+        Record the computed columns whose range over the training history was zero.
+
+        Args:
+            data_range: Max minus min of every computed column, e.g. a fitted
+                MinMaxScaler's ``data_range_``
+
+        Returns:
+            Names of the columns that will be dropped
+        """
+        self.constant = [name for name, spread in zip(self.computed_names, data_range) if spread == 0] \
+            if self.drop_constant else []
+        if len(self.constant) == len(self.computed_names):
+            # Nothing would be left to train on; keep everything instead
+            self.constant = []
+        return self.constant
+
+    def stream(self) -> 'FeatureStream':
+        """Stateful transformer for rows arriving in time order."""
+        return FeatureStream(self)
+
+    def transform(self, timestamps: np.ndarray, X: np.ndarray) -> np.ndarray:
+        """Features of a self-contained batch of raw rows in time order."""
+        return self.stream().transform(timestamps, X)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'input_names': self.input_names, 'drop': self.drop, 'drop_constant': self.drop_constant,
+            'delta': self.delta, 'rate': self.rate, 'window': self.window, 'mean': self.mean,
+            'std': self.std, 'ratios': [list(pair) for pair in self.ratios],
+            'max_gap': self.max_gap, 'constant': self.constant
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'FeaturePipeline':
+        return cls(**data)
+
+
+class FeatureStream:
+    """
+    Applies a FeaturePipeline incrementally.
+
+    The last ``window`` raw rows are carried between calls in a small ring,
+    so feeding a history chunk by chunk, or a live stream one sample at a
+    time, gives the same features as one call over all the rows. Each call
+    is a handful of vectorized operations over the batch.
+    """
+
+    def __init__(self, pipeline: FeaturePipeline):
+        self.pipeline = pipeline
+        self.keep = pipeline.keep_index()
+        self.history = max(pipeline.window - 1, 1)
+        n_inputs = len(pipeline.input_names)
+        self.tail = np.full((self.history, n_inputs), np.nan)
+        self.tail_segments = np.full(self.history, -1, dtype=np.int64)
+        self.tail_times = np.full(self.history, np.nan)
+        self.segment = -1
+
+    def transform(self, timestamps: np.ndarray, X: np.ndarray) -> np.ndarray:
+        """
+        Features for the next raw rows.
+
+        Args:
+            timestamps: Epoch seconds, one per row, continuing the stream
+            X: Raw rows in the pipeline's ``input_names`` order
+
+        Returns:
+            Array of shape ``(len(X), len(output_names))``
+        """
+        p = self.pipeline
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=np.float64))
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        n = len(X)
+        if n == 0:
+            return np.empty((0, len(self.keep)))
+
+        # A gap, or time running backwards, starts a new segment
+        previous_times = np.concatenate([self.tail_times[-1:], timestamps[:-1]])
+        elapsed = timestamps - previous_times
+        breaks = ~(elapsed <= p.max_gap) | (elapsed < 0)
+        segments = self.segment + np.cumsum(breaks)
+
+        rows = np.concatenate([self.tail, X])
+        row_segments = np.concatenate([self.tail_segments, segments])
+        h = self.history
+
+        columns = [X[:, p._raw]]
+        if p._delta or p._rate:
+            same = row_segments[h - 1:h - 1 + n] == segments
+            previous = rows[h - 1:h - 1 + n]
+            if p._delta:
+                columns.append(np.where(same[:, None], X[:, p._delta] - previous[:, p._delta], 0.0))
+            if p._rate:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    rates = (X[:, p._rate] - previous[:, p._rate]) / elapsed[:, None]
+                columns.append(np.where((same & (elapsed > 0))[:, None], rates, 0.0))
+
+        if p._rolling:
+            # (n, columns, window) views over the carried rows plus the batch,
+            # masked to the current row's segment
+            windows = sliding_window_view(rows[:, p._rolling], p.window, axis=0)[-n:]
+            in_segment = (sliding_window_view(row_segments, p.window)[-n:] == segments[:, None])[:, None, :]
+            counts = in_segment.sum(axis=2)
+            means = np.where(in_segment, windows, 0.0).sum(axis=2) / counts
+            if p._mean:
+                columns.append(means[:, p._mean])
+            if p._std:
+                deviations = np.where(in_segment, windows - means[:, :, None], 0.0)
+                columns.append(np.sqrt((deviations[:, p._std] ** 2).sum(axis=2) / counts))
+
+        if p._ratios:
+            numerators = X[:, [a for a, _ in p._ratios]]
+            denominators = X[:, [b for _, b in p._ratios]]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = numerators / denominators
+            columns.append(np.where(np.abs(denominators) > MIN_DENOMINATOR, ratios, 0.0))
+
+        self.tail = rows[-h:]
+        self.tail_segments = row_segments[-h:]
+        self.tail_times = np.concatenate([self.tail_times, timestamps])[-h:]
+        self.segment = int(segments[-1])
+        return np.concatenate(columns, axis=1)[:, self.keep]
+
+
+def pipeline_from_settings(settings: Optional[Dict[str, Any]]) -> Optional[FeaturePipeline]:
+    """Build a FeaturePipeline from an `anomaly.features` section, or None to train on raw columns."""
+    settings = dict(settings or {})
+    if not settings.pop('enabled', False):
+        return None
+    return FeaturePipeline(**settings)
+
+
+def pipeline_from_config(config: Dict[str, Any]) -> Optional[FeaturePipeline]:
+    """Build the FeaturePipeline described by the `anomaly.features` config section."""
+    return pipeline_from_settings(config.get('anomaly', {}).get('features'))
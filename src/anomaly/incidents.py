@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.database.store import MetricsStore
+from src.anomaly.severity import SEVERITY_LEVELS
+
+logger = logging.getLogger(__name__)
+
+
+def make_incident_id(start: float) -> str:
+    """Stable incident ID derived from the incident's start time."""
+    return time.strftime('INC-%Y%m%d-%H%M%S', time.localtime(start))
+
+
+class Incident:
+    """A run of anomalous samples no more than ``merge_gap`` seconds apart."""
+
+    def __init__(self, start: float, incident_id: Optional[str] = None):
+        self.id = incident_id or make_incident_id(start)
+        self.start = start
+        self.end = start
+        self.peak_score = np.inf
+        self.level = 0
+        self.samples = 0
+        self.shares: Dict[str, float] = {}
+        self.comovements: List[Tuple[str, str, float]] = []
+        self.status = 'open'
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> 'Incident':
+        incident = cls(record['start'], record['id'])
+        incident.end = record['end']
+        incident.peak_score = record['peak_score'] if record['peak_score'] is not None else np.inf
+        incident.level = SEVERITY_LEVELS.index(record['severity']) if record['severity'] else 0
+        incident.samples = record['samples'] or 0
+        # Weight the stored ranking by sample count so new samples blend in
+        incident.shares = {name: share * incident.samples for name, share in record['contributors']}
+        incident.comovements = list(record.get('comovements') or [])
+        incident.status = record['status']
+        return incident
+
+    def add(self, timestamp: float, score: float, level: int,
+            contributors: Optional[Sequence[Tuple[str, float]]] = None,
+            comovements: Optional[Sequence[Tuple[str, str, float]]] = None) -> None:
+        self.start = min(self.start, timestamp)
+        self.end = max(self.end, timestamp)
+        self.peak_score = min(self.peak_score, score)
+        self.level = max(self.level, int(level))
+        self.samples += 1
+        self.status = 'open'
+        for name, share in contributors or ():
+            self.shares[name] = self.shares.get(name, 0.0) + share
+        if comovements:
+            self.comovements = list(comovements)
+
+    def contributors(self, top: int = 3) -> List[Tuple[str, float]]:
+        """Metrics that drove the incident, ranked by mean contribution."""
+        ranked = sorted(self.shares.items(), key=lambda item: item[1], reverse=True)[:top]
+        return [(name, round(total / max(self.samples, 1), 3)) for name, total in ranked]
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'start': self.start,
+            'end': self.end,
+            'peak_score': round(float(self.peak_score), 4) if np.isfinite(self.peak_score) else None,
+            'severity': SEVERITY_LEVELS[self.level],
+            'samples': self.samples,
+            'contributors': self.contributors(),
+            'comovements': self.comovements,
+            'status': self.status
+        }
+
+    def fingerprint(self) -> Tuple:
+        """Fields whose change is worth telling the GUI and alert channels about."""
+        record = self.to_record()
+        return (record['status'], record['severity'], record['peak_score'],
+                tuple(name for name, _ in record['contributors']),
+                tuple((first, second) for first, second, _ in record['comovements']))
+
+
+class IncidentTracker:
+    """
+    Merges anomalous samples into incidents and reports only what changed.
+
+    Samples closer than ``merge_gap`` seconds join the same incident, and an
+    incident closes once ``merge_gap`` seconds pass without a new anomaly.
+    Incidents are persisted in the store under an ID taken from their start
+    time, and a new anomaly that falls within ``merge_gap`` of a stored
+    incident continues it, so re-scoring the same data or restarting the
+    app never creates duplicates. ``observe`` and ``observe_batch`` return
+    an incident only when it is new or its status, severity, peak score,
+    leading metrics or co-moving metric pairs changed; a long incident that merely grows longer is
+    reported once when it opens and once when it closes. The stored record
+    is rewritten on every anomalous sample, so readers of the incidents
+    table see the open incident's current end, sample count and peak.
+
+    One tracker is shared by the live collection loop and manual batch
+    runs: calls are serialised, and a batch that reaches the live open
+    incident extends it in place rather than a stale stored copy, leaving
+    its closing to ``observe``.
+    """
+
+    def __init__(self, store: MetricsStore, merge_gap: float = 30):
+        self.store = store
+        self.merge_gap = merge_gap
+        self.current: Optional[Incident] = None
+        self._reported: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
+
+    def _continue_or_open(self, start: float, end: Optional[float] = None) -> Incident:
+        """Resume the stored incident within ``merge_gap`` of a span, or open a new one."""
+        end = start if end is None else end
+        current = self.current
+        if current is not None and start - self.merge_gap <= current.end and current.start <= end + self.merge_gap:
+            return current
+        stored = self.store.incidents(since=start - self.merge_gap,
+                                      until=end + self.merge_gap, limit=1)
+        if stored:
+            incident = Incident.from_record(stored[0])
+            self._reported.setdefault(incident.id, incident.fingerprint())
+            return incident
+        return Incident(start)
+
+    def _publish(self, incident: Incident, changed: List[Dict[str, Any]]) -> None:
+        """Persist an incident and queue it for listeners if it changed materially."""
+        fingerprint = incident.fingerprint()
+        record = incident.to_record()
+        self.store.upsert_incident(record)
+        if self._reported.get(incident.id) != fingerprint:
+            changed.append(record)
+        if incident.status == 'closed':
+            self._reported.pop(incident.id, None)
+        else:
+            self._reported[incident.id] = fingerprint
+
+    def _close(self, changed: List[Dict[str, Any]]) -> None:
+        self.current.status = 'closed'
+        self._publish(self.current, changed)
+        self.current = None
+
+    def observe(self, timestamp: float, score: Optional[float], level: int,
+                contributors: Optional[Sequence[Tuple[str, float]]] = None,
+                comovements: Optional[Sequence[Tuple[str, str, float]]] = None) -> List[Dict[str, Any]]:
+        """
+        Feed one scored sample.
+
+        Args:
+            timestamp: Sample time in epoch seconds
+            score: Decision-function score, None if the sample was not scored
+            level: Severity level index, 0 for normal
+            contributors: Ranked ``(feature, share)`` pairs for anomalous samples
+            comovements: ``(metric, metric, correlation)`` triples moving together
+                at this sample, e.g. from CorrelationEngine.comovements
+
+        Returns:
+            Incident records that are new or changed, usually none
+        """
+        changed: List[Dict[str, Any]] = []
+        with self._lock:
+            if self.current is not None and timestamp - self.current.end > self.merge_gap:
+                self._close(changed)
+
+            if level > 0 and score is not None:
+                if self.current is None:
+                    self.current = self._continue_or_open(timestamp)
+                self.current.add(timestamp, score, level, contributors, comovements)
+                self._publish(self.current, changed)
+        return changed
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Close the open incident, e.g. when a replay reaches the end of its data."""
+        changed: List[Dict[str, Any]] = []
+        with self._lock:
+            if self.current is not None:
+                self._close(changed)
+        return changed
+
+    def observe_batch(self, scored: pd.DataFrame) -> List[Dict[str, Any]]:
+        """
+        Group a scored batch, e.g. from ``detect_anomalies``, into incidents.
+
+        Args:
+            scored: Frame with ``timestamp``, ``score``, ``severity`` and
+                optionally ``contributors`` columns
+
+        Returns:
+            Incident records that are new or changed
+        """
+        # Timestamps in the CSV are local wall-clock times
+        timestamps = np.array([value.to_pydatetime().timestamp() for value in pd.to_datetime(scored['timestamp'])])
+        levels = scored['severity'].map(SEVERITY_LEVELS.index).to_numpy()
+        scores = scored['score'].to_numpy(dtype=np.float64)
+        contributors = scored['contributors'].to_numpy() if 'contributors' in scored else None
+
+        order = np.argsort(timestamps, kind='stable')
+        anomalous = order[levels[order] > 0]
+        if len(anomalous) == 0:
+            return []
+
+        # Split wherever consecutive anomalies are further apart than the gap
+        breaks = np.flatnonzero(np.diff(timestamps[anomalous]) > self.merge_gap) + 1
+        changed: List[Dict[str, Any]] = []
+        batch_end = timestamps[order[-1]]
+        with self._lock:
+            for group in np.split(anomalous, breaks):
+                incident = self._continue_or_open(timestamps[group[0]], timestamps[group[-1]])
+                # Samples inside a stored incident's span were counted when it was stored
+                known = (incident.start, incident.end) if incident.samples else (np.inf, -np.inf)
+                for i in group:
+                    if known[0] <= timestamps[i] <= known[1]:
+                        continue
+                    incident.add(timestamps[i], scores[i], levels[i],
+                                 contributors[i] if contributors is not None else None)
+                if incident is not self.current and batch_end - incident.end > self.merge_gap:
+                    incident.status = 'closed'
+                self._publish(incident, changed)
+        return changed
+
+    def recent(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recent stored incidents, for populating a fresh view."""
+        return self.store.incidents(limit=limit)
@@ -0,0 +1,207 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Floor on the spread estimates, so a feature that has been constant
+# (e.g. cpu_count_logical) fires on its first change instead of dividing by zero
+MIN_SCALE = 1e-9
+
+
+class EWMABand:
+    """
+    Exponentially weighted mean and variance per feature.
+
+    A sample fires when it leaves the band ``mean ± k * std``; ``ratio``
+    holds each feature's distance from the mean in units of that band.
+    """
+
+    name = 'ewma'
+
+    def __init__(self, n_features: int, alpha: float = 0.05, k: float = 4.0):
+        self.alpha = alpha
+        self.k = k
+        self.mean = np.zeros(n_features)
+        self.var = np.zeros(n_features)
+        self.ratio = np.zeros(n_features)
+        self.seeded = False
+
+    def update(self, x: np.ndarray, warm: bool) -> np.ndarray:
+        if not self.seeded:
+            # Start from the first sample rather than from zero
+            self.mean = x.copy()
+            self.seeded = True
+        diff = x - self.mean
+        self.ratio = np.abs(diff) / (self.k * np.maximum(np.sqrt(self.var), MIN_SCALE))
+        fired = self.ratio > 1
+        self.mean = self.mean + self.alpha * diff
+        self.var = (1 - self.alpha) * (self.var + self.alpha * diff ** 2)
+        return fired
+
+
+class RollingZScore:
+    """
+    Mean and standard deviation over the last ``window`` samples.
+
+    Running sums are updated as samples enter and leave a ring buffer, so
+    each update costs the same however long the window is.
+    """
+
+    name = 'zscore'
+
+    def __init__(self, n_features: int, window: int = 300, k: float = 4.0):
+        self.window = window
+        self.k = k
+        self.ring = np.zeros((window, n_features))
+        self.total = np.zeros(n_features)
+        self.total_sq = np.zeros(n_features)
+        self.ratio = np.zeros(n_features)
+        self.position = 0
+        self.size = 0
+
+    def update(self, x: np.ndarray, warm: bool) -> np.ndarray:
+        if self.size:
+            mean = self.total / self.size
+            std = np.sqrt(np.maximum(self.total_sq / self.size - mean ** 2, 0.0))
+            self.ratio = np.abs(x - mean) / (self.k * np.maximum(std, MIN_SCALE))
+        else:
+            self.ratio = np.zeros(len(x))
+        fired = self.ratio > 1
+
+        if self.size == self.window:
+            old = self.ring[self.position]
+            self.total -= old
+            self.total_sq -= old ** 2
+        else:
+            self.size += 1
+        self.ring[self.position] = x
+        self.total += x
+        self.total_sq += x ** 2
+        self.position = (self.position + 1) % self.window
+        return fired
+
+
+class StreamingMAD:
+    """
+    Median and median absolute deviation tracked by stochastic approximation.
+
+    Each estimate moves a small step towards the new sample (the "frugal"
+    streaming median), so it needs no window and costs O(1) per update,
+    while staying as robust to outliers as the exact rolling statistics.
+    """
+
+    name = 'mad'
+
+    def __init__(self, n_features: int, k: float = 5.0, rate: float = 0.05):
+        self.k = k
+        self.rate = rate
+        self.median = np.zeros(n_features)
+        self.mad = np.zeros(n_features)
+        self.ratio = np.zeros(n_features)
+        self.seeded = False
+
+    def update(self, x: np.ndarray, warm: bool) -> np.ndarray:
+        if not self.seeded:
+            self.median = x.copy()
+            self.seeded = True
+            return np.zeros(len(x), dtype=bool)
+
+        deviation = np.abs(x - self.median)
+        # 1.4826 * MAD estimates the standard deviation of normal data
+        self.ratio = deviation / (self.k * 1.4826 * np.maximum(self.mad, MIN_SCALE))
+        fired = self.ratio > 1
+
+        if warm:
+            # Steps scale with the current spread, so units do not matter
+            step = self.rate * np.maximum(self.mad, MIN_SCALE)
+            self.median += step * np.sign(x - self.median)
+            self.mad += step * np.sign(deviation - self.mad)
+        else:
+            # Converge quickly while warming up
+            self.median += self.rate * (x - self.median)
+            self.mad += self.rate * (deviation - self.mad)
+        return fired
+
+
+DETECTORS = {
+    'ewma': EWMABand,
+    'zscore': RollingZScore,
+    'mad': StreamingMAD
+}
+
+
+class PrefilterBank:
+    """
+    Cheap per-feature detectors that decide when the forest is worth running.
+
+    Every sample updates all detectors in O(1). The forest is consulted only
+    when at least one detector fires, or every ``forest_interval`` samples
+    so slow multivariate drifts are still caught. Hit counts are kept per
+    detector so the share of forest work avoided can be monitored.
+    """
+
+    def __init__(self, detectors: List[Any], forest_interval: int = 30, warmup: int = 60):
+        self.detectors = detectors
+        self.forest_interval = forest_interval
+        self.warmup = warmup
+        self.samples = 0
+        self.hits = {detector.name: 0 for detector in detectors}
+        self.forest_calls = 0
+        self._since_forest = 0
+
+    def update(self, x: np.ndarray) -> Dict[str, Any]:
+        """
+        Feed one raw feature row to every detector.
+
+        Returns:
+            Dictionary with ``fired`` (names of detectors that fired),
+            ``run_forest`` (whether the forest should score this sample)
+            and ``ratios``, each detector's largest deviation relative to
+            its firing limit (None while warming up)
+        """
+        x = np.asarray(x, dtype=np.float64).ravel()
+        warm = self.samples >= self.warmup
+        self.samples += 1
+
+        fired = []
+        for detector in self.detectors:
+            if detector.update(x, warm).any() and warm:
+                fired.append(detector.name)
+                self.hits[detector.name] += 1
+
+        self._since_forest += 1
+        run_forest = not warm or bool(fired) or self._since_forest >= self.forest_interval
+        if run_forest:
+            self.forest_calls += 1
+            self._since_forest = 0
+        ratios = {detector.name: float(detector.ratio.max()) for detector in self.detectors} if warm else None
+        return {'fired': fired, 'run_forest': run_forest, 'ratios': ratios}
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-detector hit rates and the share of samples that skipped the forest."""
+        samples = max(self.samples, 1)
+        return {
+            'samples': self.samples,
+            'hit_rates': {name: round(hits / samples, 4) for name, hits in self.hits.items()},
+            'forest_calls': self.forest_calls,
+            'forest_skipped': round(1 - self.forest_calls / samples, 4) if self.samples else 0.0
+        }
+
+
+def build_detectors(prefilter_config: Dict[str, Any], n_features: int) -> List[Any]:
+    """Fresh detectors for every detector section present in `anomaly.prefilter`."""
+    return [
+        DETECTORS[name](n_features, **(prefilter_config.get(name) or {}))
+        for name in DETECTORS if name in prefilter_config
+    ]
+
+
+def prefilter_from_config(config: Dict[str, Any], n_features: int) -> Optional[PrefilterBank]:
+    """Build a PrefilterBank from the `anomaly.prefilter` config section, or None if disabled."""
+    prefilter_config = config.get('anomaly', {}).get('prefilter') or {}
+    if not prefilter_config.get('enabled', False):
+        return None
+    return PrefilterBank(
+        build_detectors(prefilter_config, n_features),
+        forest_interval=prefilter_config.get('forest_interval', 30),
+        warmup=prefilter_config.get('warmup', 60)
+    )
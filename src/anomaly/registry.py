@@ -0,0 +1,313 @@
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.database.db import FEATURE_COLUMNS
+from src.anomaly.features import FeaturePipeline, FeatureStream
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT = 1
+
+
+class EnsembleMember:
+    """An extra forest trained on a subset of the artifact's features."""
+
+    def __init__(self, name: str, features: Sequence[str], model):
+        self.name = name
+        self.features = list(features)
+        self.model = model
+
+
+class ModelArtifact:
+    """
+    A fitted scaler and IsolationForest that are always used together.
+
+    Models trained with a FeaturePipeline carry it as ``pipeline``; the
+    scoring methods take its output rows, which ``features()`` or a
+    ``feature_stream()`` compute from raw FEATURE_COLUMNS rows. Without a
+    pipeline the model was trained on the raw columns themselves. Ensemble
+    ``members`` share the scaler and score their own feature subsets.
+    """
+
+    def __init__(self, scaler, model, version: str, path: str, mtime: float,
+                 feature_names: Sequence[str] = FEATURE_COLUMNS,
+                 metadata: Optional[Dict[str, Any]] = None,
+                 pipeline: Optional[FeaturePipeline] = None,
+                 members: Sequence[EnsembleMember] = ()):
+        self.scaler = scaler
+        self.model = model
+        self.version = version
+        self.path = path
+        self.mtime = mtime
+        self.feature_names = list(feature_names)
+        self.metadata = metadata or {}
+        self.pipeline = pipeline
+        self.members = list(members)
+        index = {name: i for i, name in enumerate(self.feature_names)}
+        self.member_columns = [np.array([index[name] for name in member.features], dtype=np.intp)
+                               for member in self.members]
+        self._flat_model = None
+
+    def features(self, timestamps: np.ndarray, X: np.ndarray) -> np.ndarray:
+        """Model input rows for a batch of raw FEATURE_COLUMNS rows in time order."""
+        if self.pipeline is None:
+            return np.asarray(X, dtype=np.float64)
+        return self.pipeline.transform(timestamps, X)
+
+    def feature_stream(self) -> Optional[FeatureStream]:
+        """Incremental version of ``features()`` for live samples, None without a pipeline."""
+        return self.pipeline.stream() if self.pipeline is not None else None
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Scale model input rows the way the model was trained."""
+        return self.scaler.transform(np.asarray(X, dtype=np.float64))
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """Anomaly scores for model input rows; negative means anomalous."""
+        return self.model.decision_function(self.transform(X))
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        """Raw IsolationForest scores for model input rows."""
+        return self.model.score_samples(self.transform(X))
+
+    @property
+    def member_names(self) -> List[str]:
+        """Names of the scoring models: ``forest`` for the main one, then the members."""
+        return ['forest'] + [member.name for member in self.members]
+
+    def score_member(self, index: int, X_scaled: np.ndarray) -> np.ndarray:
+        """Decision function of one model in ``member_names`` order on scaled rows."""
+        if index == 0:
+            return self.model.decision_function(X_scaled)
+        return self.members[index - 1].model.decision_function(X_scaled[:, self.member_columns[index - 1]])
+
+    def member_scores(self, X: np.ndarray) -> np.ndarray:
+        """Decision function of every model for model input rows, shape ``(n, len(member_names))``."""
+        X_scaled = self.transform(X)
+        return np.column_stack([self.score_member(i, X_scaled) for i in range(len(self.member_names))])
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Labels for model input rows: -1 anomalous, 1 normal."""
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    def explain(self, X: np.ndarray) -> np.ndarray:
+        """
+        Per-feature contribution to the anomaly score of model input rows.
+
+        Returns:
+            Array of shape ``(n_samples, n_features)``, rows summing to 1,
+            columns in ``feature_names`` order
+        """
+        model = self.model
+        if not hasattr(model, 'attribute'):
+            # Imported here: fast_forest depends on this module
+            from src.anomaly.fast_forest import FlatForest
+
+            if self._flat_model is None:
+                self._flat_model = FlatForest.from_sklearn(model)
+            model = self._flat_model
+        return model.attribute(self.transform(X))
+
+    def top_contributors(self, X: np.ndarray, top: int = 3) -> List[List[Tuple[str, float]]]:
+        """
+        Ranked ``(feature, share)`` pairs for each model input row.
+
+        Args:
+            X: Model input rows
+            top: Number of features to keep per row
+        """
+        contributions = self.explain(X)
+        ranked = np.argsort(-contributions, axis=1)[:, :top]
+        shares = np.take_along_axis(contributions, ranked, axis=1).round(3)
+        names = np.array(self.feature_names)[ranked]
+        return [list(zip(row_names.tolist(), row_shares.tolist()))
+                for row_names, row_shares in zip(names, shares)]
+
+
+def save_artifact(path: str, scaler, model, version: Optional[str] = None,
+                  feature_names: Optional[Sequence[str]] = None,
+                  pipeline: Optional[FeaturePipeline] = None,
+                  members: Sequence[EnsembleMember] = (), **metadata) -> str:
+    """
+    Write a scaler, model and feature pipeline as one versioned artifact.
+
+    The bundle is written to a temporary file and renamed into place, so a
+    reader never sees a half-written or mismatched pair. Feature names
+    default to the pipeline's outputs, or FEATURE_COLUMNS without one.
+
+    Returns:
+        The artifact version
+    """
+    import joblib
+
+    version = version or datetime.now().strftime('%Y%m%d-%H%M%S')
+    if feature_names is None:
+        feature_names = pipeline.output_names if pipeline is not None else FEATURE_COLUMNS
+    bundle = {
+        'format': ARTIFACT_FORMAT,
+        'version': version,
+        'created': datetime.now().isoformat(),
+        'feature_names': list(feature_names),
+        'scaler': scaler,
+        'model': model,
+        'pipeline': pipeline.to_dict() if pipeline is not None else None,
+        'members': [{'name': member.name, 'features': member.features, 'model': member.model}
+                    for member in members],
+        'metadata': metadata
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    joblib.dump(bundle, temp_path)
+    os.replace(temp_path, path)
+    logger.info(f"Saved model artifact {version} to {path}")
+    return version
+
+
+class ModelRegistry:
+    """
+    Loads the anomaly model off the startup path and hot-swaps it on change.
+
+    Nothing is unpickled until ``load()`` or ``start()`` is called, so
+    importing the detector no longer pulls in scikit-learn. With a
+    ``flat_path`` the model is converted once to the numpy engine in
+    ``fast_forest`` and cached there, so later starts skip scikit-learn
+    entirely. The watcher thread reloads the artifact when its mtime changes
+    and replaces the current artifact in a single reference assignment, so
+    callers that took an artifact from ``get()`` keep a consistent
+    scaler/model pair.
+    """
+
+    def __init__(self, artifact_path: str, legacy_paths: Optional[Tuple[str, str]] = None,
+                 flat_path: Optional[str] = None):
+        self.artifact_path = artifact_path
+        self.legacy_paths = legacy_paths
+        self.flat_path = flat_path
+        self._artifact: Optional[ModelArtifact] = None
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self) -> Optional[ModelArtifact]:
+        """Return the current artifact, or None while it is still loading."""
+        return self._artifact
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[ModelArtifact]:
+        """Return the current artifact, loading it now if nobody has yet."""
+        if self._artifact is None and self._thread is None:
+            self.load()
+        self._loaded.wait(timeout)
+        return self._artifact
+
+    def _source_mtime(self) -> Optional[float]:
+        if os.path.exists(self.artifact_path):
+            return os.path.getmtime(self.artifact_path)
+        if self.legacy_paths and all(os.path.exists(p) for p in self.legacy_paths):
+            return max(os.path.getmtime(p) for p in self.legacy_paths)
+        return None
+
+    def _read_sklearn_artifact(self) -> ModelArtifact:
+        import joblib
+
+        if os.path.exists(self.artifact_path):
+            mtime = os.path.getmtime(self.artifact_path)
+            bundle = joblib.load(self.artifact_path)
+            return ModelArtifact(
+                bundle['scaler'], bundle['model'], bundle['version'], self.artifact_path, mtime,
+                feature_names=bundle.get('feature_names', FEATURE_COLUMNS),
+                metadata=bundle.get('metadata'),
+                pipeline=FeaturePipeline.from_dict(bundle['pipeline']) if bundle.get('pipeline') else None,
+                members=[EnsembleMember(member['name'], member['features'], member['model'])
+                         for member in bundle.get('members') or []]
+            )
+
+        if not self.legacy_paths:
+            raise FileNotFoundError(f"Model artifact not found: {self.artifact_path}")
+
+        # Fall back to the separately pickled model and scaler
+        model_path, scaler_path = self.legacy_paths
+        mtime = self._source_mtime()
+        if mtime is None:
+            raise FileNotFoundError(f"Model files not found: {model_path}, {scaler_path}")
+        model = joblib.load(model_path)
+        scaler = joblib.load(scaler_path)
+        return ModelArtifact(scaler, model, f"legacy-{int(mtime)}", model_path, mtime)
+
+    def _read_artifact(self) -> ModelArtifact:
+        if not self.flat_path:
+            return self._read_sklearn_artifact()
+
+        # Imported here: fast_forest depends on this module
+        from src.anomaly.fast_forest import flatten_artifact, load_flat_artifact, save_flat_artifact
+
+        # A flat copy made from the current source file needs neither
+        # scikit-learn nor unpickling
+        mtime = self._source_mtime()
+        if mtime is not None:
+            try:
+                cached = load_flat_artifact(self.flat_path, mtime)
+                if cached is not None:
+                    return cached
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable flattened model {self.flat_path}: {e}")
+
+        artifact = flatten_artifact(self._read_sklearn_artifact())
+        try:
+            save_flat_artifact(self.flat_path, artifact)
+        except OSError as e:
+            logger.warning(f"Could not cache flattened model: {e}")
+        return artifact
+
+    def load(self) -> Optional[ModelArtifact]:
+        """Load the artifact from disk and make it current."""
+        with self._lock:
+            try:
+                artifact = self._read_artifact()
+            except Exception as e:
+                logger.error(f"Failed to load anomaly model: {e}")
+                self._loaded.set()
+                return self._artifact
+
+            previous = self._artifact
+            self._artifact = artifact
+            self._loaded.set()
+
+        if previous is None:
+            logger.info(f"Anomaly model {artifact.version} loaded from {artifact.path}")
+        else:
+            logger.info(f"Anomaly model swapped from {previous.version} to {artifact.version}")
+        return artifact
+
+    def check_for_update(self) -> bool:
+        """Reload the artifact if its file changed since it was loaded."""
+        mtime = self._source_mtime()
+        current = self._artifact
+        if mtime is None or (current is not None and mtime == current.mtime):
+            return False
+        return self.load() is not current
+
+    def start(self, stop_event: threading.Event, poll_interval: float = 30) -> None:
+        """
+        Load the model on a background thread, then watch it for changes.
+
+        Args:
+            stop_event: Event that ends the watcher
+            poll_interval: Seconds between mtime checks
+        """
+        if self._thread is not None:
+            return
+
+        def watch():
+            self.load()
+            while not stop_event.wait(timeout=poll_interval):
+                try:
+                    self.check_for_update()
+                except OSError as e:
+                    logger.error(f"Model watcher error: {e}")
+
+        self._thread = threading.Thread(target=watch, name="model_registry", daemon=True)
+        self._thread.start()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import yaml
+
+from src.database.store import MetricsStore, resolve_db_path
+from src.anomaly.baselines import baseline_from_config
+from src.anomaly.detect import StreamingDetector, get_resource_path, model_registry
+from src.anomaly.drift import drift_from_config
+from src.anomaly.ensemble import ensemble_from_config
+from src.anomaly.incidents import IncidentTracker
+from src.anomaly.prefilter import prefilter_from_config
+from src.anomaly.registry import ModelRegistry
+from src.anomaly.sampling import Chunk, iter_csv_chunks, iter_store_chunks
+from src.anomaly.severity import SEVERITY_LEVELS, thresholds_for_host
+from src.anomaly.sketches import KLLSketch
+from src.database.db import FEATURE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimings:
+    """
+    Wall time spent in each pipeline stage.
+
+    Every measurement goes into a KLL sketch per stage, so a month of
+    samples reports median and tail latencies in bounded memory.
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.sketches: Dict[str, KLLSketch] = {}
+        self.totals: Dict[str, float] = {}
+        self.maxima: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        sketch = self.sketches.get(name)
+        if sketch is None:
+            sketch = self.sketches[name] = KLLSketch(self.k)
+            self.totals[name] = self.maxima[name] = 0.0
+        sketch.update(seconds)
+        self.totals[name] += seconds
+        self.maxima[name] = max(self.maxima[name], seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Calls, total seconds and mean, p50, p99 and max microseconds per stage."""
+        return {
+            name: {
+                'calls': sketch.count,
+                'total_seconds': round(self.totals[name], 3),
+                'mean_us': round(self.totals[name] / sketch.count * 1e6, 1),
+                'p50_us': round(sketch.quantile(0.5) * 1e6, 1),
+                'p99_us': round(sketch.quantile(0.99) * 1e6, 1),
+                'max_us': round(self.maxima[name] * 1e6, 1)
+            }
+            for name, sketch in self.sketches.items()
+        }
+
+
+def replay(chunks: Iterator[Chunk], config: Dict[str, Any], registry: Optional[ModelRegistry] = None,
+           speed: float = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Stream recorded samples through the live detection and incident pipeline.
+
+    The detector is built from the config exactly as the app builds it
+    (pre-filter, ensemble, drift monitor and a fresh hour-of-week
+    baseline), but incidents and learned state go to a throwaway store, so
+    a replay never touches the app's database.
+
+    Args:
+        chunks: ``(timestamps, features)`` chunks in time order, e.g. from
+            iter_store_chunks or iter_csv_chunks
+        config: Parsed config.yaml
+        registry: Model to evaluate, defaults to the app's model
+        speed: Multiple of real time to replay at; 0 replays as fast as possible
+        limit: Stop after this many samples
+
+    Returns:
+        Report with sample counts, throughput, per-stage latencies, severity
+        counts, drift checks and the incidents produced, oldest first
+    """
+    registry = registry or model_registry
+    if registry.wait() is None:
+        raise RuntimeError("Anomaly model is not available")
+
+    timings = StageTimings()
+    with tempfile.TemporaryDirectory() as scratch:
+        store = MetricsStore(os.path.join(scratch, 'replay.db'))
+        drift = drift_from_config(config)
+        ensemble = ensemble_from_config(config, registry.flat_path)
+        detector = StreamingDetector(
+            config['anomaly']['window_size'],
+            registry=registry,
+            thresholds=thresholds_for_host(config),
+            prefilter=prefilter_from_config(config, len(FEATURE_COLUMNS)),
+            baseline=baseline_from_config(config, store),
+            seasonal_k=config['anomaly']['baselines'].get('k', 4.0),
+            drift=drift,
+            ensemble=ensemble,
+            timings=timings
+        )
+        tracker = IncidentTracker(store, config['anomaly']['incidents']['merge_gap'])
+
+        incidents: Dict[str, Dict[str, Any]] = {}
+        severities = dict.fromkeys(SEVERITY_LEVELS, 0)
+        drift_checks: List[Dict[str, Any]] = []
+        samples = 0
+        first = last = last_check = None
+        started = time.perf_counter()
+        rows = ((timestamp, x) for timestamps, X in chunks for timestamp, x in zip(timestamps.tolist(), X))
+        try:
+            for timestamp, x in islice(rows, limit):
+                if first is None:
+                    first = timestamp
+                elif speed > 0:
+                    # Hold back until the sample is due at the requested speed
+                    delay = started + (timestamp - first) / speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                last = timestamp
+
+                with timings.stage('total'):
+                    result = detector.update_row(timestamp, x)
+                    level = SEVERITY_LEVELS.index(result['severity']) if result['severity'] else 0
+                    with timings.stage('incidents'):
+                        changed = tracker.observe(timestamp, result['score'], level, result['contributors'])
+                severities[SEVERITY_LEVELS[level]] += 1
+                incidents.update((record['id'], record) for record in changed)
+                if drift is not None and drift.latest is not None and drift.latest is not last_check:
+                    last_check = drift.latest
+                    drift_checks.append(dict(drift.summary(), timestamp=last_check['timestamp']))
+                samples += 1
+            incidents.update((record['id'], record) for record in tracker.close())
+        finally:
+            elapsed = time.perf_counter() - started
+            if ensemble is not None:
+                ensemble.shutdown()
+            store.close()
+
+    span = (last - first) if samples > 1 else 0.0
+    return {
+        'model_version': registry.get().version,
+        'samples': samples,
+        'start': first,
+        'end': last,
+        'seconds': round(elapsed, 3),
+        'samples_per_second': round(samples / elapsed, 1) if elapsed > 0 else None,
+        'speedup': round(span / elapsed, 1) if elapsed > 0 else None,
+        'severity_counts': severities,
+        'prefilter': detector.prefilter_stats(),
+        'stages': timings.report(),
+        'drift_checks': len(drift_checks),
+        'drifted': [check for check in drift_checks if check['drifted']],
+        'incidents': sorted(incidents.values(), key=lambda record: record['start'])
+    }
+
+
+def _epoch(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"Model {report['model_version']}: {report['samples']} samples in {report['seconds']}s "
+          f"({report['samples_per_second']} samples/s, {report['speedup']}x real time)")
+    print("Severity counts: " + ", ".join(f"{name} {count}" for name, count in report['severity_counts'].items()))
+    print(f"{'stage':<10} {'calls':>9} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'max us':>10}")
+    for name, stage in report['stages'].items():
+        print(f"{name:<10} {stage['calls']:>9} {stage['mean_us']:>9} {stage['p50_us']:>9} "
+              f"{stage['p99_us']:>9} {stage['max_us']:>10}")
+    if report['drifted']:
+        print(f"Drift flagged in {len(report['drifted'])} of {report['drift_checks']} checks, "
+              f"first on {report['drifted'][0]['worst']}")
+    print(f"{len(report['incidents'])} incidents")
+    for incident in report['incidents']:
+        start = datetime.fromtimestamp(incident['start']).strftime('%Y-%m-%d %H:%M:%S')
+        top = ", ".join(name for name, _ in incident['contributors'])
+        print(f"  {incident['id']}  {start}  {incident['end'] - incident['start']:>7.0f}s  "
+              f"{incident['severity']:<8} peak {incident['peak_score']}  {incident['samples']} samples  {top}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded metrics through the anomaly pipeline")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--csv', help="Metrics CSV to replay instead of the metrics store")
+    source.add_argument('--db', help="SQLite metrics store, defaults to the one in config.yaml")
+    parser.add_argument('--since', help="ISO date or time to start from (store only)")
+    parser.add_argument('--until', help="ISO date or time to stop at (store only)")
+    parser.add_argument('--model', help="Model bundle to evaluate, defaults to the app's model")
+    parser.add_argument('--speed', type=float, default=0, help="Multiple of real time; 0 replays as fast as possible")
+    parser.add_argument('--limit', type=int, help="Stop after this many samples")
+    parser.add_argument('--config', default=get_resource_path('config/config.yaml'))
+    parser.add_argument('--json', help="Also write the full report to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file)
+    chunk_size = (config['anomaly'].get('training') or {}).get('chunk_size', 10000)
+
+    if args.csv:
+        chunks = iter_csv_chunks(args.csv, chunk_size=chunk_size)
+    else:
+        path = args.db or resolve_db_path(config['database']['url'], get_resource_path('src/data'))
+        chunks = iter_store_chunks(MetricsStore(path), start=_epoch(args.since), end=_epoch(args.until),
+                                   chunk_size=chunk_size)
+    registry = None
+    if args.model:
+        registry = ModelRegistry(args.model, flat_path=f"{os.path.splitext(args.model)[0]}.npz")
+
+    result = replay(chunks, config, registry, speed=args.speed, limit=args.limit)
+    _print_report(result)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(result, file, indent=2, default=lambda value: np.asarray(value).tolist())
@@ -0,0 +1,279 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from threading import Event
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from src.database.db import FEATURE_COLUMNS
+from src.database.store import MetricsStore
+from src.anomaly.drift import reference_profile
+from src.anomaly.ensemble import ensemble_members, train_members
+from src.anomaly.features import FeaturePipeline, pipeline_from_settings
+from src.anomaly.sampling import ReservoirSampler, iter_store_chunks, load_training_sample
+from src.anomaly.registry import ModelArtifact, ModelRegistry, save_artifact
+
+logger = logging.getLogger(__name__)
+
+
+def train_model(X: np.ndarray, contamination: float = 0.2, random_state: Optional[int] = 42,
+                scaler=None):
+    """
+    Fit the MinMaxScaler and IsolationForest used for detection.
+
+    Args:
+        X: Model input rows: raw FEATURE_COLUMNS or feature pipeline output
+        contamination: Expected share of anomalies in the training data
+        random_state: Seed for the forest
+        scaler: Scaler already fitted on the full history, e.g. by
+            load_training_sample; fitted on ``X`` when omitted
+
+    Returns:
+        Tuple of the fitted scaler and model
+    """
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import MinMaxScaler
+
+    if scaler is None:
+        scaler = MinMaxScaler().fit(X)
+    X_scaled = scaler.transform(X)
+    model = IsolationForest(contamination=contamination, random_state=random_state)
+    model.fit(X_scaled)
+    return scaler, model
+
+
+def load_holdout(store: MetricsStore, start: float, size: int,
+                 pipeline: Optional[FeaturePipeline] = None, chunk_size: int = 10000) -> np.ndarray:
+    """
+    Uniform sample of up to ``size`` model input rows recorded since ``start``.
+
+    Args:
+        store: Metrics store to read from
+        start: Epoch seconds where the holdout begins
+        size: Rows to keep
+        pipeline: Fitted feature pipeline of the candidate, None for raw columns
+        chunk_size: Rows per query
+    """
+    stream = pipeline.stream() if pipeline is not None else None
+    n_features = len(pipeline.output_names) if pipeline is not None else len(FEATURE_COLUMNS)
+    sampler = ReservoirSampler(size, n_features, np.random.default_rng())
+    for timestamps, X in iter_store_chunks(store, start=start, chunk_size=chunk_size):
+        if len(X):
+            sampler.add(stream.transform(timestamps, X) if stream is not None else X)
+    return sampler.sample()
+
+
+def validate(candidate: ModelArtifact, current: Optional[ModelArtifact], holdout: np.ndarray,
+             contamination: float, tolerance: float) -> Dict[str, Any]:
+    """
+    Decide whether a freshly trained model should replace the current one.
+
+    The candidate must flag roughly ``contamination`` of recent, unseen data,
+    and must do so at least as well as the current model does; a model that
+    flags far more or far less than expected on normal recent traffic is
+    the symptom retraining is meant to fix. The holdout holds the
+    candidate's features, so a current model built on a different feature
+    pipeline cannot be compared and the candidate is judged on its own.
+
+    Returns:
+        Report with anomaly rates and the ``accepted`` decision
+    """
+    candidate_scores = candidate.decision_function(holdout)
+    candidate_rate = float(np.mean(candidate_scores < 0))
+    report = {
+        'holdout_samples': len(holdout),
+        'expected_rate': contamination,
+        'candidate_rate': round(candidate_rate, 4),
+        'current_rate': None
+    }
+
+    accepted = bool(np.all(np.isfinite(candidate_scores))) \
+        and abs(candidate_rate - contamination) <= tolerance
+    if current is not None and current.feature_names != candidate.feature_names:
+        report['current_skipped'] = "feature pipeline changed"
+    elif current is not None:
+        current_rate = float(np.mean(current.decision_function(holdout) < 0))
+        report['current_rate'] = round(current_rate, 4)
+        accepted = accepted and abs(candidate_rate - contamination) <= abs(current_rate - contamination)
+
+    report['accepted'] = accepted
+    return report
+
+
+def retrain_once(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Train, validate and, if accepted, promote a new model artifact.
+
+    Runs in a worker process, so it takes plain settings rather than live
+    objects. Promotion writes the bundle (and its flattened copy) through a
+    temporary file and rename, and the detector's registry hot-swaps it on
+    its next mtime check.
+
+    Args:
+        settings: Paths from the app plus the `anomaly.training` and
+            `anomaly.retrain` config
+
+    Returns:
+        Report describing the run
+    """
+    started = time.monotonic()
+    store = MetricsStore(settings['store_path'])
+    pipeline = pipeline_from_settings(settings.get('features'))
+    sample_size = settings.get('sample_size', 20000)
+    chunk_size = settings.get('chunk_size', 10000)
+    # The newest part of the window is held out, so validation sees recent data the forest never did
+    now = time.time()
+    window = settings['window_hours'] * 3600
+    split = now - window * settings['holdout_fraction']
+    try:
+        train, scaler, sampling = load_training_sample(
+            iter_store_chunks(store, start=now - window, end=split, chunk_size=chunk_size),
+            sample_size,
+            stratify=settings.get('stratify'),
+            pipeline=pipeline
+        )
+        holdout = np.empty((0, 0))
+        if len(train) >= settings['min_samples']:
+            holdout = load_holdout(store, split, max(1, int(sample_size * settings['holdout_fraction'])),
+                                   pipeline, chunk_size)
+    finally:
+        store.close()
+
+    report: Dict[str, Any] = {'samples': len(train), 'sampling': sampling, 'promoted': False}
+    if len(train) < settings['min_samples']:
+        report['reason'] = f"only {len(train)} samples, need {settings['min_samples']}"
+        return report
+    if len(holdout) == 0:
+        report['reason'] = "no samples recorded in the holdout period"
+        return report
+
+    scaler, model = train_model(train, settings['contamination'], scaler=scaler)
+    feature_names = pipeline.output_names if pipeline is not None else FEATURE_COLUMNS
+    members = train_members(scaler.transform(train), feature_names, settings.get('ensemble_members'),
+                            settings['contamination'])
+    candidate = ModelArtifact(scaler, model, 'candidate', settings['artifact_path'], 0,
+                              feature_names=feature_names, pipeline=pipeline, members=members)
+
+    current = ModelRegistry(settings['artifact_path'], settings.get('legacy_paths')).wait()
+    report['validation'] = validate(
+        candidate, current, holdout, settings['contamination'], settings['max_rate_deviation']
+    )
+
+    if report['validation']['accepted']:
+        version = save_artifact(
+            settings['artifact_path'], scaler, model, pipeline=pipeline, members=members,
+            trained_samples=len(train),
+            streamed_rows=sampling['rows_streamed'],
+            window_hours=settings['window_hours'],
+            validation=report['validation'],
+            profile=reference_profile(train, settings.get('profile_bins', 10))
+        )
+        if settings.get('flat_path'):
+            from src.anomaly.fast_forest import flatten_artifact, save_flat_artifact
+            saved = ModelArtifact(scaler, model, version, settings['artifact_path'],
+                                  os.path.getmtime(settings['artifact_path']),
+                                  feature_names=candidate.feature_names, pipeline=pipeline,
+                                  members=members)
+            save_flat_artifact(settings['flat_path'], flatten_artifact(saved))
+        report['promoted'] = True
+        report['version'] = version
+    else:
+        report['reason'] = "candidate failed validation"
+
+    report['seconds'] = round(time.monotonic() - started, 1)
+    return report
+
+
+def _lower_priority() -> None:
+    """Worker initializer: let the GUI and collector win any CPU contention."""
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+
+class RetrainScheduler:
+    """
+    Periodically retrains the anomaly model in a separate process.
+
+    Training runs in a single persistent worker process started with
+    ``spawn``, so it neither holds the GUI's GIL nor inherits its threads.
+    Runs happen every ``interval`` seconds and whenever ``request()`` is
+    called, e.g. by the drift monitor; an interval of 0 retrains only on
+    request.
+    """
+
+    def __init__(self, config: Dict[str, Any], store_path: str, registry: ModelRegistry):
+        self.settings = dict(config['anomaly'].get('training') or {})
+        self.settings.update(config['anomaly']['retrain'])
+        self.settings.update({
+            'store_path': store_path,
+            'artifact_path': registry.artifact_path,
+            'legacy_paths': registry.legacy_paths,
+            'flat_path': registry.flat_path,
+            'features': config['anomaly'].get('features'),
+            'profile_bins': (config['anomaly'].get('drift') or {}).get('bins', 10),
+            'ensemble_members': ensemble_members(config)
+        })
+        self.registry = registry
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._requested = Event()
+        self.last_request: Optional[str] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_lower_priority
+            )
+        return self._executor
+
+    def run_once(self) -> Dict[str, Any]:
+        """Run one retraining job in the worker and wait for its report."""
+        report = self._pool().submit(retrain_once, self.settings).result()
+        if report.get('promoted'):
+            logger.info(f"Promoted retrained model {report['version']}: {report['validation']}")
+            # Pick the new artifact up now rather than at the next poll
+            self.registry.check_for_update()
+        else:
+            logger.info(f"Retraining skipped: {report.get('reason')} {report.get('validation', '')}")
+        return report
+
+    def request(self, reason: str) -> None:
+        """Ask the background task to retrain as soon as possible."""
+        if not self.settings.get('enabled', False):
+            logger.info(f"Retraining requested ({reason}) but retraining is disabled")
+            return
+        self.last_request = reason
+        self._requested.set()
+
+    def run_forever(self, stop_event: Event) -> None:
+        """Retrain on schedule and on request until ``stop_event`` is set."""
+        if not self.settings.get('enabled', False):
+            return
+        interval = self.settings.get('interval') or None
+        logger.info(f"Retraining task started, interval {interval or 'none (on request only)'}")
+        next_run = time.monotonic() + interval if interval else None
+        while not stop_event.is_set():
+            # Short waits so a stop or a request is noticed promptly
+            requested = self._requested.wait(timeout=1.0)
+            due = next_run is not None and time.monotonic() >= next_run
+            if not (requested or due):
+                continue
+            self._requested.clear()
+            if requested:
+                logger.info(f"Retraining on request: {self.last_request}")
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Retraining failed: {e}")
+            if interval:
+                next_run = time.monotonic() + interval
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,187 @@
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from src.database.db import FEATURE_COLUMNS
+from src.database.store import MetricsStore
+from src.anomaly.features import FeaturePipeline
+
+# (timestamps, feature rows) pairs streamed into the samplers
+Chunk = Tuple[np.ndarray, np.ndarray]
+
+
+class ReservoirSampler:
+    """
+    Uniform fixed-size sample of an unbounded stream (Algorithm R).
+
+    Each chunk is processed with a handful of numpy operations: row ``n``
+    of the stream is accepted with probability ``capacity / n`` into a
+    random slot, and numpy's last-write-wins assignment replays the
+    sequential algorithm exactly.
+    """
+
+    def __init__(self, capacity: int, n_features: int, rng: np.random.Generator):
+        self.capacity = capacity
+        self.rng = rng
+        # Grown while filling, so a short stream never allocates the full capacity
+        self.rows = np.empty((min(capacity, 1024), n_features), dtype=np.float64)
+        self.seen = 0
+
+    def add(self, chunk: np.ndarray) -> None:
+        if len(chunk) == 0 or self.capacity == 0:
+            return
+        # Fill the reservoir first
+        fill = min(max(self.capacity - self.seen, 0), len(chunk))
+        if self.seen + fill > len(self.rows):
+            grown = np.empty((min(self.capacity, max(2 * len(self.rows), self.seen + fill)),
+                              self.rows.shape[1]), dtype=np.float64)
+            grown[:self.seen] = self.rows[:self.seen]
+            self.rows = grown
+        if fill:
+            self.rows[self.seen:self.seen + fill] = chunk[:fill]
+        rest = chunk[fill:]
+        if len(rest):
+            positions = self.seen + fill + np.arange(1, len(rest) + 1)
+            accepted = self.rng.random(len(rest)) < self.capacity / positions
+            slots = self.rng.integers(0, self.capacity, size=int(accepted.sum()))
+            self.rows[slots] = rest[accepted]
+        self.seen += len(chunk)
+
+    def sample(self) -> np.ndarray:
+        return self.rows[:min(self.seen, self.capacity)]
+
+
+class HourOfDaySampler:
+    """
+    One reservoir per local hour of day, so quiet night hours are not crowded out.
+
+    Each hour keeps up to a quarter of ``capacity`` rows, so any history
+    spanning four hours or more yields a full sample; ``sample()`` then
+    draws an equal share from every hour that was seen. Memory stays bounded
+    at six times the sample size whatever the history length.
+    """
+
+    def __init__(self, capacity: int, n_features: int, rng: np.random.Generator):
+        self.capacity = capacity
+        self.rng = rng
+        per_hour = max(1, capacity // 4)
+        self.reservoirs = [ReservoirSampler(per_hour, n_features, rng) for _ in range(24)]
+        self.utc_offset = datetime.now().astimezone().utcoffset().total_seconds()
+
+    def add(self, chunk: np.ndarray, timestamps: np.ndarray) -> None:
+        hours = ((timestamps + self.utc_offset) // 3600 % 24).astype(np.int64)
+        for hour in np.unique(hours):
+            self.reservoirs[hour].add(chunk[hours == hour])
+
+    def sample(self) -> np.ndarray:
+        samples = [reservoir.sample() for reservoir in self.reservoirs if reservoir.seen]
+        if not samples:
+            return self.reservoirs[0].sample()
+        share = max(1, self.capacity // len(samples))
+        return np.concatenate([
+            rows[self.rng.permutation(len(rows))[:share]] for rows in samples
+        ])
+
+
+def iter_store_chunks(store: MetricsStore, start: Optional[float] = None,
+                      end: Optional[float] = None, chunk_size: int = 10000) -> Iterator[Chunk]:
+    """Stream (timestamps, features) chunks out of the metrics store."""
+    for rows in store.iter_chunks(start=start, end=end, columns=FEATURE_COLUMNS, chunk_size=chunk_size):
+        values = np.array(rows, dtype=np.float64)
+        yield values[:, 0], np.nan_to_num(values[:, 1:])
+
+
+def iter_csv_chunks(path: str, chunk_size: int = 10000) -> Iterator[Chunk]:
+    """Stream (timestamps, features) chunks out of a headerless metrics CSV."""
+    import pandas as pd
+
+    names = ['timestamp'] + FEATURE_COLUMNS
+    for df in pd.read_csv(path, names=names, header=None, chunksize=chunk_size):
+        df = df[df['timestamp'] != 'timestamp']
+        # Timestamps are local wall-clock times; shift them to epoch seconds
+        local = pd.to_datetime(df['timestamp']).to_numpy('datetime64[ns]').astype(np.int64) / 1e9
+        timestamps = local - datetime.now().astimezone().utcoffset().total_seconds()
+        yield timestamps, np.nan_to_num(df[FEATURE_COLUMNS].to_numpy(dtype=np.float64))
+
+
+def load_training_sample(chunks: Iterator[Chunk], sample_size: int, stratify: Optional[str] = None,
+                         seed: Optional[int] = None, measure_memory: bool = False,
+                         pipeline: Optional[FeaturePipeline] = None) -> Tuple[np.ndarray, Any, Dict[str, Any]]:
+    """
+    Build a fixed-size training set from a stream of any length.
+
+    The MinMaxScaler is fitted with ``partial_fit`` over every row, so its
+    range reflects the full history even though only ``sample_size`` rows
+    are kept for the forest. With a ``pipeline`` the derived features are
+    computed chunk by chunk before sampling, and the columns that stayed
+    constant over the whole stream are recorded on the pipeline and
+    dropped from the sample and scaler.
+
+    Args:
+        chunks: Iterator from iter_store_chunks or iter_csv_chunks
+        sample_size: Rows to keep
+        stratify: None for a uniform sample, ``'hour'`` for per-hour-of-day reservoirs
+        seed: Random seed
+        measure_memory: Track peak Python heap use with tracemalloc; this
+            slows streaming several-fold, so leave it off in the background
+        pipeline: Feature pipeline to fit and apply, None to train on raw columns
+
+    Returns:
+        Tuple of the sampled rows, the fitted scaler and a stats dictionary
+        with rows streamed, rows kept, seconds and (optionally) peak_memory_mb
+    """
+    from sklearn.preprocessing import MinMaxScaler
+
+    if measure_memory:
+        tracemalloc.start()
+    started = time.monotonic()
+
+    rng = np.random.default_rng(seed)
+    stream = None
+    n_features = len(FEATURE_COLUMNS)
+    if pipeline is not None:
+        pipeline.constant = []
+        stream = pipeline.stream()
+        n_features = len(pipeline.computed_names)
+    if stratify == 'hour':
+        sampler = HourOfDaySampler(sample_size, n_features, rng)
+    elif stratify is None:
+        sampler = ReservoirSampler(sample_size, n_features, rng)
+    else:
+        raise ValueError(f"Unknown stratification '{stratify}'")
+
+    scaler = MinMaxScaler()
+    streamed = 0
+    for timestamps, X in chunks:
+        if len(X) == 0:
+            continue
+        if stream is not None:
+            X = stream.transform(timestamps, X)
+        scaler.partial_fit(X)
+        if stratify == 'hour':
+            sampler.add(X, timestamps)
+        else:
+            sampler.add(X)
+        streamed += len(X)
+
+    sample = sampler.sample()
+    if pipeline is not None and streamed:
+        pipeline.fit_constant(scaler.data_range_)
+        keep = pipeline.keep_index()
+        sample = sample[:, keep]
+        # Refitting on the kept columns' extremes reproduces their scaling exactly
+        scaler = MinMaxScaler().fit(np.vstack([scaler.data_min_[keep], scaler.data_max_[keep]]))
+    stats: Dict[str, Any] = {
+        'rows_streamed': streamed,
+        'rows_sampled': len(sample),
+        'seconds': round(time.monotonic() - started, 2)
+    }
+    if pipeline is not None:
+        stats['dropped_constant'] = list(pipeline.constant)
+    if measure_memory:
+        stats['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+        tracemalloc.stop()
+    return sample, scaler, stats
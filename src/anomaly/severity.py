@@ -0,0 +1,68 @@
+import socket
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+SEVERITY_LEVELS = ['normal', 'low', 'medium', 'high', 'critical']
+
+# Decision-function cutoffs: a score below a cutoff reaches that level
+DEFAULT_THRESHOLDS = {
+    'low': 0.0,
+    'medium': -0.05,
+    'high': -0.1,
+    'critical': -0.15
+}
+
+
+def thresholds_for_host(config: Dict[str, Any], hostname: Optional[str] = None) -> Dict[str, float]:
+    """
+    Resolve severity cutoffs from the `anomaly.severity` config section.
+
+    Host entries under ``hosts`` override the global ``thresholds`` for the
+    matching hostname, so each machine can be tuned separately.
+
+    Args:
+        config: Parsed config.yaml
+        hostname: Host to resolve for, defaults to this machine
+
+    Returns:
+        Cutoff per severity level from ``low`` to ``critical``
+    """
+    severity_config = config.get('anomaly', {}).get('severity', {})
+    hostname = hostname or socket.gethostname()
+
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    thresholds.update(severity_config.get('thresholds') or {})
+    thresholds.update((severity_config.get('hosts') or {}).get(hostname) or {})
+
+    cutoffs = [thresholds[level] for level in SEVERITY_LEVELS[1:]]
+    if any(higher <= lower for higher, lower in zip(cutoffs, cutoffs[1:])):
+        raise ValueError(f"Severity thresholds must strictly decrease from low to critical: {thresholds}")
+    return {level: float(thresholds[level]) for level in SEVERITY_LEVELS[1:]}
+
+
+def classify(scores: np.ndarray, thresholds: Dict[str, float]) -> np.ndarray:
+    """
+    Map decision-function scores to severity level indices in one pass.
+
+    Returns:
+        Integer array indexing SEVERITY_LEVELS (0 normal .. 4 critical);
+        NaN scores are treated as normal
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    cutoffs = np.array([thresholds[level] for level in SEVERITY_LEVELS[1:]])
+    return (scores[..., None] < cutoffs).sum(axis=-1).astype(np.int8)
+
+
+def normalize(scores: np.ndarray, thresholds: Dict[str, float]) -> np.ndarray:
+    """
+    Rescale decision-function scores to a 0..1 anomaly level.
+
+    The ``low`` cutoff maps to 0.25 and the ``critical`` cutoff to 1.0, so
+    the level is comparable across hosts with different thresholds.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    low, critical = thresholds['low'], thresholds['critical']
+    span = (low - critical) / 0.75
+    upper = low + 0.25 * span
+    return np.clip((upper - scores) / span, 0.0, 1.0)
@@ -0,0 +1,414 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from threading import Event
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.database.db import FEATURE_COLUMNS, extract_row
+from src.database.store import MetricsStore
+
+logger = logging.getLogger(__name__)
+
+# Disk usage is not a model feature but has a fixed threshold of its own
+SKETCH_METRICS = FEATURE_COLUMNS + ['disk_percent']
+
+# `monitoring.thresholds` keys and the metric each one applies to
+THRESHOLD_METRICS = {
+    'cpu': 'cpu_percent',
+    'memory': 'memory_percent',
+    'disk': 'disk_percent'
+}
+
+STATE_NAME = 'sketches'
+
+
+class KLLSketch:
+    """
+    KLL streaming quantile sketch.
+
+    Values enter a level-0 buffer; a full level is sorted and every other
+    value (from a random offset) is promoted to the next level with double
+    the weight. Level capacities shrink geometrically towards the bottom,
+    so a sketch holds O(k) values whatever the stream length, answers any
+    quantile with rank error around 1.7/k, and merges with another sketch
+    by concatenating levels and compacting.
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.levels: List[List[float]] = [[]]
+        self.count = 0
+        self._sorted: Optional[tuple] = None
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2.0 / 3.0) ** depth)), 2)
+
+    def _compact(self) -> None:
+        """Halve every level that reached its capacity, bottom up."""
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # An odd value out stays behind so no weight is lost
+                kept = [items.pop()] if len(items) % 2 else []
+                self.levels[level + 1].extend(items[random.getrandbits(1)::2])
+                self.levels[level] = kept
+            level += 1
+
+    def update(self, value: float) -> None:
+        self.levels[0].append(float(value))
+        self.count += 1
+        self._sorted = None
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compact()
+
+    def merge(self, other: 'KLLSketch', compact: bool = True) -> 'KLLSketch':
+        """
+        Fold ``other`` into this sketch and return it.
+
+        With ``compact=False`` the union keeps every retained value, which is
+        exact with respect to the inputs; use it for short-lived query
+        results rather than for sketches that keep growing.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._sorted = None
+        if compact:
+            self._compact()
+        return self
+
+    def _weighted(self):
+        if self._sorted is None:
+            values = np.concatenate([np.asarray(items, dtype=np.float64) for items in self.levels])
+            weights = np.concatenate([np.full(len(items), 2.0 ** level)
+                                      for level, items in enumerate(self.levels)])
+            order = np.argsort(values, kind='stable')
+            self._sorted = (values[order], np.cumsum(weights[order]))
+        return self._sorted
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate ``q`` quantile (0..1), or None for an empty sketch."""
+        if self.count == 0:
+            return None
+        values, cumulative = self._weighted()
+        index = int(np.searchsorted(cumulative, q * cumulative[-1], side='left'))
+        return float(values[min(index, len(values) - 1)])
+
+    def rank(self, value: float) -> float:
+        """Approximate fraction of values at or below ``value``."""
+        if self.count == 0:
+            return 0.0
+        values, cumulative = self._weighted()
+        index = int(np.searchsorted(values, value, side='right'))
+        return float(cumulative[index - 1] / cumulative[-1]) if index else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'k': self.k, 'count': self.count, 'levels': self.levels}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'KLLSketch':
+        sketch = cls(data['k'])
+        sketch.count = data['count']
+        sketch.levels = [list(items) for items in data['levels']] or [[]]
+        return sketch
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters over weighted keys.
+
+    At most ``capacity`` keys are counted. A key that arrives when the
+    summary is full replaces the key with the smallest count and inherits
+    that count as its error, so every reported count overestimates the true
+    total by at most its ``error`` and any key whose total exceeds
+    1/capacity of the whole stream is guaranteed to be present. With
+    ``peak=True`` counts are running maxima instead of sums; a new key then
+    only displaces the smallest maximum if it is larger.
+    """
+
+    def __init__(self, capacity: int = 100, peak: bool = False):
+        self.capacity = capacity
+        self.peak = peak
+        self.counts: Dict[str, List[float]] = {}
+        self.total = 0.0
+
+    def update(self, key: str, weight: float = 1.0) -> None:
+        self.total = max(self.total, weight) if self.peak else self.total + weight
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] = max(entry[0], weight) if self.peak else entry[0] + weight
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = [weight, 0.0]
+            return
+        smallest = min(self.counts, key=lambda name: self.counts[name][0])
+        floor = self.counts[smallest][0]
+        if self.peak:
+            if weight > floor:
+                del self.counts[smallest]
+                self.counts[key] = [weight, 0.0]
+        else:
+            del self.counts[smallest]
+            self.counts[key] = [floor + weight, floor]
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        """
+        Fold ``other`` into this summary and return it, keeping the largest
+        ``capacity`` keys. Sums add counts and errors of the keys each side
+        kept; ``count - error`` stays a lower bound of a key's true total.
+        """
+        for key, (count, error) in other.counts.items():
+            entry = self.counts.get(key)
+            if entry is None:
+                self.counts[key] = [count, error]
+            elif self.peak:
+                entry[0] = max(entry[0], count)
+            else:
+                entry[0] += count
+                entry[1] += error
+        self.total = max(self.total, other.total) if self.peak else self.total + other.total
+        if len(self.counts) > self.capacity:
+            kept = sorted(self.counts.items(), key=lambda item: item[1][0], reverse=True)[:self.capacity]
+            self.counts = dict(kept)
+        return self
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, float, float]]:
+        """``(key, count, error)`` for the ``n`` largest counts, largest first."""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, count, error) for key, (count, error) in ranked[:n]]
+
+    def copy(self) -> 'SpaceSaving':
+        return SpaceSaving.from_dict(self.to_dict())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'capacity': self.capacity, 'peak': self.peak, 'total': self.total, 'counts': self.counts}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SpaceSaving':
+        summary = cls(data['capacity'], data['peak'])
+        summary.total = data['total']
+        summary.counts = {key: list(entry) for key, entry in data['counts'].items()}
+        return summary
+
+
+class WindowedSketch:
+    """
+    One KLL sketch per time bucket, merged on demand over a trailing window.
+
+    Buckets older than ``retention`` seconds are dropped, so memory stays
+    bounded. A window is the uncompacted union of its buckets, so merging
+    adds no error of its own. Closed buckets never change, so their union is
+    cached until a bucket rolls over and a query only merges in the current
+    bucket.
+    """
+
+    def __init__(self, k: int = 200, bucket_seconds: float = 21600, retention: float = 7 * 86400):
+        self.k = k
+        self.bucket_seconds = bucket_seconds
+        self.retention = retention
+        self.buckets: Dict[int, KLLSketch] = {}
+        self._closed_cache: Dict[int, KLLSketch] = {}
+
+    def _bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    def update(self, timestamp: float, value: float) -> None:
+        bucket = self._bucket(timestamp)
+        sketch = self.buckets.get(bucket)
+        if sketch is None:
+            sketch = self.buckets[bucket] = KLLSketch(self.k)
+            oldest = self._bucket(timestamp - self.retention)
+            for expired in [b for b in self.buckets if b <= oldest]:
+                del self.buckets[expired]
+            self._closed_cache.clear()
+        sketch.update(value)
+
+    def window(self, seconds: Optional[float] = None, now: Optional[float] = None) -> KLLSketch:
+        """Merged sketch of the buckets overlapping the last ``seconds`` (default: all retained)."""
+        now = time.time() if now is None else now
+        current = self._bucket(now)
+        first = self._bucket(now - (seconds if seconds is not None else self.retention))
+
+        closed = self._closed_cache.get((first, current))
+        if closed is None:
+            closed = KLLSketch(self.k)
+            for bucket, sketch in self.buckets.items():
+                if first <= bucket < current:
+                    closed.merge(sketch, compact=False)
+            self._closed_cache[(first, current)] = closed
+
+        # Merge into a copy so the cached closed-bucket sketch stays intact
+        merged = KLLSketch.from_dict(closed.to_dict())
+        if current in self.buckets:
+            merged.merge(self.buckets[current], compact=False)
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'k': self.k, 'bucket_seconds': self.bucket_seconds, 'retention': self.retention,
+            'buckets': {str(bucket): sketch.to_dict() for bucket, sketch in self.buckets.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'WindowedSketch':
+        windowed = cls(data['k'], data['bucket_seconds'], data['retention'])
+        windowed.buckets = {int(bucket): KLLSketch.from_dict(sketch)
+                            for bucket, sketch in data['buckets'].items()}
+        return windowed
+
+
+class MetricSketches:
+    """
+    Windowed quantile sketches for every metric, fed by the collection loop.
+
+    Queries such as "this host's p99.5 CPU over the last 7 days" merge a
+    handful of bounded sketches and are cached for ``cache_ttl`` seconds,
+    so the GUI, alerting and the detector can ask as often as they like.
+    """
+
+    def __init__(self, metrics: Sequence[str] = SKETCH_METRICS, k: int = 200,
+                 bucket_seconds: float = 21600, retention: float = 7 * 86400,
+                 cache_ttl: float = 60):
+        self.metrics = list(metrics)
+        self.sketches = {name: WindowedSketch(k, bucket_seconds, retention) for name in self.metrics}
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def update(self, metrics: Dict[str, Any]) -> None:
+        """Add one SystemMonitor snapshot."""
+        row = extract_row(metrics)
+        row['disk_percent'] = metrics.get('disk', {}).get('percent')
+        timestamp = row['timestamp'].timestamp()
+        with self._lock:
+            for name in self.metrics:
+                if row.get(name) is not None:
+                    self.sketches[name].update(timestamp, row[name])
+
+    def quantile(self, metric: str, q: float, window: Optional[float] = None) -> Optional[float]:
+        """
+        Approximate quantile of a metric over a trailing window.
+
+        Args:
+            metric: Name from SKETCH_METRICS
+            q: Quantile, e.g. 0.995
+            window: Seconds to look back, defaults to the whole retention
+
+        Returns:
+            The quantile, or None before any sample was seen
+        """
+        return self.query(metric, q, window)[0]
+
+    def query(self, metric: str, q: float, window: Optional[float] = None) -> Tuple[Optional[float], int]:
+        """Like ``quantile``, also returning how many samples the window holds."""
+        key = (metric, q, window)
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            return cached[1]
+        with self._lock:
+            merged = self.sketches[metric].window(window)
+        result = (merged.quantile(q), merged.count)
+        self._cache[key] = (time.monotonic(), result)
+        return result
+
+    def to_bytes(self) -> bytes:
+        with self._lock:
+            data = {name: sketch.to_dict() for name, sketch in self.sketches.items()}
+        return json.dumps(data).encode()
+
+    def load_bytes(self, data: bytes) -> None:
+        """Restore sketches saved with ``to_bytes``, keeping this instance's settings."""
+        saved = json.loads(data.decode())
+        with self._lock:
+            for name, sketch in saved.items():
+                if name in self.sketches:
+                    restored = WindowedSketch.from_dict(sketch)
+                    restored.retention = self.sketches[name].retention
+                    if restored.bucket_seconds == self.sketches[name].bucket_seconds:
+                        self.sketches[name] = restored
+
+    def save(self, store: MetricsStore) -> None:
+        store.save_state(STATE_NAME, self.to_bytes())
+
+    def load(self, store: MetricsStore) -> None:
+        data = store.load_state(STATE_NAME)
+        if data is None:
+            return
+        try:
+            self.load_bytes(data)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Discarding unreadable metric sketches: {e}")
+
+    def run_forever(self, store: MetricsStore, stop_event: Event, persist_interval: float = 300) -> None:
+        """Persist the sketches every ``persist_interval`` seconds until ``stop_event`` is set."""
+        while not stop_event.wait(timeout=persist_interval):
+            self.save(store)
+        self.save(store)
+
+
+class AdaptiveThresholds:
+    """
+    Per-host thresholds derived from the metric sketches.
+
+    Each `monitoring.thresholds` entry is replaced by the configured
+    quantile of that metric over the trailing window once the window holds
+    ``min_samples`` values; until then the fixed value applies.
+    """
+
+    def __init__(self, sketches: MetricSketches, fixed: Dict[str, float], quantile: float = 0.995,
+                 window: float = 7 * 86400, min_samples: int = 3600):
+        self.sketches = sketches
+        self.fixed = dict(fixed)
+        self.quantile = quantile
+        self.window = window
+        self.min_samples = min_samples
+
+    def get(self, name: str) -> float:
+        """Threshold for a `monitoring.thresholds` key such as ``cpu``."""
+        metric = THRESHOLD_METRICS.get(name, name)
+        value, count = self.sketches.query(metric, self.quantile, self.window)
+        if value is None or count < self.min_samples:
+            return self.fixed.get(name)
+        return value
+
+    def all(self) -> Dict[str, float]:
+        """Current threshold for every `monitoring.thresholds` key."""
+        return {name: self.get(name) for name in self.fixed}
+
+
+def sketches_from_config(config: Dict[str, Any]) -> Optional[MetricSketches]:
+    """Build MetricSketches from the `monitoring.adaptive_thresholds` config section, or None if disabled."""
+    adaptive = config['monitoring'].get('adaptive_thresholds') or {}
+    if not adaptive.get('enabled', False):
+        return None
+    return MetricSketches(
+        k=adaptive.get('k', 200),
+        bucket_seconds=adaptive.get('bucket_hours', 6) * 3600,
+        retention=adaptive.get('window_days', 7) * 86400
+    )
+
+
+def thresholds_from_config(config: Dict[str, Any], sketches: Optional[MetricSketches]) -> Optional[AdaptiveThresholds]:
+    """Wrap the sketches with the quantile and window from `monitoring.adaptive_thresholds`."""
+    if sketches is None:
+        return None
+    adaptive = config['monitoring']['adaptive_thresholds']
+    return AdaptiveThresholds(
+        sketches,
+        config['monitoring']['thresholds'],
+        quantile=adaptive.get('quantile', 0.995),
+        window=adaptive.get('window_days', 7) * 86400,
+        min_samples=adaptive.get('min_samples', 3600)
+    )
@@ -1,30 +1,58 @@
-import pandas as pd
-import numpy as np
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import MinMaxScaler
-import joblib
-
-# Define column names explicitly
-column_names = ["timestamp", "cpu_percent", "cpu_freq", "cpu_count_logical", 
-                "cpu_load_avg_1min", "memory_used", "memory_percent", 
-                "network_upload_speed", "network_download_speed"]
-
-# Load CSV file with column names
-file_path = "src/data/train_data.csv"
-df = pd.read_csv(file_path, names=column_names, header=None)
-
-# Remove timestamp column
-df = df.iloc[:, 1:]
-
-# Scale data using MinMaxScaler
-scaler = MinMaxScaler()
-X_scaled = scaler.fit_transform(df)
-
-# Train Isolation Forest
-model = IsolationForest(contamination=0.2, random_state=42)
-model.fit(X_scaled)
-
-# Save model and scaler
-joblib.dump(model, "src/models/isolation_forest_model2.pkl")
-joblib.dump(scaler, "src/models/scaler2.pkl")
-print("Model and scaler saved successfully.")
+import argparse
+
+import yaml
+
+from src.database.store import MetricsStore, resolve_db_path
+from src.anomaly.retrain import train_model
+from src.anomaly.registry import save_artifact
+from src.anomaly.features import pipeline_from_config
+from src.anomaly.drift import reference_profile
+from src.anomaly.ensemble import ensemble_members, train_members
+from src.database.db import FEATURE_COLUMNS
+from src.anomaly.sampling import iter_csv_chunks, iter_store_chunks, load_training_sample
+
+parser = argparse.ArgumentParser(description="Train the anomaly model from collected metrics")
+parser.add_argument('--csv', default="src/data/train_data.csv", help="Metrics CSV to train on")
+parser.add_argument('--store', action='store_true', help="Train on the metrics store instead of the CSV")
+args = parser.parse_args()
+
+with open("config/config.yaml", 'r') as file:
+    config = yaml.safe_load(file)
+training = config['anomaly']['training']
+
+# Stream the history in chunks, keeping a fixed-size sample for the forest
+if args.store:
+    source = resolve_db_path(config['database']['url'], "src/data")
+    store = MetricsStore(source)
+    chunks = iter_store_chunks(store, chunk_size=training['chunk_size'])
+else:
+    source = args.csv
+    chunks = iter_csv_chunks(source, chunk_size=training['chunk_size'])
+
+# Derived features are computed while streaming, exactly as the detector will
+pipeline = pipeline_from_config(config)
+X, scaler, stats = load_training_sample(
+    chunks, training['sample_size'], stratify=training.get('stratify'), seed=42, measure_memory=True,
+    pipeline=pipeline
+)
+print(f"Sampled {stats['rows_sampled']} of {stats['rows_streamed']} rows in {stats['seconds']}s, "
+      f"peak memory {stats['peak_memory_mb']} MB")
+if pipeline is not None:
+    print(f"Features: {', '.join(pipeline.output_names)} (dropped constant: {stats['dropped_constant']})")
+
+# Scaler is already fitted on the full stream; train Isolation Forest on the sample
+scaler, model = train_model(X, contamination=0.2, random_state=42, scaler=scaler)
+
+# Ensemble members: extra forests on feature subsets, scored alongside the main one
+feature_names = pipeline.output_names if pipeline is not None else FEATURE_COLUMNS
+members = train_members(scaler.transform(X), feature_names, ensemble_members(config),
+                        contamination=0.2, random_state=42)
+if members:
+    print(f"Ensemble members: {', '.join(member.name for member in members)}")
+
+# Save model and scaler as one versioned artifact, picked up by the detector
+# The training distribution goes with the model for drift monitoring
+profile = reference_profile(X, (config['anomaly'].get('drift') or {}).get('bins', 10))
+version = save_artifact("src/models/anomaly_model.joblib", scaler, model, pipeline=pipeline, members=members, source=source,
+                        streamed_rows=stats['rows_streamed'], trained_samples=len(X), profile=profile)
+print(f"Model and scaler saved successfully (version {version}).")
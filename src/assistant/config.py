@@ -7,7 +7,7 @@ load_dotenv(find_dotenv())
 API_KEY = os.getenv("GEMINI_API_KEY")
 
 # Whitelists
-ACTION_WHITELIST = {"open_file", "shutdown", "run_command"}
+ACTION_WHITELIST = {"open_file", "shutdown", "run_command", "top_processes"}
 FILE_WHITELIST = {
     "/usr/bin/code",
     str(Path.home() / "Downloads"),
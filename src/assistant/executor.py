@@ -1,6 +1,20 @@
 import subprocess
+from typing import Callable, Dict
 from .config import ACTION_WHITELIST, FILE_WHITELIST
 
+def _usage_tracking_off(target: str) -> str:
+    return ("Process usage history is not being recorded, so I can't say what used the most "
+            "resources over time. Enable monitoring.process.usage in the config and restart VitalWatch.")
+
+# Actions answered from VitalWatch's own data instead of a shell. The app replaces
+# these fallbacks when the data behind them is enabled.
+QUERY_HANDLERS: Dict[str, Callable[[str], str]] = {
+    "top_processes": _usage_tracking_off,
+}
+
+def register_query(action: str, handler: Callable[[str], str]) -> None:
+    QUERY_HANDLERS[action] = handler
+
 def is_safe(command: dict) -> bool:
     if command["action"] not in ACTION_WHITELIST:
         return False
@@ -15,6 +29,9 @@ def execute(command: dict, dry_run: bool=False):
         print("[dry-run]", command)
         return None
         
+    if command["action"] in QUERY_HANDLERS:
+        return QUERY_HANDLERS[command["action"]](command["target"])
+        
     if command["action"] == "shutdown":
         subprocess.run(["shutdown", "-h", "now"], check=True)
         return "Shutdown initiated."
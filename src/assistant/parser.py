@@ -11,7 +11,7 @@ SCHEMA = {
         {
             "properties": {
                 "type": {"const": "command"},
-                "action": {"enum": ["open_file", "shutdown", "run_command"]},
+                "action": {"enum": ["open_file", "shutdown", "run_command", "top_processes"]},
                 "target": {"type": "string"},
                 "confirm": {"type": "boolean"},
                 "safe": {"type": "boolean"}
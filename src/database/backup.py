@@ -0,0 +1,287 @@
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from threading import Event
+from typing import Any, Dict, Optional
+
+import yaml
+
+from src.database.store import APPEND_ONLY_TABLES, INDEXES, SCHEMAS, migrate, resolve_db_path
+
+logger = logging.getLogger(__name__)
+
+BACKUP_FILENAME = 'system_monitor_backup.db'
+
+STATE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS _backup_state ("
+    "table_name TEXT PRIMARY KEY, "
+    "last_id INTEGER NOT NULL, "
+    "updated REAL NOT NULL)"
+)
+
+
+def get_resource_path(relative_path):
+    """Get the absolute path to bundled files when using PyInstaller."""
+    if getattr(sys, 'frozen', False):  # Running as a PyInstaller bundle
+        base_path = sys._MEIPASS
+    else:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+
+class BackupManager:
+    """
+    Incremental online backups of the metrics store.
+
+    Append-only tables are mirrored by copying only rows whose id is above the
+    watermark recorded by the previous run; every other table is small and is
+    copied whole. Each chunk is a short read of the WAL-mode source, so the
+    collector keeps writing while a backup runs, and chunks are paced so the
+    backup never writes faster than ``bandwidth_limit`` bytes per second.
+    """
+
+    def __init__(self, store_path: str, backup_dir: str, interval: float = 3600,
+                 bandwidth_limit: Optional[float] = None, chunk_rows: int = 2000):
+        self.store_path = store_path
+        self.backup_dir = backup_dir
+        self.backup_file = os.path.join(backup_dir, BACKUP_FILENAME)
+        self.interval = interval
+        self.bandwidth_limit = bandwidth_limit
+        self.chunk_rows = chunk_rows
+
+    def _open_backup(self) -> sqlite3.Connection:
+        os.makedirs(self.backup_dir, exist_ok=True)
+        conn = sqlite3.connect(self.backup_file, timeout=30)
+        with conn:
+            for schema in SCHEMAS.values():
+                conn.execute(schema)
+            migrate(conn)
+            for index in INDEXES:
+                conn.execute(index)
+            conn.execute(STATE_SCHEMA)
+        # Source is attached read-only so a backup can never modify live data
+        source_uri = Path(self.store_path).resolve().as_uri() + '?mode=ro'
+        conn.execute("ATTACH DATABASE ? AS src", (source_uri,))
+        return conn
+
+    def _backup_size(self, conn: sqlite3.Connection) -> int:
+        page_count = conn.execute("PRAGMA main.page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA main.page_size").fetchone()[0]
+        return page_count * page_size
+
+    def _throttle(self, written: int, started: float) -> None:
+        """Sleep long enough to keep the write rate under the bandwidth cap."""
+        if not self.bandwidth_limit or written <= 0:
+            return
+        delay = written / self.bandwidth_limit - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _columns(self, conn: sqlite3.Connection, table: str) -> str:
+        """Column list of the source table, so copies never depend on column order."""
+        return ", ".join(row[1] for row in conn.execute(f"PRAGMA src.table_info({table})"))
+
+    def _copy_append_only(self, conn: sqlite3.Connection, table: str,
+                          stop_event: Optional[Event]) -> int:
+        row = conn.execute(
+            "SELECT last_id FROM _backup_state WHERE table_name = ?", (table,)
+        ).fetchone()
+        last_id = row[0] if row else 0
+        columns = self._columns(conn, table)
+        copied = 0
+
+        while not (stop_event and stop_event.is_set()):
+            started = time.monotonic()
+            size_before = self._backup_size(conn)
+            with conn:
+                cursor = conn.execute(
+                    f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM src.{table} "
+                    f"WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, self.chunk_rows)
+                )
+                if cursor.rowcount <= 0:
+                    break
+                copied += cursor.rowcount
+                last_id = conn.execute(f"SELECT MAX(id) FROM main.{table}").fetchone()[0]
+                conn.execute(
+                    "INSERT OR REPLACE INTO _backup_state (table_name, last_id, updated) "
+                    "VALUES (?, ?, ?)",
+                    (table, last_id, time.time())
+                )
+            self._throttle(self._backup_size(conn) - size_before, started)
+
+        return copied
+
+    def _copy_full(self, conn: sqlite3.Connection, table: str) -> int:
+        columns = self._columns(conn, table)
+        with conn:
+            conn.execute(f"DELETE FROM main.{table}")
+            cursor = conn.execute(
+                f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM src.{table}"
+            )
+        return cursor.rowcount
+
+    def run_backup(self, stop_event: Optional[Event] = None) -> Dict[str, int]:
+        """
+        Run one incremental backup pass.
+
+        Args:
+            stop_event: Optional event that aborts the pass between chunks
+
+        Returns:
+            Number of rows copied per table
+        """
+        if not os.path.exists(self.store_path):
+            logger.warning(f"Metrics store {self.store_path} does not exist yet, skipping backup")
+            return {}
+
+        started = time.monotonic()
+        copied = {}
+        conn = self._open_backup()
+        try:
+            for table in SCHEMAS:
+                if table in APPEND_ONLY_TABLES:
+                    copied[table] = self._copy_append_only(conn, table, stop_event)
+                else:
+                    copied[table] = self._copy_full(conn, table)
+        finally:
+            conn.close()
+
+        logger.info(f"Backup to {self.backup_file} finished in "
+                    f"{time.monotonic() - started:.1f}s: {copied}")
+        return copied
+
+    def run_forever(self, stop_event: Event) -> None:
+        """Run a backup every ``interval`` seconds until ``stop_event`` is set."""
+        logger.info(f"Backup task started, writing to {self.backup_file} every {self.interval}s")
+        while not stop_event.wait(timeout=self.interval):
+            try:
+                self.run_backup(stop_event)
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Backup failed: {e}")
+
+    def verify(self) -> Dict[str, Any]:
+        """
+        Check the backup file against the live store.
+
+        The backup must pass SQLite's integrity check, and for every
+        append-only table each source row up to the backup watermark must
+        also be present in the backup.
+
+        Returns:
+            Report with an ``ok`` flag and per-table details
+        """
+        report: Dict[str, Any] = {'ok': True, 'tables': {}}
+        if not os.path.exists(self.backup_file):
+            return {'ok': False, 'error': f"No backup found at {self.backup_file}"}
+
+        conn = self._open_backup()
+        try:
+            integrity = conn.execute("PRAGMA main.integrity_check").fetchone()[0]
+            report['integrity'] = integrity
+            report['ok'] = integrity == 'ok'
+
+            for table in APPEND_ONLY_TABLES:
+                row = conn.execute(
+                    "SELECT last_id FROM _backup_state WHERE table_name = ?", (table,)
+                ).fetchone()
+                last_id = row[0] if row else 0
+                # Only compare the id range both copies still hold
+                first_id = conn.execute(f"SELECT MIN(id) FROM src.{table}").fetchone()[0] or 0
+                source_rows = conn.execute(
+                    f"SELECT COUNT(*) FROM src.{table} WHERE id BETWEEN ? AND ?",
+                    (first_id, last_id)
+                ).fetchone()[0]
+                backup_rows = conn.execute(
+                    f"SELECT COUNT(*) FROM main.{table} WHERE id BETWEEN ? AND ?",
+                    (first_id, last_id)
+                ).fetchone()[0]
+                matches = source_rows == backup_rows
+                report['tables'][table] = {
+                    'last_id': last_id,
+                    'source_rows': source_rows,
+                    'backup_rows': backup_rows,
+                    'ok': matches
+                }
+                report['ok'] = report['ok'] and matches
+        finally:
+            conn.close()
+
+        return report
+
+    def restore(self, target_path: Optional[str] = None, overwrite: bool = False) -> str:
+        """
+        Restore the backup into a database file.
+
+        Stop the application before restoring over the live store.
+
+        Args:
+            target_path: Destination file, defaults to the store path
+            overwrite: Allow replacing an existing file
+
+        Returns:
+            Path of the restored database
+        """
+        target_path = target_path or self.store_path
+        if not os.path.exists(self.backup_file):
+            raise FileNotFoundError(f"No backup found at {self.backup_file}")
+        if os.path.exists(target_path) and not overwrite:
+            raise FileExistsError(f"{target_path} exists, pass overwrite=True to replace it")
+
+        # Restore into a temporary file first so a failed restore leaves the
+        # target untouched, then swap it in atomically
+        temp_path = target_path + '.restore'
+        source = sqlite3.connect(self.backup_file)
+        target = sqlite3.connect(temp_path)
+        try:
+            source.backup(target)
+            with target:
+                target.execute("DROP TABLE IF EXISTS _backup_state")
+        finally:
+            target.close()
+            source.close()
+
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(target_path + suffix):
+                os.remove(target_path + suffix)
+        os.replace(temp_path, target_path)
+        logger.info(f"Restored {self.backup_file} to {target_path}")
+        return target_path
+
+
+def backup_manager_from_config(config: Dict[str, Any], base_dir: str) -> BackupManager:
+    """Build a BackupManager from the `database` section of config.yaml."""
+    db_config = config['database']
+    return BackupManager(
+        store_path=resolve_db_path(db_config['url'], base_dir),
+        backup_dir=os.path.expanduser(db_config['backup_path']),
+        interval=db_config.get('backup_interval', 3600),
+        bandwidth_limit=db_config.get('backup_bandwidth_limit'),
+        chunk_rows=db_config.get('backup_chunk_rows', 2000)
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Back up, verify or restore the VitalWatch metrics store")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--verify', action='store_true', help="Verify the existing backup")
+    group.add_argument('--restore', metavar='TARGET', nargs='?', const='',
+                       help="Restore the backup (defaults to the store path)")
+    parser.add_argument('--overwrite', action='store_true', help="Allow restore to replace an existing file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(get_resource_path('config/config.yaml'), 'r') as file:
+        config = yaml.safe_load(file)
+    manager = backup_manager_from_config(config, get_resource_path('src/data'))
+
+    if args.verify:
+        print(manager.verify())
+    elif args.restore is not None:
+        print(manager.restore(args.restore or None, overwrite=args.overwrite))
+    else:
+        print(manager.run_backup())
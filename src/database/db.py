@@ -1,10 +1,48 @@
 import pandas as pd
 import logging
 import os
-from sklearn.preprocessing import MinMaxScaler
 from datetime import datetime
 from src.monitors.system_monitor import SystemMonitor
 
+# Feature columns shared by the CSV, the metrics store and the anomaly model
+FEATURE_COLUMNS = [
+    'cpu_percent',
+    'cpu_freq',
+    'cpu_count_logical',
+    'cpu_load_avg_1min',
+    'memory_used',
+    'memory_percent',
+    'network_upload_speed',
+    'network_download_speed'
+]
+
+def extract_row(metric):
+    """
+    Flatten one SystemMonitor snapshot into a row of model features.
+    
+    Args:
+        metric (dict): Snapshot returned by SystemMonitor.collect_metrics()
+        
+    Returns:
+        dict: Timestamp plus one entry per name in FEATURE_COLUMNS
+    """
+    cpu_metrics = metric['cpu']
+    memory_metrics = metric['memory']
+    network_metrics = metric['network']
+    
+    # Select specific features for training
+    return {
+        'timestamp': metric['timestamp'],
+        'cpu_percent': cpu_metrics.get('cpu_percent', None),
+        'cpu_freq': cpu_metrics.get('cpu_freq', None),
+        'cpu_count_logical': cpu_metrics.get('cpu_count_logical', None),
+        'cpu_load_avg_1min': cpu_metrics.get('cpu_load_avg_1min', None),
+        'memory_used': memory_metrics.get('used', None),
+        'memory_percent': memory_metrics.get('percent', None),
+        'network_upload_speed': network_metrics.get('upload_speed', None),
+        'network_download_speed': network_metrics.get('download_speed', None)
+    }
+
 def preprocess_data(metrics, output_file, fill_missing=True, default_value=0):
     """
     Preprocess system metrics data collected from the SystemMonitor.
@@ -20,26 +58,7 @@ def preprocess_data(metrics, output_file, fill_missing=True, default_value=0):
     logger = logging.getLogger(__name__)
     
     # Extract relevant fields for training
-    data = []
-    for metric in metrics:
-        timestamp = metric['timestamp']
-        cpu_metrics = metric['cpu']
-        memory_metrics = metric['memory']
-        network_metrics = metric['network']
-        
-        # Select specific features for training
-        row = {
-            'timestamp': timestamp,
-            'cpu_percent': cpu_metrics.get('cpu_percent', None),
-            'cpu_freq': cpu_metrics.get('cpu_freq', None),
-            'cpu_count_logical': cpu_metrics.get('cpu_count_logical', None),
-            'cpu_load_avg_1min': cpu_metrics.get('cpu_load_avg_1min', None),
-            'memory_used': memory_metrics.get('used', None),
-            'memory_percent': memory_metrics.get('percent', None),
-            'network_upload_speed': network_metrics.get('upload_speed', None),
-            'network_download_speed': network_metrics.get('download_speed', None)
-        }
-        data.append(row)
+    data = [extract_row(metric) for metric in metrics]
     
     # Convert metrics list to a DataFrame
     df = pd.DataFrame(data)
@@ -0,0 +1,166 @@
+import argparse
+import csv
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import yaml
+
+from src.database.store import MetricsStore, resolve_db_path
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+
+def get_resource_path(relative_path):
+    """Get the absolute path to bundled files when using PyInstaller."""
+    if getattr(sys, 'frozen', False):  # Running as a PyInstaller bundle
+        base_path = sys._MEIPASS
+    else:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+
+def _format_timestamp(value: float) -> str:
+    return datetime.fromtimestamp(value).isoformat(sep=' ')
+
+
+def _open_text(path: str, compress: bool):
+    if compress:
+        return gzip.open(path, 'wt', newline='')
+    return open(path, 'w', newline='')
+
+
+def _write_csv(chunks: Iterator[List[Tuple]], header: List[str], path: str, compress: bool,
+               types: Dict[str, str]) -> int:
+    rows = 0
+    with _open_text(path, compress) as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for chunk in chunks:
+            writer.writerows((_format_timestamp(row[0]),) + row[1:] for row in chunk)
+            rows += len(chunk)
+    return rows
+
+
+def _write_jsonl(chunks: Iterator[List[Tuple]], header: List[str], path: str, compress: bool,
+                 types: Dict[str, str]) -> int:
+    rows = 0
+    with _open_text(path, compress) as file:
+        for chunk in chunks:
+            file.writelines(
+                json.dumps(dict(zip(header, (_format_timestamp(row[0]),) + row[1:]))) + '\n'
+                for row in chunk
+            )
+            rows += len(chunk)
+    return rows
+
+
+def _write_parquet(chunks: Iterator[List[Tuple]], header: List[str], path: str, compress: bool,
+                   types: Dict[str, str]) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export requires pyarrow: pip install pyarrow") from e
+
+    # Text columns such as severity stay strings; everything else is numeric
+    schema = pa.schema(
+        [pa.field('timestamp', pa.timestamp('us'))]
+        + [pa.field(name, pa.string() if 'TEXT' in types.get(name, '') else pa.float64()) for name in header[1:]]
+    )
+    rows = 0
+    # Each chunk becomes one row group, so only one chunk is ever in memory
+    with pq.ParquetWriter(path, schema, compression='gzip' if compress else 'snappy') as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            arrays = [pa.array([datetime.fromtimestamp(ts) for ts in columns[0]], pa.timestamp('us'))]
+            arrays += [pa.array(values, field.type) for values, field in zip(columns[1:], list(schema)[1:])]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+WRITERS = {
+    'csv': _write_csv,
+    'jsonl': _write_jsonl,
+    'parquet': _write_parquet,
+}
+
+
+def export_metrics(store: MetricsStore, output_path: str, fmt: str = 'csv',
+                   start: Optional[Any] = None, end: Optional[Any] = None,
+                   columns: Optional[Sequence[str]] = None, compress: bool = False,
+                   chunk_size: int = 10000) -> Dict[str, Any]:
+    """
+    Stream a time range of the metrics store to a file.
+
+    Rows are read and written ``chunk_size`` at a time, so memory use does
+    not depend on how much history is exported.
+
+    Args:
+        store: Metrics store to read from
+        output_path: Destination file
+        fmt: One of ``csv``, ``jsonl`` or ``parquet``
+        start: Inclusive start (datetime or epoch seconds), defaults to the oldest sample
+        end: Exclusive end (datetime or epoch seconds), defaults to the newest sample
+        columns: Metric columns to export, defaults to all features
+        compress: Gzip the output (parquet uses gzip page compression)
+        chunk_size: Rows read from the store per chunk
+
+    Returns:
+        Throughput report with rows, bytes, seconds, rows_per_sec and mb_per_sec
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported export format '{fmt}', expected one of {FORMATS}")
+
+    # Default to every stored column except the internal row id
+    columns = list(columns) if columns else [c for c in store.columns() if c not in ('id', 'timestamp')]
+    chunks = store.iter_chunks(start=start, end=end, columns=columns, chunk_size=chunk_size)
+    header = ['timestamp'] + columns
+
+    started = time.perf_counter()
+    rows = WRITERS[fmt](chunks, header, output_path, compress, store.column_types())
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    size = os.path.getsize(output_path)
+
+    report = {
+        'rows': rows,
+        'bytes': size,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1),
+        'mb_per_sec': round(size / elapsed / 1024 ** 2, 2)
+    }
+    logger.info(f"Exported {rows} rows to {output_path} in {report['seconds']}s "
+                f"({report['rows_per_sec']} rows/s, {report['mb_per_sec']} MB/s)")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export VitalWatch metric history")
+    parser.add_argument('output', help="Output file")
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--start', type=datetime.fromisoformat, help="Start time, e.g. 2024-05-01T00:00")
+    parser.add_argument('--end', type=datetime.fromisoformat, help="End time (exclusive)")
+    parser.add_argument('--columns', help="Comma-separated metric columns")
+    parser.add_argument('--gzip', action='store_true', help="Compress the output")
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(get_resource_path('config/config.yaml'), 'r') as file:
+        config = yaml.safe_load(file)
+    store = MetricsStore(resolve_db_path(config['database']['url'], get_resource_path('src/data')))
+
+    report = export_metrics(
+        store, args.output, fmt=args.format, start=args.start, end=args.end,
+        columns=args.columns.split(',') if args.columns else None,
+        compress=args.gzip, chunk_size=args.chunk_size
+    )
+    print(report)
@@ -0,0 +1,378 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from src.database.db import FEATURE_COLUMNS, extract_row
+
+logger = logging.getLogger(__name__)
+
+# Table definitions. Append-only tables only ever gain rows with a growing
+# integer `id`, which lets the backup job copy just the new tail each run.
+SCHEMAS = {
+    'metrics': (
+        "CREATE TABLE IF NOT EXISTS metrics ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "timestamp REAL NOT NULL, "
+        + ", ".join(f"{name} REAL" for name in FEATURE_COLUMNS)
+        + ")"
+    ),
+    'incidents': (
+        "CREATE TABLE IF NOT EXISTS incidents ("
+        "id TEXT PRIMARY KEY, "
+        "start_time REAL NOT NULL, "
+        "end_time REAL NOT NULL, "
+        "peak_score REAL, "
+        "severity TEXT, "
+        "samples INTEGER, "
+        "contributors TEXT, "
+        "status TEXT, "
+        "updated REAL)"
+    ),
+    'state': (
+        "CREATE TABLE IF NOT EXISTS state ("
+        "name TEXT PRIMARY KEY, "
+        "data BLOB NOT NULL, "
+        "updated REAL NOT NULL)"
+    ),
+    # Outbox of the alert dispatcher; rows stay until sent or given up on
+    'alerts': (
+        "CREATE TABLE IF NOT EXISTS alerts ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "channel TEXT NOT NULL, "
+        "created REAL NOT NULL, "
+        "payload TEXT NOT NULL, "
+        "status TEXT NOT NULL, "
+        "attempts INTEGER NOT NULL DEFAULT 0, "
+        "next_attempt REAL NOT NULL, "
+        "error TEXT, "
+        "updated REAL)"
+    ),
+}
+
+# Columns added after a table was first released. They are appended to
+# existing databases on open, so old and new files share one column order.
+MIGRATIONS = {
+    'metrics': [
+        ('anomaly_score', 'REAL'),
+        ('anomaly_level', 'REAL'),
+        ('severity', 'TEXT'),
+    ],
+    'incidents': [
+        ('comovements', 'TEXT'),
+    ],
+}
+
+# Columns written by insert_rows, in addition to the model features
+RESULT_COLUMNS = ['anomaly_score', 'anomaly_level', 'severity']
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_metrics_timestamp ON metrics (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_incidents_end ON incidents (end_time)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_pending ON alerts (channel, status, next_attempt)",
+]
+
+APPEND_ONLY_TABLES = {'metrics'}
+
+
+def resolve_db_path(url: str, base_dir: str) -> str:
+    """
+    Turn the `database.url` setting into a filesystem path.
+
+    Args:
+        url: SQLite URL such as ``sqlite:///system_monitor.db``
+        base_dir: Directory used for relative database paths
+
+    Returns:
+        Absolute path of the database file
+    """
+    prefix = 'sqlite:///'
+    if not url.startswith(prefix):
+        raise ValueError(f"Unsupported database url: {url}")
+    path = os.path.expanduser(url[len(prefix):])
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    return path
+
+
+def migrate(conn: sqlite3.Connection, schema: str = 'main') -> None:
+    """Add any columns from MIGRATIONS that a database does not have yet."""
+    for table, columns in MIGRATIONS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+        for name, column_type in columns:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {name} {column_type}")
+
+
+def to_epoch(value: Any) -> float:
+    """Convert a datetime or number into seconds since the epoch."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class MetricsStore:
+    """SQLite store for collected metrics, safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._init_schema()
+        logger.info(f"Metrics store opened at {path}")
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            # WAL lets readers (export, backup) run without blocking the writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        conn = self.connection()
+        with conn:
+            for schema in SCHEMAS.values():
+                conn.execute(schema)
+            migrate(conn)
+            for index in INDEXES:
+                conn.execute(index)
+
+    def insert_metrics(self, metrics: Dict[str, Any]) -> None:
+        """
+        Store one SystemMonitor snapshot.
+
+        Args:
+            metrics: Snapshot returned by SystemMonitor.collect_metrics(),
+                optionally carrying the detector result under ``anomaly``
+        """
+        row = extract_row(metrics)
+        anomaly = metrics.get('anomaly') or {}
+        row['anomaly_score'] = anomaly.get('score')
+        row['anomaly_level'] = anomaly.get('anomaly_level')
+        row['severity'] = anomaly.get('severity')
+        self.insert_rows([row])
+
+    def insert_rows(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Store feature rows as produced by ``extract_row``, plus any
+        RESULT_COLUMNS they carry.
+
+        Returns:
+            Number of rows written
+        """
+        columns = ['timestamp'] + FEATURE_COLUMNS + RESULT_COLUMNS
+        values = [
+            tuple(to_epoch(row['timestamp']) if col == 'timestamp' else row.get(col) for col in columns)
+            for row in rows
+        ]
+        if not values:
+            return 0
+
+        placeholders = ", ".join("?" for _ in columns)
+        sql = f"INSERT INTO metrics ({', '.join(columns)}) VALUES ({placeholders})"
+        conn = self.connection()
+        with self._write_lock, conn:
+            conn.executemany(sql, values)
+        return len(values)
+
+    def columns(self, table: str = 'metrics') -> List[str]:
+        """Return the column names of a table in schema order."""
+        return [row[1] for row in self.connection().execute(f"PRAGMA table_info({table})")]
+
+    def column_types(self, table: str = 'metrics') -> Dict[str, str]:
+        """Return each column's declared SQLite type, e.g. ``REAL`` or ``TEXT``."""
+        return {row[1]: row[2].upper() for row in self.connection().execute(f"PRAGMA table_info({table})")}
+
+    def iter_chunks(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                    columns: Optional[Sequence[str]] = None,
+                    chunk_size: int = 5000) -> Iterator[List[Tuple]]:
+        """
+        Stream metric rows in timestamp order, one chunk at a time.
+
+        Chunks are fetched with keyset pagination on ``id``, so memory stays
+        bounded by ``chunk_size`` and no read transaction is held between
+        chunks, whatever the size of the range.
+
+        Args:
+            start: Inclusive lower bound (datetime or epoch seconds)
+            end: Exclusive upper bound (datetime or epoch seconds)
+            columns: Columns to return after ``timestamp``, defaults to all features
+            chunk_size: Maximum rows per chunk
+
+        Yields:
+            Lists of tuples ``(timestamp, *columns)``
+        """
+        columns = list(columns) if columns else list(FEATURE_COLUMNS)
+        unknown = set(columns) - set(self.columns())
+        if unknown:
+            raise ValueError(f"Unknown metric columns: {sorted(unknown)}")
+
+        conn = self.connection()
+        conditions = ["id > ?"]
+        bounds: List[Any] = []
+        last_id = 0
+        # Narrow the id range through the timestamp index so a short range in
+        # a long history does not scan the whole table
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            bounds.append(to_epoch(start))
+            first_id = conn.execute(
+                "SELECT MIN(id) FROM metrics WHERE timestamp >= ?", (to_epoch(start),)
+            ).fetchone()[0]
+            if first_id is None:
+                return
+            last_id = first_id - 1
+        if end is not None:
+            conditions.append("timestamp < ?")
+            bounds.append(to_epoch(end))
+            end_id = conn.execute(
+                "SELECT MAX(id) FROM metrics WHERE timestamp < ?", (to_epoch(end),)
+            ).fetchone()[0]
+            if end_id is None:
+                return
+            conditions.append("id <= ?")
+            bounds.append(end_id)
+
+        sql = (
+            f"SELECT id, timestamp, {', '.join(columns)} FROM metrics "
+            f"WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+        )
+        while True:
+            rows = conn.execute(sql, [last_id] + bounds + [chunk_size]).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [row[1:] for row in rows]
+
+    def upsert_incident(self, incident: Dict[str, Any]) -> None:
+        """Insert or replace an incident record keyed by its ``id``."""
+        conn = self.connection()
+        with self._write_lock, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO incidents (id, start_time, end_time, peak_score, severity, "
+                "samples, contributors, status, updated, comovements) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (incident['id'], incident['start'], incident['end'], incident['peak_score'],
+                 incident['severity'], incident['samples'], json.dumps(incident['contributors']),
+                 incident['status'], time.time(), json.dumps(incident.get('comovements') or []))
+            )
+
+    def incidents(self, since: Optional[Any] = None, until: Optional[Any] = None,
+                  limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Return stored incidents, most recent first.
+
+        Args:
+            since: Only incidents still active at or after this time
+            until: Only incidents that started at or before this time
+            limit: Maximum number of incidents
+        """
+        conditions, bounds = [], []
+        if since is not None:
+            conditions.append("end_time >= ?")
+            bounds.append(to_epoch(since))
+        if until is not None:
+            conditions.append("start_time <= ?")
+            bounds.append(to_epoch(until))
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self.connection().execute(
+            "SELECT id, start_time, end_time, peak_score, severity, samples, contributors, status, comovements "
+            f"FROM incidents {where}ORDER BY end_time DESC LIMIT ?",
+            bounds + [limit]
+        ).fetchall()
+        return [
+            {
+                'id': row[0], 'start': row[1], 'end': row[2], 'peak_score': row[3],
+                'severity': row[4], 'samples': row[5],
+                'contributors': [tuple(pair) for pair in json.loads(row[6] or '[]')],
+                'status': row[7],
+                'comovements': [tuple(triple) for triple in json.loads(row[8] or '[]')]
+            }
+            for row in rows
+        ]
+
+    def save_state(self, name: str, data: bytes) -> None:
+        """Store a serialised model state (baselines, sketches) under ``name``."""
+        conn = self.connection()
+        with self._write_lock, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO state (name, data, updated) VALUES (?, ?, ?)",
+                (name, sqlite3.Binary(data), time.time())
+            )
+
+    def load_state(self, name: str) -> Optional[bytes]:
+        """Return the state stored under ``name``, or None."""
+        row = self.connection().execute("SELECT data FROM state WHERE name = ?", (name,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def enqueue_alerts(self, channels: Sequence[str], alert: Dict[str, Any]) -> None:
+        """Queue one alert for each channel in the outbox."""
+        now = time.time()
+        payload = json.dumps(alert, default=str)
+        conn = self.connection()
+        with self._write_lock, conn:
+            conn.executemany(
+                "INSERT INTO alerts (channel, created, payload, status, next_attempt, updated) "
+                "VALUES (?, ?, ?, 'pending', ?, ?)",
+                [(channel, now, payload, now, now) for channel in channels]
+            )
+
+    def pending_alerts(self, channel: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Return a channel's unsent alerts, oldest first, with their outbox ``id``, ``attempts`` and ``next_attempt``."""
+        rows = self.connection().execute(
+            "SELECT id, created, payload, attempts, next_attempt FROM alerts "
+            "WHERE channel = ? AND status = 'pending' ORDER BY id LIMIT ?",
+            (channel, limit)
+        ).fetchall()
+        return [
+            dict(json.loads(row[2]), id=row[0], created=row[1], attempts=row[3], next_attempt=row[4])
+            for row in rows
+        ]
+
+    def update_alerts(self, ids: Sequence[int], status: str, next_attempt: Optional[float] = None,
+                      error: Optional[str] = None) -> None:
+        """
+        Record a delivery attempt for outbox rows.
+
+        Args:
+            ids: Outbox row IDs
+            status: ``sent``, ``failed`` or ``pending`` to retry at ``next_attempt``
+            next_attempt: Earliest retry time in epoch seconds, for ``pending``
+            error: Reason the attempt failed
+        """
+        now = time.time()
+        conn = self.connection()
+        with self._write_lock, conn:
+            conn.executemany(
+                "UPDATE alerts SET status = ?, attempts = attempts + 1, "
+                "next_attempt = COALESCE(?, next_attempt), error = ?, updated = ? WHERE id = ?",
+                [(status, next_attempt, error, now, alert_id) for alert_id in ids]
+            )
+
+    def prune_alerts(self, before: float) -> int:
+        """Delete sent or failed alerts last touched before ``before``; returns the number removed."""
+        conn = self.connection()
+        with self._write_lock, conn:
+            return conn.execute(
+                "DELETE FROM alerts WHERE status != 'pending' AND updated < ?", (before,)
+            ).rowcount
+
+    def count(self, table: str = 'metrics') -> int:
+        """Return the number of rows in a table."""
+        return self.connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the calling thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
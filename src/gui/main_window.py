@@ -6,10 +6,12 @@ import threading
 import time
 from typing import Dict, Any, Optional, List
 import yaml
+import numpy as np
 import pandas as pd
 import edge_tts
 import subprocess
 import concurrent.futures
+import logging
 import speech_recognition as sr
 from PyQt5.QtCore import pyqtSlot
 
@@ -19,7 +21,7 @@ from PyQt5.QtWidgets import (
     QHeaderView, QGroupBox, QCheckBox, QButtonGroup, QRadioButton, 
     QApplication, QGraphicsOpacityEffect, QLineEdit, QTextEdit, 
     QDialog, QListWidget, QListWidgetItem, QMessageBox, QSystemTrayIcon,
-    QMenu, QAction, QSizePolicy
+    QMenu, QAction, QSizePolicy, QComboBox
 )
 
 from PyQt5.QtCore import Qt, QSize, QThread, QTimer, pyqtSignal, QObject
@@ -29,12 +31,61 @@ from PyQt5.QtChart import QChart, QChartView, QLineSeries, QValueAxis
 from src.gui.styleSheet import STYLE_SHEET
 from src.assistant.detect_os import get_os_distro
 from src.anomaly.detect import detect_anomalies
+from src.anomaly.incidents import IncidentTracker
+from src.monitors.process_usage import format_bytes, format_seconds
+from src.monitors.flight_recorder import RECORDED_METRICS, RECORDINGS_DIR, list_recordings, load_recording
 from src.assistant.llm_client import query_llm, summarize_output
 from src.assistant.parser import parse_response
 from src.assistant.executor import is_safe, execute
 import src.assistant.config
 from src.gui.system_tray import SystemMonitorTray
 
+logger = logging.getLogger(__name__)
+
+# (header, incident key) pairs shown in the anomaly table
+ANOMALY_TABLE_COLUMNS = [
+    ("Incident", 'id'),
+    ("Start", 'start'),
+    ("End", 'end'),
+    ("Peak Score", 'peak_score'),
+    ("Severity", 'severity'),
+    ("Samples", 'samples'),
+    ("Status", 'status'),
+    ("Top Contributors", 'contributors'),
+    ("Moving Together", 'comovements')
+]
+
+# (header, flag key) pairs shown in the suspicious process table
+PROCESS_FLAG_COLUMNS = [
+    ("PID", 'pid'),
+    ("Process", 'name'),
+    ("Issue", 'issue'),
+    ("RSS", 'rss'),
+    ("Growth", 'growth_per_hour'),
+    ("CPU", 'cpu_percent'),
+    ("Since", 'since')
+]
+
+# (label, seconds) choices for the top consumers window
+USAGE_WINDOWS = [("Last hour", 3600), ("Last 24 hours", 86400), ("Last 7 days", 7 * 86400)]
+
+# (label, usage metric) choices for ranking top consumers
+USAGE_RANKINGS = [("CPU time", 'cpu_seconds'), ("Disk IO", 'io_bytes'), ("Peak memory", 'peak_rss')]
+
+def format_forecast(name: str, forecast: Dict[str, Any]) -> str:
+    """One resource's capacity forecast, e.g. ``Disk 81.6% +2.1 GB/h, 95% in 1.3 days``"""
+    rate = forecast['rate']
+    if abs(rate) >= 1024 ** 3:
+        text = f"{name.capitalize()} {forecast['percent']:.1f}% {rate / 1024 ** 3:+.1f} GB/h"
+    else:
+        text = f"{name.capitalize()} {forecast['percent']:.1f}% {rate / 1024 ** 2:+.0f} MB/h"
+    seconds = forecast['seconds_to_threshold']
+    if seconds is None:
+        return text + ", stable"
+    when = f"{seconds / 86400:.1f} days" if seconds >= 86400 else f"{seconds / 3600:.1f} h"
+    text += f", {forecast['threshold']:g}% in {when}"
+    return f'<span style="color: #E74C3C;">{text}</span>' if forecast['warning'] else text
+
 def get_resource_path(relative_path: str) -> str:
     """Get the absolute path to bundled files when using PyInstaller."""
     if getattr(sys, 'frozen', False):
@@ -226,9 +277,12 @@ class NovaWorker(QObject):
 class MainWindow(QMainWindow):
     """Main application window for VitalWatch"""
     voice_input_received = pyqtSignal(str)
-    def __init__(self):
+    anomaly_detection_finished = pyqtSignal(object)
+    def __init__(self, incident_tracker: IncidentTracker):
         super().__init__()
         self.config = load_config()
+        # The app's tracker, shared with live detection so manual runs merge into the same incidents
+        self.incident_tracker = incident_tracker
         self._init_properties()
         self._init_ui_components()
         self.setup_ui()
@@ -256,10 +310,16 @@ class MainWindow(QMainWindow):
         self.data_points = 0
         self.max_data_points = 50
         self.show_all_processes = False
+        # Set by the app when process usage tracking is enabled
+        self.process_usage = None
 
         # Anomaly detection configuration
         self.THRESHOLD_STEP = self.config['monitoring']['anomaly_detection_interval']
         self.OUTPUT_CSV = get_resource_path("src/data/preprocess_data.csv")
+        self.incident_rows: Dict[str, int] = {}
+        # Set by the app when the ensemble is enabled; manual runs score the whole CSV with its worker pool
+        self.ensemble = None
+        self.anomaly_detection_finished.connect(self._anomaly_detection_done, Qt.QueuedConnection)
     
         # Add this line for chat history
         self.chat_history = []
@@ -286,6 +346,7 @@ class MainWindow(QMainWindow):
         
         # Chart series
         self.cpu_series = QLineSeries()
+        self.anomaly_series = QLineSeries()  # anomaly level overlaid on the CPU chart
         self.memory_series = QLineSeries()
         self.disk_series = QLineSeries()
         self.network_upload_series = QLineSeries()
@@ -322,26 +383,37 @@ class MainWindow(QMainWindow):
                 self.assistant_icon.setText("Nova")
 
     def run_anomaly_detection(self) -> None:
-        """Run anomaly detection manually"""
+        """Run anomaly detection manually, off the GUI thread"""
+        self.anomaly_status.setText("Running anomaly detection...")
+        self.detect_button.setEnabled(False)
+        threading.Thread(target=self._detect_in_background, daemon=True).start()
+
+    def _detect_in_background(self) -> None:
+        """Score the CSV and fold its anomalies into the stored incidents"""
         try:
-            self.anomaly_status.setText("Running anomaly detection...")
-            self.detect_button.setEnabled(False)
-            
-            # Simulate detection (replace with actual detection logic)
-            anomalies = detect_anomalies(self.OUTPUT_CSV, self.THRESHOLD_STEP)
+            scored = detect_anomalies(self.OUTPUT_CSV, self.THRESHOLD_STEP, ensemble=self.ensemble)
+            changed = self.incident_tracker.observe_batch(scored) if scored is not None else []
+            self.anomaly_detection_finished.emit(changed)
+        except Exception as e:
+            self.anomaly_detection_finished.emit(e)
+
+    @pyqtSlot(object)
+    def _anomaly_detection_done(self, result) -> None:
+        """Show the outcome of a background detection run"""
+        try:
+            if isinstance(result, Exception):
+                self.anomaly_status.setText(f"Detection failed: {result}")
+                return
             
-            if anomalies is not None :
-                self.update_anomaly_table(anomalies)
-                self.anomaly_status.setText(f"Detection complete. Found {len(anomalies)} anomalies.")
+            if result:
+                self.update_anomaly_table(result)
+                self.anomaly_status.setText(f"Detection complete. {len(result)} new or updated incidents.")
             else:
-                self.anomaly_status.setText("Detection complete. No anomalies found.")
+                self.anomaly_status.setText("Detection complete. No new incidents.")
             
             # Update last run time
             current_time = time.strftime("%Y-%m-%d %H:%M:%S")
             self.last_run_time.setText(f"Last run: {current_time}")
-            
-        except Exception as e:
-            self.anomaly_status.setText(f"Detection failed: {e}")
         finally:
             self.detect_button.setEnabled(True)
 
@@ -682,6 +754,118 @@ class MainWindow(QMainWindow):
         layout.addLayout(button_layout)
         dialog.exec_()
 
+    def show_flight_recordings(self) -> None:
+        """Browse the full-resolution recordings written when incidents opened"""
+        paths = list_recordings(os.path.join(get_resource_path("src/data"), RECORDINGS_DIR))
+        if not paths:
+            QMessageBox.information(self, "Flight Recordings", "No flight recordings yet.")
+            return
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Flight Recordings")
+        dialog.resize(1000, 650)
+        layout = QHBoxLayout(dialog)
+        
+        recording_list = QListWidget()
+        recording_list.setMaximumWidth(260)
+        for path in paths:
+            item = QListWidgetItem(os.path.basename(path)[len("flight_"):-len(".npz")])
+            item.setData(Qt.UserRole, path)
+            recording_list.addItem(item)
+        
+        detail_layout = QVBoxLayout()
+        summary_label = QLabel()
+        series_combo = QComboBox()
+        series_combo.addItems(list(RECORDED_METRICS) + ["per-core cpu"])
+        chart = QChart()
+        chart.setAnimationOptions(QChart.NoAnimation)
+        chart_view = QChartView(chart)
+        chart_view.setRenderHint(QPainter.Antialiasing)
+        process_table = QTableWidget()
+        process_table.setColumnCount(5)
+        process_table.setHorizontalHeaderLabels(["PID", "Name", "CPU %", "Memory %", "RSS"])
+        process_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        process_table.verticalHeader().setVisible(False)
+        for i in range(process_table.columnCount()):
+            process_table.horizontalHeader().setSectionResizeMode(i, QHeaderView.Stretch)
+        
+        detail_layout.addWidget(summary_label)
+        detail_layout.addWidget(series_combo)
+        detail_layout.addWidget(chart_view, 2)
+        detail_layout.addWidget(QLabel("Top processes at the last scan before the incident"))
+        detail_layout.addWidget(process_table, 1)
+        layout.addWidget(recording_list)
+        layout.addLayout(detail_layout)
+        
+        loaded: Dict[str, Any] = {}
+        
+        def plot() -> None:
+            recording = loaded.get('recording')
+            if recording is None:
+                return
+            chart.removeAllSeries()
+            for axis in chart.axes():
+                chart.removeAxis(axis)
+            # Seconds relative to the incident start, so the lead-up is negative
+            offsets = recording['times'] - recording['incident']['start']
+            name = series_combo.currentText()
+            columns = recording['cores'].T if name == "per-core cpu" else [recording['metrics'][name]]
+            axis_x, axis_y = QValueAxis(), QValueAxis()
+            axis_x.setTitleText("Seconds from incident start")
+            axis_x.setLabelFormat("%d")
+            axis_y.setLabelFormat("%.1f")
+            chart.addAxis(axis_x, Qt.AlignBottom)
+            chart.addAxis(axis_y, Qt.AlignLeft)
+            low, high = np.inf, -np.inf
+            for values in columns:
+                series = QLineSeries()
+                for x, y in zip(offsets, values):
+                    if not np.isnan(y):
+                        series.append(float(x), float(y))
+                        low, high = min(low, y), max(high, y)
+                chart.addSeries(series)
+                series.attachAxis(axis_x)
+                series.attachAxis(axis_y)
+            chart.legend().hide()
+            if len(offsets):
+                axis_x.setRange(float(offsets.min()), float(offsets.max()))
+            if np.isfinite(low):
+                axis_y.setRange(float(low), float(high) if high > low else float(low) + 1)
+        
+        def show(item: QListWidgetItem) -> None:
+            try:
+                recording = load_recording(item.data(Qt.UserRole))
+            except (OSError, ValueError, KeyError) as e:
+                summary_label.setText(f"Unreadable recording: {e}")
+                return
+            loaded['recording'] = recording
+            incident = recording['incident']
+            start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(incident['start']))
+            summary_label.setText(
+                f"Incident {incident['id']} ({incident['severity']}) at {start}: "
+                f"{len(recording['times'])} samples, {len(recording['process_times'])} process scans"
+            )
+            # The last process scan at or before the incident started
+            scans = np.flatnonzero(recording['process_times'] <= incident['start'])
+            scan = scans[-1] if len(scans) else (len(recording['process_times']) - 1)
+            rows = []
+            if scan >= 0:
+                rows = [column for column in range(recording['pids'].shape[1]) if recording['pids'][scan, column]]
+            process_table.setRowCount(len(rows))
+            for row, column in enumerate(rows):
+                rss = recording['process_rss'][scan, column]
+                process_table.setItem(row, 0, QTableWidgetItem(str(recording['pids'][scan, column])))
+                process_table.setItem(row, 1, QTableWidgetItem(recording['names'][scan][column]))
+                process_table.setItem(row, 2, QTableWidgetItem(f"{recording['process_cpu'][scan, column]:.1f}"))
+                process_table.setItem(row, 3, QTableWidgetItem(f"{recording['process_memory'][scan, column]:.1f}"))
+                process_table.setItem(row, 4, QTableWidgetItem(format_bytes(rss) if not np.isnan(rss) else '--'))
+            plot()
+        
+        recording_list.currentItemChanged.connect(lambda item, _: item is not None and show(item))
+        series_combo.currentIndexChanged.connect(plot)
+        recording_list.setCurrentRow(0)
+        dialog.exec_()
+
     def clear_chat_history(self, dialog=None) -> None:
         """Clear the chat history"""
         reply = QMessageBox.question(
@@ -707,9 +891,17 @@ class MainWindow(QMainWindow):
             disk_data = metrics.get('disk', {})
             network_data = metrics.get('network', {})
             
-            self.cpu_percent.setText(f"CPU Usage: {cpu_data.get('cpu_percent', '--')}%")
-            self.memory_label.setText(f"Memory Usage: {memory_data.get('percent', '--')}%")
-            self.disk_label.setText(f"Disk Usage: {disk_data.get('percent', '--')}%")
+            # Alert thresholds, adapted to this host once enough history is sketched
+            thresholds = metrics.get('thresholds') or self.config['monitoring']['thresholds']
+            self.cpu_percent.setText(
+                f"CPU Usage: {cpu_data.get('cpu_percent', '--')}% (limit {thresholds['cpu']:.1f}%)"
+            )
+            self.memory_label.setText(
+                f"Memory Usage: {memory_data.get('percent', '--')}% (limit {thresholds['memory']:.1f}%)"
+            )
+            self.disk_label.setText(
+                f"Disk Usage: {disk_data.get('percent', '--')}% (limit {thresholds['disk']:.1f}%)"
+            )
             
             # Update network with proper formatting
             upload = network_data.get('upload_speed', 0)
@@ -722,6 +914,47 @@ class MainWindow(QMainWindow):
             '''
             self.network_label.setText(network_html)
 
+            # Live anomaly score published with the snapshot
+            anomaly = metrics.get('anomaly')
+            if anomaly and hasattr(self, 'anomaly_score_label'):
+                if anomaly['severity'] is None:
+                    self.anomaly_score_label.setText("Current anomaly score: model loading...")
+                elif anomaly['score'] is None:
+                    self.anomaly_score_label.setText("Current anomaly score: normal (pre-filter)")
+                else:
+                    self.anomaly_score_label.setText(
+                        f"Current anomaly score: {anomaly['score']:.3f} ({anomaly['severity']})"
+                    )
+
+            forecast = metrics.get('forecast')
+            if forecast and hasattr(self, 'forecast_label'):
+                self.forecast_label.setText(" | ".join(
+                    format_forecast(name, projection) for name, projection in forecast.items()
+                ))
+
+            drift = metrics.get('drift')
+            if drift and hasattr(self, 'drift_label'):
+                worst = drift['worst']
+                score = f"PSI {worst['psi']:.2f}" if 'psi' in worst else f"{worst['out_of_range']:.0%} out of range"
+                self.drift_label.setText(
+                    f"Model drift: {worst['feature']} {score} over {drift['samples']} samples"
+                    + (" - drift detected" if drift['drifted'] else "")
+                )
+
+            prefilter = metrics.get('prefilter')
+            if prefilter and hasattr(self, 'prefilter_label'):
+                rates = ", ".join(f"{name} {rate:.1%}" for name, rate in prefilter['hit_rates'].items())
+                self.prefilter_label.setText(
+                    f"Pre-filter: {rates or 'no detectors'} | forest skipped on "
+                    f"{prefilter['forest_skipped']:.1%} of {prefilter['samples']} samples"
+                )
+
+            firing = metrics.get('rules')
+            if firing is not None and hasattr(self, 'rule_status_label'):
+                self.rule_status_label.setText(
+                    "Rules firing: " + (", ".join(f"{rule['name']} ({rule['severity']})" for rule in firing) or "none")
+                )
+
             # Update charts
             self._update_charts(metrics)
             
@@ -743,8 +976,14 @@ class MainWindow(QMainWindow):
             upload_speed = float(metrics.get('network', {}).get('upload_speed', 0)) / 1024  # KB/s
             download_speed = float(metrics.get('network', {}).get('download_speed', 0)) / 1024  # KB/s
             
+            # Anomaly level (0..1) drawn on the CPU chart's percent scale
+            anomaly = metrics.get('anomaly') or {}
+            anomaly_level = anomaly.get('anomaly_level')
+            
             # Add current data points to each chart series
             self.cpu_series.append(self.data_points, cpu_percent)
+            if anomaly_level is not None:
+                self.anomaly_series.append(self.data_points, anomaly_level * 100)
             self.memory_series.append(self.data_points, memory_percent)
             self.disk_series.append(self.data_points, disk_percent)
             
@@ -774,6 +1013,9 @@ class MainWindow(QMainWindow):
                 self.network_upload_series.removePoints(0, 1)
                 self.network_download_series.removePoints(0, 1)
             
+            if self.anomaly_series.count() > self.max_data_points:
+                self.anomaly_series.removePoints(0, 1)
+            
             # Dynamically adjust network chart Y-axis based on both upload and download data
             if hasattr(self, 'network_chart'):
                 network_y_axis = self.network_chart.axisY()
@@ -950,27 +1192,61 @@ class MainWindow(QMainWindow):
                     self.process_table.setItem(row, 3, QTableWidgetItem(f"{process.get('cpu_percent', 0):.1f}%"))
                     self.process_table.setItem(row, 4, QTableWidgetItem(f"{process.get('memory_percent', 0):.1f}%"))
                     self.process_table.setItem(row, 5, QTableWidgetItem(process.get('create_time', '--')))
+            
+            self.update_top_consumers()
                     
         except Exception as e:
             print(f"Error updating process table: {e}")
 
-    def update_anomaly_table(self, anomalies: list) -> None:
-        """Update the anomaly detection table with new results"""
+    def update_top_consumers(self) -> None:
+        """Refresh the top consumers table for the selected window and ranking"""
         try:
-            if hasattr(self, 'anomaly_table'):
-                self.anomaly_table.setRowCount(len(anomalies))
+            if self.process_usage is None or not hasattr(self, 'usage_table'):
+                return
+            seconds = USAGE_WINDOWS[self.usage_window_combo.currentIndex()][1]
+            metric = USAGE_RANKINGS[self.usage_ranking_combo.currentIndex()][1]
+            rows = self.process_usage.top(metric, seconds, n=15)
+            
+            self.usage_table.setRowCount(len(rows))
+            for row, usage in enumerate(rows):
+                cpu, io, rss = usage['cpu_seconds'], usage['io_bytes'], usage['peak_rss']
+                self.usage_table.setItem(row, 0, QTableWidgetItem(usage['name']))
+                self.usage_table.setItem(row, 1, QTableWidgetItem(usage['command'] or '--'))
+                self.usage_table.setItem(row, 2, QTableWidgetItem(format_seconds(cpu) if cpu is not None else '--'))
+                self.usage_table.setItem(row, 3, QTableWidgetItem(format_bytes(io) if io is not None else '--'))
+                self.usage_table.setItem(row, 4, QTableWidgetItem(format_bytes(rss) if rss is not None else '--'))
                 
-                for row, anomaly in enumerate(anomalies):
-                    for col, (key, value) in enumerate(anomaly.items()):
-                        item = QTableWidgetItem(str(value))
-                        self.anomaly_table.setItem(row, col, item)
+        except Exception as e:
+            logger.error(f"Error updating top consumers: {e}")
+
+    def update_anomaly_table(self, incidents: list) -> None:
+        """Add new incidents to the anomaly table and refresh changed ones in place"""
+        try:
+            if hasattr(self, 'anomaly_table'):
+                for incident in incidents:
+                    row = self.incident_rows.get(incident['id'])
+                    if row is None:
+                        row = self.anomaly_table.rowCount()
+                        self.anomaly_table.insertRow(row)
+                        self.incident_rows[incident['id']] = row
+                    
+                    for col, (_, key) in enumerate(ANOMALY_TABLE_COLUMNS):
+                        value = incident.get(key)
+                        if key == 'contributors':
+                            # Ranked (feature, share) pairs, e.g. "cpu_percent 54%"
+                            text = ", ".join(f"{name} {share:.0%}" for name, share in value) if value else '--'
+                        elif key == 'comovements':
+                            # Correlated metric pairs, e.g. "network_download_speed ~ steam io (+0.93)"
+                            text = ", ".join(f"{first} ~ {second} ({r:+.2f})" for first, second, r in value) if value else '--'
+                        elif key in ('start', 'end') and value is not None:
+                            text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
+                        else:
+                            text = str(value if value is not None else '--')
+                        self.anomaly_table.setItem(row, col, QTableWidgetItem(text))
                 
                 # Update status
                 if hasattr(self, 'anomaly_status'):
-                    if anomalies:
-                        self.anomaly_status.setText(f"Found {len(anomalies)} anomalies")
-                    else:
-                        self.anomaly_status.setText("No anomalies detected")
+                    self.anomaly_status.setText(f"Tracking {len(self.incident_rows)} incidents")
                 
                 # Update timestamp
                 if hasattr(self, 'last_run_time'):
@@ -980,6 +1256,34 @@ class MainWindow(QMainWindow):
         except Exception as e:
             logger.error(f"Error updating anomaly table: {e}")
 
+    def update_process_flags(self, flags: List[Dict[str, Any]]) -> None:
+        """Replace the suspicious process table with the processes flagged now"""
+        try:
+            if hasattr(self, 'process_flag_table'):
+                self.process_flag_table.setRowCount(len(flags))
+                for row, flag in enumerate(flags):
+                    for col, (_, key) in enumerate(PROCESS_FLAG_COLUMNS):
+                        value = flag.get(key)
+                        if key == 'rss':
+                            text = f"{value / 1024 ** 2:.0f} MB"
+                        elif key == 'growth_per_hour':
+                            text = f"{value / 1024 ** 2:+.1f} MB/h"
+                        elif key == 'cpu_percent':
+                            text = f"{value:.1f}%"
+                        elif key == 'since':
+                            text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
+                        else:
+                            text = str(value)
+                        self.process_flag_table.setItem(row, col, QTableWidgetItem(text))
+                
+                if hasattr(self, 'process_flag_label'):
+                    self.process_flag_label.setText(
+                        f"Suspicious processes: {len(flags)}" if flags else "Suspicious processes: none"
+                    )
+                    
+        except Exception as e:
+            logger.error(f"Error updating process flags: {e}")
+
     def toggle_process_view(self) -> None:
         """Toggle between showing all processes or limited view"""
         self.show_all_processes = not self.show_all_processes
@@ -1390,6 +1694,12 @@ class MainWindow(QMainWindow):
         main_container.setMinimumSize(520, 380)
         
         overview_layout.addWidget(main_container)
+        
+        # Capacity forecasts from the collector's trend models
+        self.forecast_label = QLabel("Capacity forecast: collecting history...")
+        self.forecast_label.setAlignment(Qt.AlignCenter)
+        self.forecast_label.setStyleSheet("font-size: 12px; padding: 5px;")
+        overview_layout.addWidget(self.forecast_label)
         self.tabs.addTab(overview_widget, "Overview")
 
         # Apply borders after all chart views are created
@@ -1444,6 +1754,16 @@ class MainWindow(QMainWindow):
             # Disable animations for real-time performance
             chart.setAnimationOptions(QChart.NoAnimation)
         
+        # Overlay the anomaly level on the CPU chart, sharing its axes
+        self.cpu_chart.addSeries(self.anomaly_series)
+        self.anomaly_series.setName("Anomaly Level")
+        anomaly_pen = QPen(QColor(155, 89, 182))
+        anomaly_pen.setWidth(2)
+        anomaly_pen.setStyle(Qt.DashLine)
+        self.anomaly_series.setPen(anomaly_pen)
+        for axis in self.cpu_chart.axes():
+            self.anomaly_series.attachAxis(axis)
+        
         # Setup Network chart with dual series (upload and download)
         self.network_chart.removeAllSeries()
         
@@ -1745,6 +2065,40 @@ class MainWindow(QMainWindow):
         self.process_table.verticalHeader().setVisible(False)
         
         processes_layout.addWidget(self.process_table)
+        
+        # Heaviest processes over a trailing window, from the usage summaries
+        usage_group = QGroupBox("Top Consumers")
+        usage_layout = QVBoxLayout(usage_group)
+        
+        usage_controls = QHBoxLayout()
+        self.usage_window_combo = QComboBox()
+        self.usage_window_combo.addItems([label for label, _ in USAGE_WINDOWS])
+        self.usage_window_combo.setCurrentIndex(1)
+        self.usage_ranking_combo = QComboBox()
+        self.usage_ranking_combo.addItems([label for label, _ in USAGE_RANKINGS])
+        self.usage_window_combo.currentIndexChanged.connect(self.update_top_consumers)
+        self.usage_ranking_combo.currentIndexChanged.connect(self.update_top_consumers)
+        usage_controls.addWidget(QLabel("Window:"))
+        usage_controls.addWidget(self.usage_window_combo)
+        usage_controls.addWidget(QLabel("Rank by:"))
+        usage_controls.addWidget(self.usage_ranking_combo)
+        usage_controls.addStretch()
+        
+        self.usage_table = QTableWidget()
+        self.usage_table.setColumnCount(5)
+        self.usage_table.setHorizontalHeaderLabels(["Name", "Command", "CPU Time", "Disk IO", "Peak RSS"])
+        self.usage_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.usage_table.setSelectionMode(QTableWidget.NoSelection)
+        self.usage_table.setFocusPolicy(Qt.NoFocus)
+        
+        usage_header = self.usage_table.horizontalHeader()
+        for i in range(self.usage_table.columnCount()):
+            usage_header.setSectionResizeMode(i, QHeaderView.Stretch)
+        self.usage_table.verticalHeader().setVisible(False)
+        
+        usage_layout.addLayout(usage_controls)
+        usage_layout.addWidget(self.usage_table)
+        processes_layout.addWidget(usage_group)
         self.tabs.addTab(processes_widget, "Processes")
 
 
@@ -1770,15 +2124,37 @@ class MainWindow(QMainWindow):
         self.last_run_time = QLabel("Last run: Never")
         self.last_run_time.setStyleSheet("font-size: 12px; color: gray; padding: 5px;")
         
+        self.anomaly_score_label = QLabel("Current anomaly score: --")
+        self.anomaly_score_label.setStyleSheet("font-size: 12px; padding: 5px;")
+        
+        self.recordings_button = QPushButton("Flight Recordings")
+        self.recordings_button.setFixedHeight(35)
+        self.recordings_button.clicked.connect(self.show_flight_recordings)
+        
         button_layout.addWidget(self.detect_button)
+        button_layout.addWidget(self.recordings_button)
         button_layout.addWidget(self.last_run_time)
+        button_layout.addWidget(self.anomaly_score_label)
+        
+        # Threshold rules currently firing, from the live rule engine
+        self.rule_status_label = QLabel("Rules firing: none")
+        self.rule_status_label.setAlignment(Qt.AlignCenter)
+        self.rule_status_label.setStyleSheet("font-size: 12px; padding: 5px;")
+        
+        # How far live model inputs have drifted from the training data
+        self.drift_label = QLabel("Model drift: not checked yet")
+        self.drift_label.setAlignment(Qt.AlignCenter)
+        self.drift_label.setStyleSheet("font-size: 12px; color: gray; padding: 5px;")
+        
+        # Per-detector hit rates of the statistical pre-filter in front of the forest
+        self.prefilter_label = QLabel("Pre-filter: disabled")
+        self.prefilter_label.setAlignment(Qt.AlignCenter)
+        self.prefilter_label.setStyleSheet("font-size: 12px; color: gray; padding: 5px;")
         
         # Anomaly table
         self.anomaly_table = QTableWidget()
-        self.anomaly_table.setColumnCount(4)
-        self.anomaly_table.setHorizontalHeaderLabels([
-            "Timestamp", "Type", "Value", "Severity"
-        ])
+        self.anomaly_table.setColumnCount(len(ANOMALY_TABLE_COLUMNS))
+        self.anomaly_table.setHorizontalHeaderLabels([header for header, _ in ANOMALY_TABLE_COLUMNS])
         self.anomaly_table.setEditTriggers(QTableWidget.NoEditTriggers)
         self.anomaly_table.setSelectionMode(QTableWidget.NoSelection)
         self.anomaly_table.setFocusPolicy(Qt.NoFocus)
@@ -1790,8 +2166,34 @@ class MainWindow(QMainWindow):
         
         anomaly_layout.addWidget(self.anomaly_status)
         anomaly_layout.addWidget(button_container)
+        anomaly_layout.addWidget(self.rule_status_label)
+        # Processes with a sustained memory leak or CPU pinned for minutes
+        self.process_flag_label = QLabel("Suspicious processes: none")
+        self.process_flag_label.setAlignment(Qt.AlignCenter)
+        self.process_flag_label.setStyleSheet("font-size: 12px; padding: 5px;")
+        
+        self.process_flag_table = QTableWidget()
+        self.process_flag_table.setColumnCount(len(PROCESS_FLAG_COLUMNS))
+        self.process_flag_table.setHorizontalHeaderLabels([header for header, _ in PROCESS_FLAG_COLUMNS])
+        self.process_flag_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.process_flag_table.setSelectionMode(QTableWidget.NoSelection)
+        self.process_flag_table.setFocusPolicy(Qt.NoFocus)
+        self.process_flag_table.setMaximumHeight(150)
+        
+        flag_header = self.process_flag_table.horizontalHeader()
+        for i in range(self.process_flag_table.columnCount()):
+            flag_header.setSectionResizeMode(i, QHeaderView.Stretch)
+        self.process_flag_table.verticalHeader().setVisible(False)
+        
+        anomaly_layout.addWidget(self.drift_label)
+        anomaly_layout.addWidget(self.prefilter_label)
+        anomaly_layout.addWidget(self.process_flag_label)
+        anomaly_layout.addWidget(self.process_flag_table)
         anomaly_layout.addWidget(self.anomaly_table)
         self.tabs.addTab(anomaly_widget, "Anomaly Detection")
+        
+        # Show incidents stored by earlier sessions, oldest first
+        self.update_anomaly_table(list(reversed(self.incident_tracker.recent())))
 
     def _setup_settings_tab(self, tabs: QTabWidget) -> None:
         """Setup settings tab"""
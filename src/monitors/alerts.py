@@ -0,0 +1,397 @@
+import argparse
+import json
+import logging
+import random
+import smtplib
+import socket
+import ssl
+import time
+import urllib.error
+import urllib.request
+from email.message import EmailMessage
+from threading import Event, Thread
+from typing import Any, Dict, List, Optional, Sequence
+
+import yaml
+
+from src.anomaly.severity import SEVERITY_LEVELS
+from src.database.store import MetricsStore, resolve_db_path
+from src.monitors.process_monitor import get_resource_path
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+    """A channel could not deliver a batch; ``retry`` is False when trying again cannot help."""
+
+    def __init__(self, message: str, retry: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry = retry
+        self.retry_after = retry_after
+
+
+def _severity_index(severity: Optional[str]) -> int:
+    return SEVERITY_LEVELS.index(severity) if severity in SEVERITY_LEVELS else 0
+
+
+def format_subject(alerts: Sequence[Dict[str, Any]]) -> str:
+    """One line for a batch, e.g. ``VitalWatch: 3 alerts (highest: critical)``."""
+    if len(alerts) == 1:
+        return f"VitalWatch: {alerts[0]['title']}"
+    highest = max((alert.get('severity') for alert in alerts), key=_severity_index)
+    return f"VitalWatch: {len(alerts)} alerts (highest: {highest})"
+
+
+def format_text(alerts: Sequence[Dict[str, Any]]) -> str:
+    """Plain-text body listing every alert of a batch, oldest first."""
+    lines = []
+    for alert in alerts:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(alert['timestamp']))
+        lines.append(f"[{alert.get('severity', '?')}] {when} {alert['title']}")
+        if alert.get('body'):
+            lines.extend(f"    {line}" for line in alert['body'].splitlines())
+    return "\n".join(lines)
+
+
+class EmailChannel:
+    """
+    Sends each batch as one email over SMTP.
+
+    ``security`` is ``starttls`` (upgrade a plain connection, usually port
+    587), ``ssl`` (TLS from the start, usually port 465) or ``none`` for a
+    local relay or test server. Authentication and recipient errors are
+    reported as permanent, connection problems as retryable.
+    """
+
+    def __init__(self, smtp_server: str, smtp_port: int = 587, username: str = '', password: str = '',
+                 recipients: Sequence[str] = (), sender: Optional[str] = None, security: str = 'starttls',
+                 timeout: float = 30):
+        if security not in ('starttls', 'ssl', 'none'):
+            raise ValueError(f"Unknown SMTP security: {security}")
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.username = username
+        self.password = password
+        self.recipients = list(recipients)
+        self.sender = sender or username or f"vitalwatch@{socket.gethostname()}"
+        self.security = security
+        self.timeout = timeout
+
+    def send(self, alerts: Sequence[Dict[str, Any]]) -> None:
+        message = EmailMessage()
+        message['Subject'] = format_subject(alerts)
+        message['From'] = self.sender
+        message['To'] = ", ".join(self.recipients)
+        message.set_content(format_text(alerts))
+        try:
+            if self.security == 'ssl':
+                smtp = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=self.timeout,
+                                        context=ssl.create_default_context())
+            else:
+                smtp = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+            with smtp:
+                if self.security == 'starttls':
+                    smtp.starttls(context=ssl.create_default_context())
+                if self.username:
+                    smtp.login(self.username, self.password)
+                smtp.send_message(message)
+        except (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused,
+                smtplib.SMTPSenderRefused, smtplib.SMTPNotSupportedError) as e:
+            raise DeliveryError(f"SMTP rejected the message: {e}", retry=False)
+        except (smtplib.SMTPException, OSError) as e:
+            raise DeliveryError(f"SMTP delivery failed: {e}")
+
+
+class SlackChannel:
+    """
+    Posts each batch as one message to a Slack incoming webhook.
+
+    HTTP 429 is retried after the ``Retry-After`` Slack sends, other 4xx
+    answers (a revoked or mistyped webhook) are permanent, and 5xx and
+    network errors are retryable.
+    """
+
+    def __init__(self, webhook_url: str, channel: Optional[str] = None, timeout: float = 10):
+        self.webhook_url = webhook_url
+        self.channel = channel
+        self.timeout = timeout
+
+    def send(self, alerts: Sequence[Dict[str, Any]]) -> None:
+        payload = {'text': f"*{format_subject(alerts)}*\n{format_text(alerts)}"}
+        if self.channel:
+            payload['channel'] = self.channel
+        request = urllib.request.Request(
+            self.webhook_url, data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                retry_after = e.headers.get('Retry-After')
+                raise DeliveryError("Slack rate limit hit",
+                                    retry_after=float(retry_after) if retry_after else None)
+            raise DeliveryError(f"Slack webhook answered {e.code} {e.reason}", retry=e.code >= 500)
+        except (urllib.error.URLError, OSError) as e:
+            raise DeliveryError(f"Slack webhook unreachable: {e}")
+
+
+class AlertDispatcher:
+    """
+    Delivers incident, rule and drift alerts to the configured channels.
+
+    ``submit`` only writes the alert to the store's outbox, once per
+    channel, and wakes the channel senders, so the collection loop and the
+    GUI never wait on the network; pending alerts survive restarts. Each
+    channel has its own sender thread working through its queue in the
+    outbox:
+
+    - alerts are held for ``batch_seconds`` after the oldest one arrived so
+      a burst goes out as one message of up to ``max_batch`` alerts
+    - messages are rate limited per channel by a token bucket refilled at
+      ``rates[channel]`` messages per hour with a burst of ``burst``;
+      alerts held back by the limit simply join the next batch
+    - a failed batch is retried with exponential back-off from
+      ``retry_seconds`` up to ``max_retry_seconds`` (with jitter, and no
+      sooner than a Retry-After), and given up on after ``max_attempts``
+      attempts or a permanent error
+    """
+
+    def __init__(self, store: MetricsStore, channels: Dict[str, Any], min_severity: str = 'medium',
+                 batch_seconds: float = 30, max_batch: int = 20, rates: Optional[Dict[str, float]] = None,
+                 burst: int = 3, max_attempts: int = 8, retry_seconds: float = 30,
+                 max_retry_seconds: float = 3600, retention: float = 7 * 86400):
+        self.store = store
+        self.channels = channels
+        self.min_level = _severity_index(min_severity)
+        self.batch_seconds = batch_seconds
+        self.max_batch = max_batch
+        self.rates = {name: (rates or {}).get(name, 60) for name in channels}
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.retention = retention
+        self._wake = {name: Event() for name in channels}
+        self._tokens = {name: float(burst) for name in channels}
+        self._refilled = {name: time.monotonic() for name in channels}
+        # Incident ID to the highest severity already alerted
+        self._incident_levels: Dict[str, int] = {}
+
+    def submit(self, alert: Dict[str, Any]) -> None:
+        """
+        Queue an alert for every channel unless it is below ``min_severity``.
+
+        Args:
+            alert: ``kind``, ``title``, ``severity``, ``timestamp`` and an
+                optional multi-line ``body``
+        """
+        if _severity_index(alert.get('severity')) < self.min_level or not self.channels:
+            return
+        try:
+            self.store.enqueue_alerts(list(self.channels), alert)
+        except Exception as e:
+            logger.error(f"Failed to queue alert '{alert['title']}': {e}")
+            return
+        for wake in self._wake.values():
+            wake.set()
+
+    def incidents(self, records: Sequence[Dict[str, Any]]) -> None:
+        """Alert on incidents that opened, escalated or, after an alert, closed."""
+        for record in records:
+            level = _severity_index(record['severity'])
+            alerted = self._incident_levels.get(record['id'])
+            if record['status'] == 'closed':
+                if alerted is not None:
+                    del self._incident_levels[record['id']]
+                    self.submit(self._incident_alert(record, 'resolved', SEVERITY_LEVELS[alerted]))
+            elif level >= self.min_level and (alerted is None or level > alerted):
+                self._incident_levels[record['id']] = level
+                self.submit(self._incident_alert(record, 'opened' if alerted is None else 'escalated',
+                                                 record['severity']))
+
+    @staticmethod
+    def _incident_alert(record: Dict[str, Any], change: str, severity: str) -> Dict[str, Any]:
+        lines = [f"Peak score {record['peak_score']} over {record['samples']} samples"]
+        if record.get('contributors'):
+            lines.append("Top contributors: " + ", ".join(f"{name} {share:.0%}"
+                                                         for name, share in record['contributors']))
+        if record.get('comovements'):
+            lines.append("Moving together: " + ", ".join(f"{first} ~ {second} ({r:+.2f})"
+                                                         for first, second, r in record['comovements']))
+        return {
+            'kind': 'incident',
+            'title': f"Incident {record['id']} {change} ({record['severity']})",
+            'severity': severity,
+            'timestamp': record['end'] if change == 'resolved' else record['start'],
+            'body': "\n".join(lines)
+        }
+
+    def rule_events(self, events: Sequence[Dict[str, Any]]) -> None:
+        """Alert on rules that started firing or resolved."""
+        for event in events:
+            values = ", ".join(f"{name}={value}" for name, value in event['values'].items())
+            self.submit({
+                'kind': 'rule',
+                'title': f"Rule {event['name']} {event['state']}",
+                'severity': event['severity'],
+                'timestamp': event['timestamp'],
+                'body': f"{event['expr']}\n{values}"
+            })
+
+    def drift(self, report: Dict[str, Any]) -> None:
+        """Alert that live features drifted from the model's training data."""
+        self.submit({
+            'kind': 'drift',
+            'title': f"Model drift on {report['worst']['feature']}",
+            'severity': 'medium',
+            'timestamp': time.time(),
+            'body': json.dumps(report['worst'])
+        })
+
+    def _take_token(self, name: str) -> float:
+        """Spend one message of the channel's budget; returns seconds to wait if there is none."""
+        now = time.monotonic()
+        rate = self.rates[name] / 3600
+        self._tokens[name] = min(self.burst, self._tokens[name] + (now - self._refilled[name]) * rate)
+        self._refilled[name] = now
+        if self._tokens[name] >= 1:
+            self._tokens[name] -= 1
+            return 0.0
+        return (1 - self._tokens[name]) / rate if rate > 0 else 3600.0
+
+    def deliver(self, name: str) -> Optional[float]:
+        """
+        Send one batch on a channel if one is due.
+
+        Returns:
+            Seconds until the channel should be looked at again, 0 to look
+            again right away, or None when its queue is empty
+        """
+        pending = self.store.pending_alerts(name, self.max_batch)
+        if not pending:
+            return None
+        now = time.time()
+        due = [alert for alert in pending if alert['next_attempt'] <= now]
+        if not due:
+            return min(alert['next_attempt'] for alert in pending) - now
+        hold = min(alert['created'] for alert in due) + self.batch_seconds - now
+        if hold > 0 and len(due) < self.max_batch:
+            return hold
+        wait = self._take_token(name)
+        if wait > 0:
+            return wait
+
+        ids = [alert['id'] for alert in due]
+        try:
+            self.channels[name].send(due)
+        except DeliveryError as e:
+            attempts = max(alert['attempts'] for alert in due) + 1
+            if not e.retry or attempts >= self.max_attempts:
+                logger.error(f"Giving up on {len(ids)} {name} alerts after {attempts} attempts: {e}")
+                self.store.update_alerts(ids, 'failed', error=str(e))
+            else:
+                delay = min(self.retry_seconds * 2 ** (attempts - 1), self.max_retry_seconds)
+                delay = max(delay * random.uniform(0.8, 1.2), e.retry_after or 0)
+                logger.warning(f"Sending {len(ids)} {name} alerts failed, retrying in {delay:.0f}s: {e}")
+                self.store.update_alerts(ids, 'pending', next_attempt=now + delay, error=str(e))
+            return 0.0
+        self.store.update_alerts(ids, 'sent')
+        logger.info(f"Sent {len(ids)} alerts to {name}")
+        return 0.0
+
+    def _run_channel(self, name: str, stop_event: Event) -> None:
+        wake = self._wake[name]
+        while not stop_event.is_set():
+            try:
+                delay = self.deliver(name)
+            except Exception as e:
+                logger.error(f"Alert channel {name} failed: {e}")
+                delay = self.retry_seconds
+            if delay is None or delay > 0:
+                wake.wait(timeout=delay)
+                wake.clear()
+        self.store.close()
+
+    def run_forever(self, stop_event: Event, prune_interval: float = 3600) -> None:
+        """Run one sender thread per channel and prune the outbox until ``stop_event`` is set."""
+        threads = [Thread(target=self._run_channel, args=(name, stop_event), name=f"alerts_{name}", daemon=True)
+                   for name in self.channels]
+        for thread in threads:
+            thread.start()
+        while True:
+            self.store.prune_alerts(time.time() - self.retention)
+            if stop_event.wait(timeout=prune_interval):
+                break
+        for wake in self._wake.values():
+            wake.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+
+def channels_from_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Enabled channels from `alerts.channels`, by name."""
+    channels_config = (config.get('alerts') or {}).get('channels') or {}
+    channels = {}
+    email = channels_config.get('email') or {}
+    if email.get('enabled', False):
+        channels['email'] = EmailChannel(
+            email['smtp_server'], email.get('smtp_port', 587),
+            username=email.get('username') or '', password=email.get('password') or '',
+            recipients=email.get('recipients') or [], sender=email.get('sender') or None,
+            security=email.get('security', 'starttls'), timeout=email.get('timeout', 30)
+        )
+    slack = channels_config.get('slack') or {}
+    if slack.get('enabled', False):
+        channels['slack'] = SlackChannel(slack['webhook_url'], slack.get('channel'), timeout=slack.get('timeout', 10))
+    return channels
+
+
+def alerts_from_config(config: Dict[str, Any], store: MetricsStore) -> Optional[AlertDispatcher]:
+    """Build an AlertDispatcher from the `alerts` config section, or None if disabled or without channels."""
+    alerts_config = config.get('alerts') or {}
+    if not alerts_config.get('enabled', False):
+        return None
+    channels = channels_from_config(config)
+    if not channels:
+        return None
+    channels_config = alerts_config.get('channels') or {}
+    return AlertDispatcher(
+        store, channels,
+        min_severity=alerts_config.get('min_severity', 'medium'),
+        batch_seconds=alerts_config.get('batch_seconds', 30),
+        max_batch=alerts_config.get('max_batch', 20),
+        rates={name: channels_config[name].get('rate_per_hour', 60) for name in channels},
+        burst=alerts_config.get('burst', 3),
+        max_attempts=alerts_config.get('max_attempts', 8),
+        retry_seconds=alerts_config.get('retry_seconds', 30),
+        max_retry_seconds=alerts_config.get('max_retry_minutes', 60) * 60,
+        retention=alerts_config.get('retention_days', 7) * 86400
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Send a test alert through the configured channels")
+    parser.add_argument('--config', default=get_resource_path('config/config.yaml'))
+    parser.add_argument('--db', help="SQLite store holding the outbox, defaults to the one in config.yaml")
+    parser.add_argument('--timeout', type=float, default=60, help="Seconds to wait for delivery")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file)
+    store = MetricsStore(args.db or resolve_db_path(config['database']['url'], get_resource_path('src/data')))
+    dispatcher = alerts_from_config(config, store)
+    if dispatcher is None:
+        raise SystemExit("Alerting is disabled or has no enabled channels")
+    dispatcher.batch_seconds = 0
+    dispatcher.submit({'kind': 'test', 'title': "Test alert", 'severity': SEVERITY_LEVELS[-1],
+                       'timestamp': time.time(), 'body': f"Sent from {socket.gethostname()}"})
+
+    deadline = time.monotonic() + args.timeout
+    remaining: List[str] = list(dispatcher.channels)
+    while remaining and time.monotonic() < deadline:
+        remaining = [name for name in remaining if dispatcher.deliver(name) is not None]
+        time.sleep(0.5)
+    print("Delivered" if not remaining else f"Still pending on: {', '.join(remaining)}")
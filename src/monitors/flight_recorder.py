@@ -0,0 +1,214 @@
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Recorded column name to the snapshot section and key it comes from
+RECORDED_METRICS = {
+    'cpu_percent': ('cpu', 'cpu_percent'),
+    'cpu_freq': ('cpu', 'cpu_freq'),
+    'cpu_load_avg_1min': ('cpu', 'cpu_load_avg_1min'),
+    'cpu_context_switches': ('cpu', 'cpu_context_switches'),
+    'cpu_interrupts': ('cpu', 'cpu_interrupts'),
+    'memory_used': ('memory', 'used'),
+    'memory_percent': ('memory', 'percent'),
+    'swap_used': ('memory', 'swap_used'),
+    'swap_percent': ('memory', 'swap_percent'),
+    'disk_read_bytes': ('disk', 'read_bytes'),
+    'disk_write_bytes': ('disk', 'write_bytes'),
+    'network_upload_speed': ('network', 'upload_speed'),
+    'network_download_speed': ('network', 'download_speed'),
+    'anomaly_score': ('anomaly', 'score')
+}
+
+# Subdirectory of the data directory holding the recordings
+RECORDINGS_DIR = 'flight_recordings'
+
+
+class FlightRecorder:
+    """
+    Full-resolution history of the last few minutes, dumped when an incident opens.
+
+    Every snapshot overwrites the oldest row of preallocated numpy rings:
+    one float64 row of RECORDED_METRICS, one float32 row of per-core CPU
+    and, for each process scan, the top ``top_processes`` entries as pid,
+    CPU, memory percent, RSS and a fixed-width name. Memory is fixed at
+    construction and nothing touches the disk until ``dump``, which copies
+    the rings in time order and writes them as a compressed ``.npz`` on a
+    background thread. Only the newest ``max_recordings`` files are kept.
+    """
+
+    def __init__(self, directory: str, capacity: int = 600, seconds: float = 600, cores: Optional[int] = None,
+                 process_capacity: Optional[int] = None, top_processes: int = 20, name_length: int = 32,
+                 max_recordings: int = 50):
+        self.directory = directory
+        self.capacity = capacity
+        self.seconds = seconds
+        self.top_processes = top_processes
+        self.max_recordings = max_recordings
+        cores = cores or os.cpu_count() or 1
+        process_capacity = process_capacity or capacity
+
+        self.times = np.full(capacity, np.nan)
+        self.values = np.full((capacity, len(RECORDED_METRICS)), np.nan)
+        self.cores = np.full((capacity, cores), np.nan, dtype=np.float32)
+        self.position = -1
+
+        self.process_times = np.full(process_capacity, np.nan)
+        self.pids = np.zeros((process_capacity, top_processes), dtype=np.int32)
+        self.process_cpu = np.full((process_capacity, top_processes), np.nan, dtype=np.float32)
+        self.process_memory = np.full((process_capacity, top_processes), np.nan, dtype=np.float32)
+        self.process_rss = np.full((process_capacity, top_processes), np.nan)
+        self.process_names = np.zeros((process_capacity, top_processes), dtype=f'S{name_length}')
+        self.process_position = -1
+
+        self._lock = threading.Lock()
+
+    def record(self, metrics: Dict[str, Any]) -> None:
+        """Add one SystemMonitor snapshot, optionally carrying the detector result under ``anomaly``."""
+        row = np.full(len(RECORDED_METRICS), np.nan)
+        for column, (section, key) in enumerate(RECORDED_METRICS.values()):
+            value = (metrics.get(section) or {}).get(key)
+            if isinstance(value, (int, float)):
+                row[column] = value
+        per_core = (metrics.get('cpu') or {}).get('per_core') or []
+        with self._lock:
+            self.position = (self.position + 1) % self.capacity
+            self.times[self.position] = metrics['timestamp'].timestamp()
+            self.values[self.position] = row
+            self.cores[self.position] = np.nan
+            count = min(len(per_core), self.cores.shape[1])
+            self.cores[self.position, :count] = per_core[:count]
+
+    def record_processes(self, timestamp: float, processes: Sequence[Dict[str, Any]]) -> None:
+        """Add one top-processes snapshot as returned by ProcessMonitor.monitor_processes."""
+        processes = processes[:self.top_processes]
+        count = len(processes)
+        with self._lock:
+            self.process_position = (self.process_position + 1) % len(self.process_times)
+            slot = self.process_position
+            self.process_times[slot] = timestamp
+            self.pids[slot] = 0
+            self.process_cpu[slot] = self.process_memory[slot] = self.process_rss[slot] = np.nan
+            self.process_names[slot] = b''
+            self.pids[slot, :count] = [process['pid'] for process in processes]
+            self.process_cpu[slot, :count] = [process.get('cpu_percent') or 0.0 for process in processes]
+            self.process_memory[slot, :count] = [process.get('memory_percent') or 0.0 for process in processes]
+            self.process_rss[slot, :count] = [process.get('rss') or np.nan for process in processes]
+            self.process_names[slot, :count] = [(process.get('name') or '').encode('utf-8', 'replace')
+                                                for process in processes]
+
+    @staticmethod
+    def _ordered(times: np.ndarray, position: int, since: float) -> np.ndarray:
+        """Ring indices from oldest to newest, limited to samples at or after ``since``."""
+        order = np.roll(np.arange(len(times)), -(position + 1))
+        order = order[~np.isnan(times[order])]
+        return order[times[order] >= since]
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """Time-ordered copies of the last ``seconds`` of every ring."""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._ordered(self.times, self.position, now - self.seconds)
+            scans = self._ordered(self.process_times, self.process_position, now - self.seconds)
+            return {
+                'times': self.times[rows],
+                'values': self.values[rows],
+                'cores': self.cores[rows],
+                'process_times': self.process_times[scans],
+                'pids': self.pids[scans],
+                'process_cpu': self.process_cpu[scans],
+                'process_memory': self.process_memory[scans],
+                'process_rss': self.process_rss[scans],
+                'process_names': self.process_names[scans]
+            }
+
+    def path_for(self, incident_id: str) -> str:
+        return os.path.join(self.directory, f"flight_{incident_id}.npz")
+
+    def dump(self, incident: Dict[str, Any], background: bool = True) -> Optional[str]:
+        """
+        Write the buffer leading up to an incident.
+
+        Args:
+            incident: Incident record as published by IncidentTracker
+            background: Write on a daemon thread so the caller never waits on the disk
+
+        Returns:
+            Path of the recording, or None if this incident already has one
+        """
+        path = self.path_for(incident['id'])
+        if os.path.exists(path):
+            return None
+        arrays = self.snapshot(now=incident['end'])
+        arrays['columns'] = np.array(list(RECORDED_METRICS))
+        arrays['meta'] = np.array(json.dumps({'incident': incident, 'recorded': time.time()}, default=str))
+        if background:
+            threading.Thread(target=self._write, args=(path, arrays), name="flight_recorder", daemon=True).start()
+        else:
+            self._write(path, arrays)
+        return path
+
+    def _write(self, path: str, arrays: Dict[str, np.ndarray]) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as file:
+                np.savez_compressed(file, **arrays)
+            os.replace(temp_path, path)
+            logger.info(f"Flight recording written to {path} ({len(arrays['times'])} samples)")
+            for stale in list_recordings(self.directory)[self.max_recordings:]:
+                os.remove(stale)
+        except OSError as e:
+            logger.error(f"Failed to write flight recording {path}: {e}")
+
+
+def list_recordings(directory: str) -> List[str]:
+    """Recording paths in ``directory``, newest first."""
+    return sorted(glob.glob(os.path.join(directory, 'flight_*.npz')), key=os.path.getmtime, reverse=True)
+
+
+def load_recording(path: str) -> Dict[str, Any]:
+    """
+    Read a recording written by FlightRecorder.dump.
+
+    Returns:
+        The recorded arrays, plus ``metrics`` mapping each column name to
+        its series, ``names`` as decoded process names and the ``incident``
+        record the recording belongs to
+    """
+    with np.load(path, allow_pickle=False) as data:
+        recording = {name: data[name] for name in data.files}
+    meta = json.loads(str(recording.pop('meta')))
+    recording['incident'] = meta['incident']
+    recording['metrics'] = {str(name): recording['values'][:, column]
+                            for column, name in enumerate(recording['columns'])}
+    recording['names'] = [[name.decode('utf-8', 'replace') for name in row] for row in recording['process_names']]
+    return recording
+
+
+def flight_recorder_from_config(config: Dict[str, Any], data_dir: str) -> Optional[FlightRecorder]:
+    """Build a FlightRecorder from the `monitoring.flight_recorder` config section, or None if disabled."""
+    recorder_config = config['monitoring'].get('flight_recorder') or {}
+    if not recorder_config.get('enabled', False):
+        return None
+    seconds = recorder_config.get('minutes', 10) * 60
+    # Sized for the configured interval; the real loop is slower, so the rings always cover ``seconds``
+    capacity = int(math.ceil(seconds / max(config['monitoring']['interval'], 1))) + 1
+    return FlightRecorder(
+        os.path.join(data_dir, RECORDINGS_DIR),
+        capacity=capacity,
+        seconds=seconds,
+        # The collection loop scans processes on every 4th sample
+        process_capacity=capacity // 4 + 1,
+        top_processes=recorder_config.get('top_processes', 20),
+        max_recordings=recorder_config.get('max_recordings', 50)
+    )
@@ -0,0 +1,217 @@
+import json
+import logging
+import math
+import threading
+from threading import Event
+from typing import Any, Dict, Optional
+
+from src.database.store import MetricsStore
+
+logger = logging.getLogger(__name__)
+
+# Forecast name to the snapshot section and the used / total keys inside it
+FORECAST_METRICS = {
+    'disk': ('disk', 'used', 'total'),
+    'memory': ('memory', 'used', 'total'),
+    'swap': ('memory', 'swap_used', 'swap_total')
+}
+
+STATE_NAME = 'forecast'
+
+
+class HoltTrend:
+    """
+    Holt's linear trend (double exponential smoothing) on an irregular clock.
+
+    The level follows the series with time constant ``level_seconds`` and
+    the trend, in units per second, averages the level's slope with time
+    constant ``trend_seconds``; the smoothing weights come from the time
+    since the previous sample, so gaps and uneven intervals are handled.
+    The trend starts at zero, so it is divided by the weight it has
+    accumulated so far, as in a bias-corrected moving average. Each update
+    and each forecast is a handful of arithmetic operations.
+    """
+
+    def __init__(self, level_seconds: float = 600, trend_seconds: float = 6 * 3600):
+        self.level_seconds = level_seconds
+        self.trend_seconds = trend_seconds
+        self.level: Optional[float] = None
+        self.raw_trend = 0.0
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+
+    def update(self, timestamp: float, value: float) -> None:
+        if self.level is None:
+            self.level = float(value)
+            self.first = self.last = timestamp
+            return
+        dt = timestamp - self.last
+        if dt <= 0:
+            return
+        predicted = self.level + self.raw_trend * dt
+        level = predicted + (1 - math.exp(-dt / self.level_seconds)) * (value - predicted)
+        self.raw_trend += (1 - math.exp(-dt / self.trend_seconds)) * ((level - self.level) / dt - self.raw_trend)
+        self.level = level
+        self.last = timestamp
+
+    @property
+    def history(self) -> float:
+        """Seconds of data seen."""
+        return self.last - self.first if self.level is not None else 0.0
+
+    @property
+    def trend(self) -> float:
+        """Bias-corrected change per second."""
+        weight = 1 - math.exp(-self.history / self.trend_seconds)
+        return self.raw_trend / weight if weight > 0 else 0.0
+
+    def forecast(self, timestamp: float) -> Optional[float]:
+        """Projected value at ``timestamp``."""
+        if self.level is None:
+            return None
+        return self.level + self.trend * (timestamp - self.last)
+
+    def time_to(self, target: float) -> Optional[float]:
+        """Seconds from the last sample until the trend reaches ``target``, None if it never does."""
+        if self.level is None:
+            return None
+        if self.level >= target:
+            return 0.0
+        trend = self.trend
+        return (target - self.level) / trend if trend > 0 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'level': self.level, 'raw_trend': self.raw_trend, 'first': self.first, 'last': self.last}
+
+    def load_dict(self, data: Dict[str, Any]) -> None:
+        self.level = data['level']
+        self.raw_trend = data['raw_trend']
+        self.first = data['first']
+        self.last = data['last']
+
+
+class CapacityForecaster:
+    """
+    Time-to-threshold projections for disk, memory and swap.
+
+    Every snapshot updates one HoltTrend per resource on its used bytes, so
+    both the per-sample update and a full set of forecasts take constant
+    time however long the history is. A forecast is reported once
+    ``min_history`` seconds have been seen, with the growth rate and the
+    time until the resource reaches its threshold (percent of its total).
+    Reaching it within ``warn_within`` seconds is flagged as a warning and
+    logged once; projections beyond ``horizon`` are reported as None.
+    """
+
+    def __init__(self, thresholds: Dict[str, float], level_seconds: float = 600,
+                 trend_seconds: float = 6 * 3600, min_history: float = 3600,
+                 horizon: float = 30 * 86400, warn_within: float = 3 * 86400):
+        self.thresholds = {name: thresholds[name] for name in FORECAST_METRICS if name in thresholds}
+        self.trends = {name: HoltTrend(level_seconds, trend_seconds) for name in self.thresholds}
+        self.totals: Dict[str, float] = {}
+        self.min_history = min_history
+        self.horizon = horizon
+        self.warn_within = warn_within
+        self._warned = set()
+        self._lock = threading.Lock()
+
+    def update(self, metrics: Dict[str, Any]) -> None:
+        """Add one SystemMonitor snapshot."""
+        timestamp = metrics['timestamp'].timestamp()
+        with self._lock:
+            for name, trend in self.trends.items():
+                section, used_key, total_key = FORECAST_METRICS[name]
+                values = metrics.get(section) or {}
+                used, total = values.get(used_key), values.get(total_key)
+                if used is None or not total:
+                    continue
+                trend.update(timestamp, float(used))
+                self.totals[name] = float(total)
+
+    def forecasts(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Current projection per resource.
+
+        Returns:
+            Per resource: smoothed ``used`` bytes and ``percent``, the
+            ``rate`` in bytes per hour, the ``threshold`` percent, the
+            ``seconds_to_threshold`` (None when not growing towards it or
+            beyond the horizon) and the ``warning`` flag; resources without
+            enough history are left out
+        """
+        results = {}
+        with self._lock:
+            for name, trend in self.trends.items():
+                total = self.totals.get(name)
+                if not total or trend.history < self.min_history:
+                    continue
+                threshold = self.thresholds[name]
+                seconds = trend.time_to(threshold / 100 * total)
+                if seconds is not None and seconds > self.horizon:
+                    seconds = None
+                results[name] = {
+                    'used': trend.level,
+                    'percent': round(100 * trend.level / total, 2),
+                    'rate': trend.trend * 3600,
+                    'threshold': threshold,
+                    'seconds_to_threshold': seconds,
+                    'warning': seconds is not None and seconds <= self.warn_within
+                }
+
+        for name, forecast in results.items():
+            if not forecast['warning']:
+                self._warned.discard(name)
+            elif name not in self._warned:
+                self._warned.add(name)
+                logger.warning(f"{name} projected to reach {forecast['threshold']}% in "
+                               f"{forecast['seconds_to_threshold'] / 3600:.1f}h "
+                               f"(+{forecast['rate'] / 1024 ** 2:.1f} MB/h)")
+        return results
+
+    def to_bytes(self) -> bytes:
+        with self._lock:
+            data = {'trends': {name: trend.to_dict() for name, trend in self.trends.items()},
+                    'totals': self.totals}
+        return json.dumps(data).encode()
+
+    def load_bytes(self, data: bytes) -> None:
+        """Restore trends saved with ``to_bytes``, keeping this instance's settings."""
+        saved = json.loads(data.decode())
+        with self._lock:
+            for name, trend in saved['trends'].items():
+                if name in self.trends and trend['level'] is not None:
+                    self.trends[name].load_dict(trend)
+            self.totals.update({name: total for name, total in saved['totals'].items() if name in self.trends})
+
+    def save(self, store: MetricsStore) -> None:
+        store.save_state(STATE_NAME, self.to_bytes())
+
+    def load(self, store: MetricsStore) -> None:
+        data = store.load_state(STATE_NAME)
+        if data is None:
+            return
+        try:
+            self.load_bytes(data)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Discarding unreadable capacity forecasts: {e}")
+
+    def run_forever(self, store: MetricsStore, stop_event: Event, persist_interval: float = 300) -> None:
+        """Persist the trends every ``persist_interval`` seconds until ``stop_event`` is set."""
+        while not stop_event.wait(timeout=persist_interval):
+            self.save(store)
+        self.save(store)
+
+
+def forecaster_from_config(config: Dict[str, Any]) -> Optional[CapacityForecaster]:
+    """Build a CapacityForecaster from the `monitoring.forecast` config section, or None if disabled."""
+    forecast_config = config['monitoring'].get('forecast') or {}
+    if not forecast_config.get('enabled', False):
+        return None
+    return CapacityForecaster(
+        forecast_config.get('thresholds') or {},
+        level_seconds=forecast_config.get('level_minutes', 10) * 60,
+        trend_seconds=forecast_config.get('trend_hours', 6) * 3600,
+        min_history=forecast_config.get('min_history_hours', 1) * 3600,
+        horizon=forecast_config.get('horizon_days', 30) * 86400,
+        warn_within=forecast_config.get('warn_hours', 72) * 3600
+    )
@@ -1,10 +1,23 @@
 import psutil
 import yaml
+import logging
+import time
 from datetime import datetime
 from heapq import nlargest
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 import sys
 import os
 
+import numpy as np
+
+from src.monitors.process_usage import ProcessUsage
+
+logger = logging.getLogger(__name__)
+
+# psutil has no per-process IO counters on macOS
+PROCESS_ATTRS = ['name', 'status', 'cpu_percent', 'memory_percent', 'create_time', 'memory_info',
+                 'cpu_times', 'cmdline'] + (['io_counters'] if hasattr(psutil.Process, 'io_counters') else [])
+
 def get_resource_path(relative_path):
     """Get the absolute path to bundled files when using PyInstaller."""
     if getattr(sys, 'frozen', False):  # Running as a PyInstaller bundle
@@ -13,10 +26,201 @@ def get_resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+class ProcessTrends:
+    """
+    Per-process RSS and CPU history for spotting leaks and runaway processes.
+
+    Each tracked process owns one row of fixed-size float32 ring arrays,
+    with one column per sample taken every ``sample_interval`` seconds and
+    a shared ring of sample times, so memory is bounded by
+    ``max_processes * window`` whatever runs on the host; processes beyond
+    ``max_processes`` are not tracked and rows are recycled as processes
+    exit. Rows are keyed by (pid, start time) so a reused pid starts fresh.
+
+    A process is flagged as leaking when the least-squares slope of its RSS
+    over the window exceeds ``leak_rate`` bytes per second and the growth is
+    sustained (correlation with time of at least ``min_correlation`` over at
+    least ``min_samples`` samples). It is flagged as runaway when its CPU
+    has stayed at or above ``cpu_percent`` on every check for
+    ``runaway_seconds``. Slopes for all rows are fitted in one vectorized
+    pass per sample.
+    """
+
+    def __init__(self, max_processes: int = 4096, window: int = 120, sample_interval: float = 30,
+                 leak_rate: float = 50 * 1024 ** 2 / 3600, min_correlation: float = 0.8,
+                 min_samples: int = 20, cpu_percent: float = 95.0, runaway_seconds: float = 600):
+        self.max_processes = max_processes
+        self.window = window
+        self.sample_interval = sample_interval
+        self.leak_rate = leak_rate
+        self.min_correlation = min_correlation
+        self.min_samples = min_samples
+        self.cpu_percent = cpu_percent
+        self.runaway_seconds = runaway_seconds
+
+        self.rss = np.full((max_processes, window), np.nan, dtype=np.float32)
+        self.cpu = np.full((max_processes, window), np.nan, dtype=np.float32)
+        self.times = np.full(window, np.nan)
+        self.position = -1
+        self.last_sample = -np.inf
+        self.latest_rss = np.zeros(max_processes, dtype=np.float64)
+        self.latest_cpu = np.zeros(max_processes, dtype=np.float32)
+        self.pinned_since = np.full(max_processes, np.nan)
+        self.slopes = np.zeros(max_processes, dtype=np.float64)
+        self.leaking = np.zeros(max_processes, dtype=bool)
+        self.in_use = np.zeros(max_processes, dtype=bool)
+        self.keys: List[Optional[Tuple[int, float]]] = [None] * max_processes
+        self.names: List[Optional[str]] = [None] * max_processes
+        self.slots: Dict[Tuple[int, float], int] = {}
+        self.free = list(range(max_processes - 1, -1, -1))
+        self.untracked = 0
+
+    def _release(self, slots: np.ndarray) -> None:
+        for slot in slots.tolist():
+            del self.slots[self.keys[slot]]
+            self.keys[slot] = self.names[slot] = None
+            self.free.append(slot)
+        self.rss[slots] = np.nan
+        self.cpu[slots] = np.nan
+        self.pinned_since[slots] = np.nan
+        self.leaking[slots] = False
+        self.in_use[slots] = False
+
+    def update(self, timestamp: float, processes: Sequence[Dict[str, Any]]) -> None:
+        """
+        Record one scan of the process table.
+
+        Args:
+            timestamp: Scan time in epoch seconds
+            processes: Entries with ``pid``, ``started`` (creation time),
+                ``name``, ``rss`` and ``cpu_percent``
+        """
+        processes = [process for process in processes if process.get('rss') is not None]
+        keys = [(process['pid'], process['started']) for process in processes]
+
+        # Free the rows of exited processes before taking rows for new ones
+        seen = np.zeros(self.max_processes, dtype=bool)
+        seen[[self.slots[key] for key in keys if key in self.slots]] = True
+        gone = np.flatnonzero(self.in_use & ~seen)
+        if len(gone):
+            self._release(gone)
+
+        indices, rss, cpu = [], [], []
+        untracked = 0
+        for key, process in zip(keys, processes):
+            slot = self.slots.get(key)
+            if slot is None:
+                if not self.free:
+                    untracked += 1
+                    continue
+                slot = self.free.pop()
+                self.slots[key] = slot
+                self.keys[slot] = key
+                self.names[slot] = process['name']
+                self.in_use[slot] = True
+            indices.append(slot)
+            rss.append(process['rss'])
+            cpu.append(process['cpu_percent'] or 0.0)
+        if untracked and not self.untracked:
+            logger.warning(f"Process trends full, {untracked} processes not tracked")
+        self.untracked = untracked
+
+        indices = np.array(indices, dtype=np.intp)
+        self.latest_rss[indices] = rss
+        self.latest_cpu[indices] = cpu
+        pinned = self.latest_cpu[indices] >= self.cpu_percent
+        self.pinned_since[indices[~pinned]] = np.nan
+        starting = indices[pinned & np.isnan(self.pinned_since[indices])]
+        self.pinned_since[starting] = timestamp
+
+        if timestamp - self.last_sample >= self.sample_interval:
+            self.last_sample = timestamp
+            self.position = (self.position + 1) % self.window
+            self.times[self.position] = timestamp
+            self.rss[:, self.position] = np.nan
+            self.cpu[:, self.position] = np.nan
+            self.rss[indices, self.position] = rss
+            self.cpu[indices, self.position] = cpu
+            self._fit()
+
+    def _fit(self) -> None:
+        """Least-squares RSS slope and its correlation with time for every tracked process."""
+        rows = np.flatnonzero(self.in_use)
+        self.slopes[:] = 0.0
+        self.leaking[:] = False
+        if not len(rows):
+            return
+        t = (self.times - np.nanmin(self.times))[None, :]
+        x = self.rss[rows].astype(np.float64)
+        present = ~np.isnan(x) & ~np.isnan(t)
+        counts = present.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t_mean = np.where(present, t, 0.0).sum(axis=1) / counts
+            x_mean = np.where(present, x, 0.0).sum(axis=1) / counts
+            dt = np.where(present, t - t_mean[:, None], 0.0)
+            dx = np.where(present, x - x_mean[:, None], 0.0)
+            var_t = (dt ** 2).sum(axis=1)
+            covariance = (dt * dx).sum(axis=1)
+            slopes = covariance / var_t
+            correlation = covariance / np.sqrt(var_t * (dx ** 2).sum(axis=1))
+        slopes = np.nan_to_num(slopes)
+        self.slopes[rows] = slopes
+        self.leaking[rows] = (counts >= self.min_samples) & (slopes >= self.leak_rate) \
+            & (np.nan_to_num(correlation) >= self.min_correlation)
+
+    def flagged(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Processes currently flagged, fastest growing first.
+
+        Returns:
+            Entries with ``pid``, ``name``, ``issue`` (``memory leak`` or
+            ``runaway cpu``), current ``rss`` bytes, RSS ``growth_per_hour``
+            in bytes, current ``cpu_percent`` and the epoch time ``since``
+            when the CPU got pinned or the RSS window starts
+        """
+        now = time.time() if now is None else now
+        runaway = self.in_use & (now - self.pinned_since >= self.runaway_seconds)
+        window_start = float(np.nanmin(self.times)) if self.position >= 0 else now
+        flags = []
+        for slot in np.flatnonzero(self.leaking | runaway).tolist():
+            for issue, flagged in (('memory leak', self.leaking[slot]), ('runaway cpu', runaway[slot])):
+                if flagged:
+                    flags.append({
+                        'pid': self.keys[slot][0],
+                        'name': self.names[slot],
+                        'issue': issue,
+                        'rss': float(self.latest_rss[slot]),
+                        'growth_per_hour': round(float(self.slopes[slot]) * 3600),
+                        'cpu_percent': float(self.latest_cpu[slot]),
+                        'since': float(self.pinned_since[slot]) if issue == 'runaway cpu' else window_start
+                    })
+        return sorted(flags, key=lambda flag: flag['growth_per_hour'], reverse=True)
+
+
+def process_trends_from_config(config: Dict[str, Any]) -> Optional[ProcessTrends]:
+    """Build ProcessTrends from the `monitoring.process.trends` config section, or None if disabled."""
+    trends_config = config['monitoring']['process'].get('trends') or {}
+    if not trends_config.get('enabled', False):
+        return None
+    return ProcessTrends(
+        max_processes=trends_config.get('max_processes', 4096),
+        window=trends_config.get('window', 120),
+        sample_interval=trends_config.get('sample_interval', 30),
+        leak_rate=trends_config.get('leak_mb_per_hour', 50) * 1024 ** 2 / 3600,
+        min_correlation=trends_config.get('min_correlation', 0.8),
+        min_samples=trends_config.get('min_samples', 20),
+        cpu_percent=trends_config.get('cpu_percent', 95.0),
+        runaway_seconds=trends_config.get('runaway_minutes', 10) * 60
+    )
+
 class ProcessMonitor:
-    def __init__(self):
+    def __init__(self, usage: Optional[ProcessUsage] = None):
         self.processes = []
         self.config = self.load_config()
+        # Leak and runaway tracking across scans, None when disabled
+        self.trends = process_trends_from_config(self.config)
+        # Heaviest processes over time, owned by the app so it can persist them
+        self.usage = usage
 
     def load_config(self):
         with open(get_resource_path('config/config.yaml'), 'r') as file:
@@ -24,14 +228,23 @@ class ProcessMonitor:
 
     def get_process_info(self, process):
         try:
-            create_time = datetime.fromtimestamp(process.create_time()).strftime('%d/%m/%Y %H:%M:%S')
+            started = process.create_time()
+            create_time = datetime.fromtimestamp(started).strftime('%d/%m/%Y %H:%M:%S')
+            memory_info = process.info.get('memory_info')
+            cpu_times = process.info.get('cpu_times')
+            io_counters = process.info.get('io_counters')
             return {
                 'pid': process.pid,
                 'name': process.info['name'],
                 'status': process.info['status'],
                 'cpu_percent': process.info['cpu_percent'],
                 'memory_percent': process.info['memory_percent'],
-                'create_time': create_time
+                'create_time': create_time,
+                'started': started,
+                'rss': memory_info.rss if memory_info is not None else None,
+                'cpu_time': cpu_times.user + cpu_times.system if cpu_times is not None else None,
+                'io_bytes': io_counters.read_bytes + io_counters.write_bytes if io_counters is not None else None,
+                'cmdline': process.info.get('cmdline')
             }
         except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
             return None
@@ -45,16 +258,26 @@ class ProcessMonitor:
         # generator with filtering
         process_info_gen = (
             self.get_process_info(proc)
-            for proc in psutil.process_iter(
-                ['name', 'status', 'cpu_percent', 'memory_percent', 'create_time']
-            )
+            for proc in psutil.process_iter(PROCESS_ATTRS)
             # if proc.info['cpu_percent'] > min_cpu  
         )
+        processes = list(filter(None, process_info_gen))  # Filter out None entries
+
+        # Every process feeds the trends and usage totals, not just the top ones shown
+        now = time.time()
+        if self.trends is not None:
+            self.trends.update(now, processes)
+        if self.usage is not None:
+            self.usage.update(now, processes)
 
         top_processes = nlargest(
             top_n,
-            filter(None, process_info_gen),  # Filter out None entries
+            processes,
             key=lambda x: x['cpu_percent']
         )
 
         return top_processes
+
+    def flagged_processes(self) -> List[Dict[str, Any]]:
+        """Processes with a sustained RSS leak or pinned CPU, empty when trends are disabled."""
+        return self.trends.flagged() if self.trends is not None else []
@@ -0,0 +1,253 @@
+import json
+import logging
+import re
+import threading
+import time
+from threading import Event
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.anomaly.sketches import SpaceSaving
+from src.database.store import MetricsStore
+
+logger = logging.getLogger(__name__)
+
+# Tracked totals and whether each one is a running peak rather than a sum
+USAGE_METRICS = {'cpu_seconds': False, 'io_bytes': False, 'peak_rss': True}
+
+# Short names accepted by queries, e.g. from the assistant
+METRIC_ALIASES = {'cpu': 'cpu_seconds', 'io': 'io_bytes', 'disk': 'io_bytes',
+                  'memory': 'peak_rss', 'rss': 'peak_rss', 'ram': 'peak_rss'}
+
+WINDOW_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+STATE_NAME = 'process_usage'
+
+
+def parse_window(text: str) -> float:
+    """Seconds in a window such as ``90m``, ``24h`` or ``7d``."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([mhdw])\s*', text.lower())
+    if match is None:
+        raise ValueError(f"Unknown window: {text!r}")
+    return float(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+
+def format_bytes(value: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(value) < 1024:
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+
+def format_seconds(value: float) -> str:
+    if value >= 3600:
+        return f"{value / 3600:.1f} h"
+    if value >= 60:
+        return f"{value / 60:.1f} min"
+    return f"{value:.1f} s"
+
+
+class ProcessUsage:
+    """
+    Heaviest processes over trailing windows, fed by every process scan.
+
+    Each time bucket holds one Space-Saving summary per metric: CPU-seconds
+    and read plus written bytes accumulated between scans, and the peak
+    RSS seen. Processes are keyed by name and command line, so restarts and
+    worker pools of the same program add up. Memory is bounded by
+    ``capacity`` keys per metric and bucket, and buckets older than
+    ``retention`` are dropped; a window query merges the buckets it covers,
+    caching the closed ones like WindowedSketch.
+
+    A process already running when tracking starts is counted from its
+    second scan on; processes started since the previous scan are counted
+    from their start. Processes that live and die between two scans are
+    not seen.
+    """
+
+    def __init__(self, capacity: int = 100, bucket_seconds: float = 3600,
+                 retention: float = 7 * 86400, command_length: int = 200):
+        self.capacity = capacity
+        self.bucket_seconds = bucket_seconds
+        self.retention = retention
+        self.command_length = command_length
+        self.buckets: Dict[int, Dict[str, SpaceSaving]] = {}
+        self._previous: Dict[Tuple[int, float], Tuple[float, Optional[float]]] = {}
+        self._last_scan: Optional[float] = None
+        self._closed_cache: Dict[tuple, SpaceSaving] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    def _summaries(self, timestamp: float) -> Dict[str, SpaceSaving]:
+        bucket = self._bucket(timestamp)
+        summaries = self.buckets.get(bucket)
+        if summaries is None:
+            summaries = self.buckets[bucket] = {
+                metric: SpaceSaving(self.capacity, peak) for metric, peak in USAGE_METRICS.items()
+            }
+            oldest = self._bucket(timestamp - self.retention)
+            for expired in [b for b in self.buckets if b <= oldest]:
+                del self.buckets[expired]
+            self._closed_cache.clear()
+        return summaries
+
+    def label(self, process: Dict[str, Any]) -> str:
+        """Key for a process: its name and command line, tab separated."""
+        command = ' '.join(process.get('cmdline') or [])[:self.command_length]
+        return f"{process['name']}\t{command}"
+
+    def update(self, timestamp: float, processes: Sequence[Dict[str, Any]]) -> None:
+        """
+        Record one scan of the process table.
+
+        Args:
+            timestamp: Scan time in epoch seconds
+            processes: Entries with ``pid``, ``started`` (creation time),
+                ``name``, ``cmdline``, cumulative ``cpu_time`` seconds and
+                ``io_bytes`` (None where unavailable) and ``rss``
+        """
+        with self._lock:
+            summaries = self._summaries(timestamp)
+            previous = {}
+            for process in processes:
+                key = (process['pid'], process['started'])
+                cpu_time, io_bytes, rss = process.get('cpu_time'), process.get('io_bytes'), process.get('rss')
+                label = self.label(process)
+                last = self._previous.get(key)
+                if last is None and self._last_scan is not None and process['started'] >= self._last_scan:
+                    last = (0.0, 0.0)
+                if last is not None:
+                    if cpu_time is not None and cpu_time > last[0]:
+                        summaries['cpu_seconds'].update(label, cpu_time - last[0])
+                    if io_bytes is not None and last[1] is not None and io_bytes > last[1]:
+                        summaries['io_bytes'].update(label, io_bytes - last[1])
+                if rss:
+                    summaries['peak_rss'].update(label, rss)
+                previous[key] = (cpu_time or 0.0, io_bytes)
+            self._previous = previous
+            self._last_scan = timestamp
+
+    def window(self, metric: str, seconds: Optional[float] = None, now: Optional[float] = None) -> SpaceSaving:
+        """Merged summary of one metric over the buckets overlapping the last ``seconds``."""
+        now = time.time() if now is None else now
+        current = self._bucket(now)
+        first = self._bucket(now - (seconds if seconds is not None else self.retention))
+        with self._lock:
+            closed = self._closed_cache.get((metric, first, current))
+            if closed is None:
+                closed = SpaceSaving(self.capacity, USAGE_METRICS[metric])
+                for bucket, summaries in self.buckets.items():
+                    if first <= bucket < current:
+                        closed.merge(summaries[metric])
+                self._closed_cache[(metric, first, current)] = closed
+            merged = closed.copy()
+            if current in self.buckets:
+                merged.merge(self.buckets[current][metric])
+        return merged
+
+    def top(self, metric: str = 'cpu_seconds', seconds: Optional[float] = None, n: int = 10,
+            now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Heaviest processes by one metric over a trailing window.
+
+        Args:
+            metric: Name from USAGE_METRICS or METRIC_ALIASES
+            seconds: Window length, defaults to the whole retention
+            n: Number of processes to return
+
+        Returns:
+            Entries with ``name``, ``command``, each metric's value (None
+            when the process is not among that metric's heavy hitters) and
+            the ranking metric's ``error`` bound, largest first
+        """
+        metric = METRIC_ALIASES.get(metric, metric)
+        if metric not in USAGE_METRICS:
+            raise ValueError(f"Unknown process usage metric: {metric}")
+        merged = {name: self.window(name, seconds, now) for name in USAGE_METRICS}
+        rows = []
+        for label, _, error in merged[metric].top(n):
+            name, _, command = label.partition('\t')
+            row = {'name': name, 'command': command, 'error': error}
+            for other, summary in merged.items():
+                entry = summary.counts.get(label)
+                row[other] = entry[0] if entry is not None else None
+            rows.append(row)
+        return rows
+
+    def describe(self, query: str = '') -> str:
+        """
+        Plain-text answer to a query such as ``cpu 24h`` or ``memory 7d``,
+        for the assistant.
+        """
+        words = query.split()
+        metric = METRIC_ALIASES.get(words[0].lower(), words[0]) if words else 'cpu_seconds'
+        seconds = parse_window(words[1]) if len(words) > 1 else 86400
+        rows = self.top(metric, seconds)
+        if not rows:
+            return "No process usage recorded in that window."
+        lines = [f"Top processes by {metric.replace('_', ' ')} over the last {format_seconds(seconds)}:"]
+        for rank, row in enumerate(rows, 1):
+            values = [
+                f"CPU {format_seconds(row['cpu_seconds'])}" if row['cpu_seconds'] is not None else None,
+                f"IO {format_bytes(row['io_bytes'])}" if row['io_bytes'] is not None else None,
+                f"peak RSS {format_bytes(row['peak_rss'])}" if row['peak_rss'] is not None else None
+            ]
+            lines.append(f"{rank}. {row['name']} ({row['command'] or 'no command line'}): "
+                         + ", ".join(value for value in values if value))
+        return "\n".join(lines)
+
+    def to_bytes(self) -> bytes:
+        with self._lock:
+            data = {
+                'bucket_seconds': self.bucket_seconds,
+                'buckets': {str(bucket): {metric: summary.to_dict() for metric, summary in summaries.items()}
+                            for bucket, summaries in self.buckets.items()}
+            }
+        return json.dumps(data).encode()
+
+    def load_bytes(self, data: bytes) -> None:
+        """Restore buckets saved with ``to_bytes``, keeping this instance's settings."""
+        saved = json.loads(data.decode())
+        if saved['bucket_seconds'] != self.bucket_seconds:
+            return
+        oldest = self._bucket(time.time() - self.retention)
+        with self._lock:
+            for bucket, summaries in saved['buckets'].items():
+                if int(bucket) > oldest:
+                    self.buckets[int(bucket)] = {metric: SpaceSaving.from_dict(summary)
+                                                 for metric, summary in summaries.items()
+                                                 if metric in USAGE_METRICS}
+            self._closed_cache.clear()
+
+    def save(self, store: MetricsStore) -> None:
+        store.save_state(STATE_NAME, self.to_bytes())
+
+    def load(self, store: MetricsStore) -> None:
+        data = store.load_state(STATE_NAME)
+        if data is None:
+            return
+        try:
+            self.load_bytes(data)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Discarding unreadable process usage history: {e}")
+
+    def run_forever(self, store: MetricsStore, stop_event: Event, persist_interval: float = 300) -> None:
+        """Persist the summaries every ``persist_interval`` seconds until ``stop_event`` is set."""
+        while not stop_event.wait(timeout=persist_interval):
+            self.save(store)
+        self.save(store)
+
+
+def process_usage_from_config(config: Dict[str, Any]) -> Optional[ProcessUsage]:
+    """Build ProcessUsage from the `monitoring.process.usage` config section, or None if disabled."""
+    usage_config = config['monitoring']['process'].get('usage') or {}
+    if not usage_config.get('enabled', False):
+        return None
+    return ProcessUsage(
+        capacity=usage_config.get('capacity', 100),
+        bucket_seconds=usage_config.get('bucket_minutes', 60) * 60,
+        retention=usage_config.get('retention_days', 7) * 86400,
+        command_length=usage_config.get('command_length', 200)
+    )
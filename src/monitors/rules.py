@@ -0,0 +1,530 @@
+import logging
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.anomaly.severity import SEVERITY_LEVELS
+
+logger = logging.getLogger(__name__)
+
+# Snapshot sections a rule may reference, in lookup order for bare names
+SECTIONS = ('cpu', 'memory', 'disk', 'network', 'battery')
+
+# Byte units are binary, like the KB/s and MB figures shown in the GUI
+VALUE_UNITS = {'': 1.0, '%': 1.0, 'B': 1.0, 'KB': 1024.0, 'MB': 1024.0 ** 2,
+               'GB': 1024.0 ** 3, 'TB': 1024.0 ** 4}
+DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0, 'd': 86400.0}
+
+# Window functions: rate() of a cumulative counter in units per second, and
+# the mean, minimum or maximum of a metric over a trailing window
+FUNCTIONS = ('rate', 'avg', 'min', 'max')
+
+OPERATORS = ('>', '>=', '<', '<=', '==', '!=')
+NEGATED = {'>': '<=', '>=': '<', '<': '>=', '<=': '>', '==': '!=', '!=': '=='}
+# Truth of each operator for sign(lhs - rhs) = -1, 0, 1
+OPERATOR_TABLE = np.array([
+    [False, False, True],
+    [False, True, True],
+    [True, False, False],
+    [True, True, False],
+    [False, True, False],
+    [True, False, True]
+])
+# Which way hysteresis moves the threshold for a firing rule: "> 80" with a
+# hysteresis of 5 keeps firing until the value drops to 75
+HYSTERESIS_DIRECTION = np.array([1.0, 1.0, -1.0, -1.0, 0.0, 0.0])
+
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d+)?)(?P<unit>%|[KMGT]?B(?:/s)?|/s|ms|[smhd])?(?![\w.])
+      | (?P<op>>=|<=|==|!=|>|<)
+      | (?P<punct>[(),])
+      | (?P<name>[A-Za-z_][\w.]*)
+    )""", re.VERBOSE)
+
+
+class RuleSyntaxError(ValueError):
+    """Raised for a rule expression that cannot be parsed."""
+
+
+def tokenize(text: str) -> List[Tuple[str, Any]]:
+    """Split a rule into ``(kind, value)`` tokens."""
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None or match.end() == position:
+            raise RuleSyntaxError(f"Unexpected input at {text[position:]!r}")
+        position = match.end()
+        if match.group('number') is not None:
+            tokens.append(('number', (float(match.group('number')), match.group('unit') or '')))
+        elif match.group('op'):
+            tokens.append(('op', match.group('op')))
+        elif match.group('punct'):
+            tokens.append((match.group('punct'), match.group('punct')))
+        else:
+            name = match.group('name')
+            lowered = name.lower()
+            tokens.append((lowered, lowered) if lowered in ('and', 'or', 'not', 'for') else ('name', name))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent parser for rule expressions.
+
+    Grammar::
+
+        rule       := condition ['for' DURATION]
+        condition  := conjunct ('or' conjunct)*
+        conjunct   := negation ('and' negation)*
+        negation   := 'not' negation | '(' condition ')' | comparison
+        comparison := operand OP operand
+        operand    := NUMBER[UNIT] | metric | FUNCTION '(' metric [',' DURATION] ')'
+                    | 'threshold' '(' NAME ')'
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def take(self, kind: Optional[str] = None) -> Tuple[str, Any]:
+        if self.position >= len(self.tokens):
+            raise RuleSyntaxError(f"Unexpected end of rule {self.text!r}")
+        token = self.tokens[self.position]
+        if kind is not None and token[0] != kind:
+            raise RuleSyntaxError(f"Expected {kind} but found {token[1]!r} in rule {self.text!r}")
+        self.position += 1
+        return token
+
+    def duration(self) -> float:
+        value, unit = self.take('number')[1]
+        if unit not in DURATION_UNITS:
+            raise RuleSyntaxError(f"Expected a duration such as 30s, found {value:g}{unit} in {self.text!r}")
+        return value * DURATION_UNITS[unit]
+
+    def rule(self) -> Tuple[tuple, float]:
+        condition = self.condition()
+        for_seconds = 0.0
+        if self.peek() == 'for':
+            self.take()
+            for_seconds = self.duration()
+        if self.peek() is not None:
+            raise RuleSyntaxError(f"Unexpected {self.tokens[self.position][1]!r} in rule {self.text!r}")
+        return condition, for_seconds
+
+    def condition(self) -> tuple:
+        terms = [self.conjunct()]
+        while self.peek() == 'or':
+            self.take()
+            terms.append(self.conjunct())
+        return terms[0] if len(terms) == 1 else ('or', terms)
+
+    def conjunct(self) -> tuple:
+        terms = [self.negation()]
+        while self.peek() == 'and':
+            self.take()
+            terms.append(self.negation())
+        return terms[0] if len(terms) == 1 else ('and', terms)
+
+    def negation(self) -> tuple:
+        if self.peek() == 'not':
+            self.take()
+            return ('not', self.negation())
+        if self.peek() == '(':
+            self.take()
+            condition = self.condition()
+            self.take(')')
+            return condition
+        left = self.operand()
+        op = self.take('op')[1]
+        return ('cmp', op, left, self.operand())
+
+    def operand(self) -> tuple:
+        kind, value = self.take()
+        if kind == 'number':
+            number, unit = value
+            if unit.endswith('/s'):
+                unit = unit[:-2]
+            if unit not in VALUE_UNITS:
+                raise RuleSyntaxError(f"Unknown unit {unit!r} in rule {self.text!r}")
+            return ('const', number * VALUE_UNITS[unit])
+        if kind != 'name':
+            raise RuleSyntaxError(f"Expected a metric or number, found {value!r} in rule {self.text!r}")
+        if self.peek() != '(':
+            return ('metric', value)
+
+        function = value.lower()
+        self.take('(')
+        if function == 'threshold':
+            name = self.take('name')[1]
+            self.take(')')
+            return ('threshold', name)
+        if function not in FUNCTIONS:
+            raise RuleSyntaxError(f"Unknown function {value!r} in rule {self.text!r}")
+        metric = self.take('name')[1]
+        seconds = None
+        if self.peek() == ',':
+            self.take()
+            seconds = self.duration()
+        elif function != 'rate':
+            raise RuleSyntaxError(f"{function}() needs a window, e.g. {function}({metric}, 60s)")
+        self.take(')')
+        return ('func', function, metric, seconds)
+
+
+def parse_rule(text: str) -> Tuple[tuple, float]:
+    """
+    Parse a rule such as ``disk.percent > 85 and rate(write_bytes) > 100MB/s for 30s``.
+
+    Returns:
+        The condition tree and the number of seconds it must hold
+    """
+    return _Parser(text).rule()
+
+
+def _negate(node: tuple) -> tuple:
+    if node[0] == 'cmp':
+        return ('cmp', NEGATED[node[1]], node[2], node[3])
+    if node[0] == 'not':
+        return node[1]
+    return ('or' if node[0] == 'and' else 'and', [_negate(term) for term in node[1]])
+
+
+def to_dnf(node: tuple) -> List[List[tuple]]:
+    """Rewrite a condition as an OR of AND-clauses of plain comparisons."""
+    if node[0] == 'cmp':
+        return [[node]]
+    if node[0] == 'not':
+        return to_dnf(_negate(node[1]))
+    if node[0] == 'or':
+        return [clause for term in node[1] for clause in to_dnf(term)]
+    clauses = [[]]
+    for term in node[1]:
+        clauses = [left + right for left in clauses for right in to_dnf(term)]
+    return clauses
+
+
+class Rule:
+    """One named rule from the `monitoring.rules` config section."""
+
+    def __init__(self, name: str, expr: str, severity: str = 'medium',
+                 hysteresis: float = 0.0, cooldown: float = 300.0):
+        if severity not in SEVERITY_LEVELS[1:]:
+            raise ValueError(f"Rule {name!r} has unknown severity {severity!r}")
+        self.name = name
+        self.expr = expr
+        self.severity = severity
+        self.hysteresis = float(hysteresis)
+        self.cooldown = float(cooldown)
+        self.condition, self.for_seconds = parse_rule(expr)
+        self.clauses = to_dnf(self.condition)
+
+    def metrics(self) -> List[str]:
+        """Metric names the rule reads."""
+        names = []
+        for clause in self.clauses:
+            for _, _, left, right in clause:
+                for operand in (left, right):
+                    name = operand[1] if operand[0] == 'metric' else operand[2] if operand[0] == 'func' else None
+                    if name is not None and name not in names:
+                        names.append(name)
+        return names
+
+
+def resolve_metric(name: str, metrics: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Map a rule's metric name to a ``(section, key)`` path in a snapshot.
+
+    ``disk.percent`` names the path directly; a bare ``cpu_percent`` or
+    ``write_bytes`` is looked up across all sections and must be unique;
+    feature-style names such as ``memory_percent`` are split at the section
+    prefix.
+
+    Raises:
+        KeyError: If the name matches nothing or more than one metric
+    """
+    if '.' in name:
+        section, key = name.split('.', 1)
+        if isinstance(metrics.get(section), dict) and key in metrics[section]:
+            return section, key
+        raise KeyError(f"Unknown metric {name!r}")
+    matches = [section for section in SECTIONS
+               if isinstance(metrics.get(section), dict) and name in metrics[section]]
+    if len(matches) > 1:
+        raise KeyError(f"Metric {name!r} is ambiguous, use one of "
+                       + ", ".join(f"{section}.{name}" for section in matches))
+    if matches:
+        return matches[0], name
+    for section in SECTIONS:
+        key = name[len(section) + 1:]
+        if name.startswith(section + '_') and isinstance(metrics.get(section), dict) and key in metrics[section]:
+            return section, key
+    raise KeyError(f"Unknown metric {name!r}")
+
+
+def _read(metrics: Dict[str, Any], section: str, key: str) -> float:
+    """Numeric value at a snapshot path, NaN when missing or not a number."""
+    values = metrics.get(section)
+    try:
+        return float(values[key])
+    except (TypeError, ValueError, KeyError):
+        return math.nan
+
+
+class RuleEngine:
+    """
+    Evaluates every rule against each sample in a few vectorized passes.
+
+    Rules are compiled once into flat arrays: each comparison reads two
+    slots of a value vector holding the current metrics, window functions
+    over a ring buffer of recent samples, thresholds and constants, and is
+    evaluated for all rules at once with one table lookup on the sign of
+    the difference. Conditions are rewritten as OR-of-AND clauses, so
+    combining comparisons into rule results is two ``reduceat`` calls.
+
+    A rule starts firing once its condition has held for its ``for``
+    duration. While firing, ``hysteresis`` relaxes its thresholds so the
+    value has to move clearly back before the rule resolves, and a firing
+    event is only reported if the rule has not been reported within its
+    ``cooldown``.
+    """
+
+    def __init__(self, rules: Sequence[Rule], thresholds: Optional[Dict[str, float]] = None,
+                 interval: float = 1.0):
+        self.rules = list(rules)
+        self.thresholds = dict(thresholds or {})
+        self.interval = interval
+        self._bound = False
+
+    def _bind(self, metrics: Dict[str, Any]) -> None:
+        """Resolve metric names against the first snapshot and compile the rules."""
+        usable = []
+        for rule in self.rules:
+            try:
+                for name in rule.metrics():
+                    resolve_metric(name, metrics)
+            except KeyError as e:
+                logger.warning(f"Disabling rule {rule.name!r}: {e.args[0]}")
+                continue
+            usable.append(rule)
+        self.rules = usable
+        self._compile(metrics)
+        self._bound = True
+
+    def _compile(self, metrics: Dict[str, Any]) -> None:
+        paths: List[Tuple[str, str]] = []
+        derived: List[Tuple[str, int, Optional[float]]] = []
+        threshold_names: List[str] = []
+        constants: List[float] = []
+        # Operands become (kind, position) here and absolute slots below
+        lhs, rhs, ops, literal_rule = [], [], [], []
+        clause_starts, clause_rule, rule_metric_paths = [], [], []
+
+        def metric_slot(name: str) -> int:
+            path = resolve_metric(name, metrics)
+            if path not in paths:
+                paths.append(path)
+            return paths.index(path)
+
+        def slot(operand: tuple) -> Tuple[str, int]:
+            if operand[0] == 'const':
+                constants.append(operand[1])
+                return 'const', len(constants) - 1
+            if operand[0] == 'metric':
+                return 'metric', metric_slot(operand[1])
+            if operand[0] == 'threshold':
+                if operand[1] not in threshold_names:
+                    threshold_names.append(operand[1])
+                return 'threshold', threshold_names.index(operand[1])
+            key = (operand[1], metric_slot(operand[2]), operand[3])
+            if key not in derived:
+                derived.append(key)
+            return 'derived', derived.index(key)
+
+        for index, rule in enumerate(self.rules):
+            rule_metric_paths.append([resolve_metric(name, metrics) for name in rule.metrics()])
+            for clause in rule.clauses:
+                clause_starts.append(len(ops))
+                clause_rule.append(index)
+                for _, op, left, right in clause:
+                    lhs.append(slot(left))
+                    rhs.append(slot(right))
+                    ops.append(OPERATORS.index(op))
+                    literal_rule.append(index)
+
+        offsets = {'metric': 0, 'derived': len(paths)}
+        offsets['threshold'] = offsets['derived'] + len(derived)
+        offsets['const'] = offsets['threshold'] + len(threshold_names)
+        self.paths = paths
+        self.threshold_names = threshold_names
+        self.values = np.full(offsets['const'] + len(constants), np.nan)
+        self.values[offsets['const']:] = constants
+        self._derived_offset = offsets['derived']
+        self._threshold_offset = offsets['threshold']
+
+        self.lhs = np.array([offsets[kind] + i for kind, i in lhs], dtype=np.int64)
+        self.rhs = np.array([offsets[kind] + i for kind, i in rhs], dtype=np.int64)
+        self.ops = np.array(ops, dtype=np.int64)
+        self.literal_rule = np.array(literal_rule, dtype=np.int64)
+        self.clause_starts = np.array(clause_starts, dtype=np.int64)
+        self.rule_clause_starts = np.searchsorted(np.array(clause_rule, dtype=np.int64),
+                                                  np.arange(len(self.rules)))
+        self.literal_hysteresis = (np.array([self.rules[r].hysteresis for r in literal_rule])
+                                   * HYSTERESIS_DIRECTION[self.ops]) if ops else np.zeros(0)
+        self.rule_metric_paths = rule_metric_paths
+
+        # Window functions grouped by function and window, one pass per group
+        self._groups: Dict[Tuple[str, Optional[float]], Tuple[np.ndarray, np.ndarray]] = {}
+        for i, (function, metric, seconds) in enumerate(derived):
+            slots, columns = self._groups.get((function, seconds), ([], []))
+            slots.append(i)
+            columns.append(metric)
+            self._groups[(function, seconds)] = (slots, columns)
+        self._groups = {key: (np.array(slots) + self._derived_offset, np.array(columns))
+                        for key, (slots, columns) in self._groups.items()}
+
+        # The ring covers the longest window plus the sample just before it
+        longest = max([seconds or 0.0 for _, _, seconds in derived] + [0.0])
+        capacity = int(min(longest / max(self.interval, 0.1), 86400)) + 2
+        self.ring_times = np.full(capacity, -np.inf)
+        self.ring = np.full((capacity, len(paths)), np.nan)
+        self.position = 0
+
+        n = len(self.rules)
+        self.for_seconds = np.array([rule.for_seconds for rule in self.rules])
+        self.cooldowns = np.array([rule.cooldown for rule in self.rules])
+        self.true_since = np.full(n, np.nan)
+        self.firing = np.zeros(n, dtype=bool)
+        self.reported = np.zeros(n, dtype=bool)
+        self.last_reported = np.full(n, -np.inf)
+
+    def _window_functions(self, now: float) -> None:
+        capacity = len(self.ring_times)
+        newest = (self.position - 1) % capacity
+        current = self.ring[newest]
+        for (function, seconds), (slots, columns) in self._groups.items():
+            if seconds is None:
+                # rate() without a window: against the previous sample
+                count = 2 if np.isfinite(self.ring_times[(newest - 1) % capacity]) else 1
+            else:
+                count = int(np.count_nonzero(self.ring_times >= now - seconds))
+            rows = (newest - np.arange(count)) % capacity
+            if function == 'rate':
+                oldest = rows[-1]
+                elapsed = now - self.ring_times[oldest]
+                if elapsed > 0:
+                    self.values[slots] = (current[columns] - self.ring[oldest, columns]) / elapsed
+                else:
+                    self.values[slots] = np.nan
+                continue
+            window = self.ring[rows[:, None], columns]
+            if function == 'avg':
+                self.values[slots] = window.mean(axis=0)
+            elif function == 'min':
+                self.values[slots] = window.min(axis=0)
+            else:
+                self.values[slots] = window.max(axis=0)
+
+    def evaluate(self, metrics: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Check every rule against one SystemMonitor snapshot.
+
+        ``threshold(name)`` operands read ``metrics['thresholds']`` when the
+        snapshot carries adaptive thresholds and the fixed
+        `monitoring.thresholds` otherwise.
+
+        Returns:
+            Events for rules that started firing (outside their cool-down)
+            or resolved, each with the rule ``name``, ``state`` (``firing``
+            or ``resolved``), ``severity``, ``expr``, epoch ``timestamp`` and
+            the ``values`` of the metrics it reads
+        """
+        if not self._bound:
+            self._bind(metrics)
+        if not self.rules:
+            return []
+        now = metrics['timestamp'].timestamp()
+
+        current = np.array([_read(metrics, section, key) for section, key in self.paths])
+        self.ring_times[self.position] = now
+        self.ring[self.position] = current
+        self.position = (self.position + 1) % len(self.ring_times)
+        self.values[:len(current)] = current
+        self._window_functions(now)
+        thresholds = metrics.get('thresholds') or self.thresholds
+        for i, name in enumerate(self.threshold_names):
+            value = thresholds.get(name, self.thresholds.get(name))
+            self.values[self._threshold_offset + i] = math.nan if value is None else value
+
+        # Firing rules compare against thresholds relaxed by their hysteresis
+        difference = (self.values[self.lhs] - self.values[self.rhs]
+                      + self.literal_hysteresis * self.firing[self.literal_rule])
+        sign = np.sign(difference)
+        valid = ~np.isnan(sign)
+        literals = OPERATOR_TABLE[self.ops, np.where(valid, sign, 0).astype(np.int64) + 1] & valid
+        clauses = np.logical_and.reduceat(literals, self.clause_starts)
+        condition = np.logical_or.reduceat(clauses, self.rule_clause_starts)
+
+        self.true_since = np.where(condition, np.where(np.isnan(self.true_since), now, self.true_since), np.nan)
+        held = condition & (now - self.true_since >= self.for_seconds)
+        started = held & ~self.firing
+        resolved = self.firing & ~condition
+        self.firing = (self.firing & condition) | held
+
+        notify = started & (now - self.last_reported >= self.cooldowns)
+        self.last_reported[notify] = now
+        resolved_reported = resolved & self.reported
+        self.reported = (self.reported | notify) & self.firing
+
+        if not (notify.any() or resolved_reported.any()):
+            return []
+        events = []
+        for index, state in [(i, 'firing') for i in np.flatnonzero(notify)] + \
+                            [(i, 'resolved') for i in np.flatnonzero(resolved_reported)]:
+            rule = self.rules[index]
+            events.append({
+                'name': rule.name,
+                'state': state,
+                'severity': rule.severity,
+                'expr': rule.expr,
+                'timestamp': now,
+                'values': {f"{section}.{key}": _read(metrics, section, key)
+                           for section, key in self.rule_metric_paths[index]}
+            })
+        return events
+
+    def firing_rules(self) -> List[Dict[str, Any]]:
+        """Rules currently firing, with the time their condition started to hold."""
+        if not self._bound:
+            return []
+        return [{'name': self.rules[i].name, 'severity': self.rules[i].severity,
+                 'expr': self.rules[i].expr, 'since': float(self.true_since[i])}
+                for i in np.flatnonzero(self.firing)]
+
+
+def rules_from_config(config: Dict[str, Any]) -> Optional[RuleEngine]:
+    """
+    Build a RuleEngine from the `monitoring.rules` config section, or None if disabled.
+
+    Invalid rules are logged and skipped rather than stopping the monitor.
+    """
+    rules_config = config['monitoring'].get('rules') or {}
+    if not rules_config.get('enabled', False):
+        return None
+    defaults = {'hysteresis': rules_config.get('hysteresis', 0.0),
+                'cooldown': rules_config.get('cooldown', 300)}
+    rules = []
+    for entry in rules_config.get('rules') or []:
+        try:
+            rules.append(Rule(**{**defaults, **entry}))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Skipping rule {entry.get('name', entry)!r}: {e}")
+    return RuleEngine(rules, config['monitoring']['thresholds'], config['monitoring'].get('interval', 1))
@@ -20,6 +20,7 @@ class SystemMonitor:
 
         return {
             'cpu_percent': psutil.cpu_percent(interval=1),
+            'per_core': psutil.cpu_percent(percpu=True),  # since the previous sample
             'cpu_temp': "--" if self.is_windows else cpu_temp,
             'cpu_freq': int(psutil.cpu_freq().current) if psutil.cpu_freq() else None,
             'cpu_count_logical': psutil.cpu_count(logical=True),